@@ -0,0 +1,150 @@
+"""
+Box-plot summaries of a metric sheet, computed once and rendered with ax.bxp.
+
+boxplot.py used to hand every raw value per pipeline to ax.boxplot (which sorts
+and scans them again for every figure) and to redo groupby medians and standard
+deviations for the captions. Here one grouped pass gives, for every metric and
+pipeline, the quartiles, matplotlib-style whiskers (furthest values within
+whis x IQR of the box), mean, std, count and a bounded random sample of the
+outliers (always including the most extreme ones, so the axis range is kept).
+Figures are drawn from those summaries, one process per metric.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+def read_metric_sheet(path):
+    """Metric sheet from .xlsx/.xls (pd.read_excel) or .csv / .parquet, which load much faster at scale."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return pd.read_csv(path)
+    if ext == ".parquet":
+        return pd.read_parquet(path)
+    return pd.read_excel(path)
+
+
+def box_summaries(df, metrics, by="pipeline", order=None, whis=1.5, max_fliers=200, seed=0):
+    """
+    Box-plot statistics of every metric per group.
+
+    Quartiles use linear interpolation, and whiskers and outliers follow
+    matplotlib.cbook.boxplot_stats, so ax.bxp draws the same boxes ax.boxplot would.
+
+    Parameters:
+        df (pd.DataFrame): Long sheet with a `by` column and metric columns.
+        metrics (list[str]): Metric columns.
+        by (str): Grouping column.
+        order (list | None): Groups in plotting order (default: sorted); missing groups get empty stats.
+        whis (float): Whisker reach in IQRs.
+        max_fliers (int | None): Outliers kept per box (random sample plus both extremes; None = all).
+        seed (int): Seed for the outlier sample.
+
+    Returns:
+        stats (dict[str, list[dict]]): metric -> one dict per group with keys
+            label, med, q1, q3, whislo, whishi, fliers, mean, std, n (usable by ax.bxp).
+    """
+    groups = df[by]
+    codes, uniques = pd.factorize(groups, sort=True)
+    if order is None:
+        order = list(uniques)
+    values = df[list(metrics)].to_numpy(dtype=float)
+    grouped = pd.DataFrame(values, columns=list(metrics)).groupby(codes)
+
+    # One pass for all metrics: quartiles, moments and counts per group
+    quart = grouped.quantile([0.25, 0.5, 0.75])
+    mean, std, count = grouped.mean(), grouped.std(), grouped.count()
+    q1, med, q3 = (quart.xs(q, level=1) for q in (0.25, 0.5, 0.75))
+    iqr = q3 - q1
+    lo_bound, hi_bound = q1 - whis * iqr, q3 + whis * iqr
+
+    rng = np.random.default_rng(seed)
+    position = {g: i for i, g in enumerate(uniques)}
+    stats = {}
+    for j, metric in enumerate(metrics):
+        x = values[:, j]
+        valid = (codes >= 0) & ~np.isnan(x)
+        xc, cc = x[valid], codes[valid]
+        lo = lo_bound[metric].reindex(range(len(uniques))).to_numpy()[cc]
+        hi = hi_bound[metric].reindex(range(len(uniques))).to_numpy()[cc]
+        inside = (xc >= lo) & (xc <= hi)
+        whislo = pd.Series(xc[inside]).groupby(cc[inside]).min()
+        whishi = pd.Series(xc[inside]).groupby(cc[inside]).max()
+        outside = ~inside
+        flier_groups = pd.Series(np.arange(outside.sum())).groupby(cc[outside]).indices
+        flier_values = xc[outside]
+
+        rows = []
+        for label in order:
+            g = position.get(label)
+            n = int(count[metric].get(g, 0)) if g is not None else 0
+            if n == 0:
+                rows.append({"label": label, "med": np.nan, "q1": np.nan, "q3": np.nan, "whislo": np.nan,
+                             "whishi": np.nan, "fliers": np.array([]), "mean": np.nan, "std": np.nan, "n": 0})
+                continue
+            fl = flier_values[flier_groups[g]] if g in flier_groups else np.array([])
+            if max_fliers is not None and len(fl) > max_fliers:
+                keep = rng.choice(len(fl), max_fliers, replace=False)
+                fl = np.unique(np.concatenate([fl[keep], [fl.min(), fl.max()]]))
+            g_q1, g_q3 = q1.at[g, metric], q3.at[g, metric]
+            rows.append({
+                "label": label,
+                "med": med.at[g, metric], "q1": g_q1, "q3": g_q3,
+                # Like cbook.boxplot_stats, whiskers never end inside the box: with no value
+                # within reach, or the nearest one past the quartile (ties), they stop at it
+                "whislo": min(whislo.get(g, g_q1), g_q1), "whishi": max(whishi.get(g, g_q3), g_q3),
+                "fliers": fl, "mean": mean.at[g, metric], "std": std.at[g, metric], "n": n,
+            })
+        stats[metric] = rows
+    return stats
+
+
+def render_boxplot(job):
+    """
+    Draws one metric's boxes from its summaries and saves the figure.
+
+    Parameters:
+        job (dict): 'stats' (rows from box_summaries), 'out_path', 'title', 'ylabel', 'xlabel',
+                    'colors' (one per box), 'legend' ([(label, color)]), 'rc' (matplotlib rcParams),
+                    'dpi', 'flierprops'.
+
+    Returns:
+        out_path (str): Saved file.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib.lines import Line2D
+
+    matplotlib.rcParams.update(job.get("rc", {}))
+    fig, ax = plt.subplots(figsize=job.get("figsize", (8, 6)))
+    box = ax.bxp(job["stats"], patch_artist=True, widths=0.7, showfliers=True,
+                 flierprops=job.get("flierprops"))
+    for patch, color in zip(box["boxes"], job["colors"]):
+        patch.set_facecolor(color)
+        patch.set_alpha(0.7)
+
+    ax.set_title(job["title"], fontsize=16, pad=20)
+    ax.set_xlabel(job.get("xlabel", "Pipeline"), fontsize=14)
+    ax.set_ylabel(job["ylabel"], fontsize=14)
+    ax.yaxis.grid(True, linestyle="--", alpha=0.4)
+    ax.xaxis.grid(False)
+    handles = [Line2D([0], [0], color=color, lw=6, label=label) for label, color in job.get("legend", [])]
+    if handles:
+        ax.legend(handles=handles, loc="upper left", bbox_to_anchor=(1.02, 1), frameon=False)
+
+    plt.tight_layout()
+    plt.savefig(job["out_path"], dpi=job.get("dpi", 300), bbox_inches="tight")
+    plt.close(fig)
+    return job["out_path"]
+
+
+def render_all(jobs, processes=None):
+    """Renders every job (see render_boxplot), in parallel processes unless processes == 1."""
+    processes = processes or min(len(jobs), os.cpu_count() or 1)
+    if processes <= 1 or len(jobs) <= 1:
+        return [render_boxplot(job) for job in jobs]
+    with ProcessPoolExecutor(processes) as pool:
+        return list(pool.map(render_boxplot, jobs))
@@ -1,14 +1,24 @@
 import pandas as pd
-import numpy as np
-from scipy.stats import friedmanchisquare, wilcoxon
-from statsmodels.stats.multitest import multipletests
-from itertools import combinations
 import matplotlib.pyplot as plt
+import argparse
 import os
 
+from stats_engine import dedupe_sheet, friedman_all_metrics
+from resampling import effect_size_table
+
+parser = argparse.ArgumentParser(description="Friedman + post-hoc Wilcoxon for every metric.")
+parser.add_argument("--duplicates", default=None,
+                    help="duplicates CSV from batch_runner.py --dedupe (must exist; default: ../data/duplicates.csv if present)")
+parser.add_argument("--no-dedupe", action="store_true", help="Count every burst frame")
+args = parser.parse_args()
+
 # --- Load data ---
 df = pd.read_excel("../Pipeline_Images/metric_tests/mastermetrictests.xlsx")
 
+# --- Count each near-duplicate burst once (see src/phash_index.py) ---
+if not args.no_dedupe:
+    df = dedupe_sheet(df, args.duplicates)
+
 # --- Metrics to analyze (exclude sharpness) ---
 metrics = [c for c in df.columns if c not in ["image_name", "pipeline", "sharpness"]]
 
@@ -16,54 +26,11 @@ metrics = [c for c in df.columns if c not in ["image_name", "pipeline", "sharpne
 out_dir = "../Pipeline_Images"
 os.makedirs(out_dir, exist_ok=True)
 
-summary_rows = []
-posthoc_results = {}
-
-for metric in metrics:
-    print(f"Running Friedman test for {metric}...")
-
-    # pivot to wide
-    wide = df.pivot(index="image_name", columns="pipeline", values=metric).dropna()
-    k = wide.shape[1]
-    n = wide.shape[0]
-
-    if k < 3:
-        print(f"Skipping {metric}: not enough pipelines")
-        continue
-
-    # Friedman test
-    stat, p = friedmanchisquare(*[wide[col] for col in wide.columns])
-    dfree = k - 1
-    kendalls_w = stat / (n * k * (k - 1))
-
-    # Post-hoc Wilcoxon
-    pairs = list(combinations(wide.columns, 2))
-    pvals = []
-    for a, b in pairs:
-        res = wilcoxon(wide[a], wide[b])
-        pvals.append(res.pvalue)
-
-    reject, pvals_adj, _, _ = multipletests(pvals, method="holm")
-    posthoc = pd.DataFrame({
-        "comparison": [f"{a} vs {b}" for a,b in pairs],
-        "p_raw": pvals,
-        "p_holm": pvals_adj,
-        "significant": reject
-    }).sort_values("p_holm")
-
-    posthoc_results[metric] = posthoc
-
-    # Add to summary
-    summary_rows.append({
-        "metric": metric,
-        "friedman_chi2": stat,
-        "df": dfree,
-        "p_value": p,
-        "kendalls_w": kendalls_w,
-        "n_images": n,
-        "k_pipelines": k
-    })
+# --- Friedman + post-hoc Wilcoxon for all metrics at once (see stats_engine.py) ---
+print(f"Running Friedman tests for {len(metrics)} metrics...")
+summary, posthoc_results = friedman_all_metrics(df, metrics)
 
+for metric in posthoc_results:
     # Plot
     plt.figure(figsize=(8,6))
     df.boxplot(column=metric, by="pipeline", grid=False)
@@ -73,12 +40,19 @@ for metric in metrics:
     plt.savefig(os.path.join(out_dir, f"{metric}.png"), dpi=300, bbox_inches="tight")
     plt.close()
 
+# --- Effect sizes vs baseline p0 with bootstrap CIs + permutation p-values (see resampling.py) ---
+effects = None
+if "p0" in set(df["pipeline"].astype(str)):
+    print("Bootstrapping effect sizes vs p0...")
+    effects = effect_size_table(df, list(posthoc_results), baseline="p0")
+
 # --- Save all results into one Excel ---
-summary = pd.DataFrame(summary_rows)
 excel_path = os.path.join(out_dir, "friedman_all_metrics.xlsx")
 
 with pd.ExcelWriter(excel_path) as writer:
     summary.to_excel(writer, sheet_name="summary", index=False)
+    if effects is not None:
+        effects.to_excel(writer, sheet_name="ci_vs_p0", index=False)
     for metric, posthoc in posthoc_results.items():
         posthoc.to_excel(writer, sheet_name=f"posthoc_{metric}", index=False)
 
@@ -4,10 +4,25 @@ from scipy.stats import friedmanchisquare, wilcoxon
 from statsmodels.stats.multitest import multipletests
 from itertools import combinations
 import matplotlib.pyplot as plt
+import argparse
+import os
+
+from resampling import effect_size_table
+from stats_engine import dedupe_sheet
+
+parser = argparse.ArgumentParser(description="Friedman test on relative sharpness.")
+parser.add_argument("--duplicates", default=None,
+                    help="duplicates CSV from batch_runner.py --dedupe (must exist; default: ../data/duplicates.csv if present)")
+parser.add_argument("--no-dedupe", action="store_true", help="Count every burst frame")
+args = parser.parse_args()
 
 # --- Load data ---
 df = pd.read_excel("../Pipeline_Images/metric_tests/mastermetrictests.xlsx")
 
+# --- Count each near-duplicate burst once (see src/phash_index.py) ---
+if not args.no_dedupe:
+    df = dedupe_sheet(df, args.duplicates)
+
 # --- Step 1: Calculate relative sharpness ---
 # Define pixel count for each pipeline (p0 = raw ≈ 2400x4600, others = 600x600)
 PIXELS = {
@@ -57,14 +72,21 @@ summary = pd.DataFrame([{
     "k_pipelines": k
 }])
 
-# --- Step 5: Save results ---
+# --- Step 5: Effect size vs p0 with bootstrap CI + permutation p-value ---
+effects = None
+if "p0" in set(df["pipeline"].astype(str)):
+    effects = effect_size_table(df, ["rel_sharpness"], baseline="p0")
+
+# --- Step 6: Save results ---
 with pd.ExcelWriter("friedman_test_sharpness.xlsx") as writer:
     summary.to_excel(writer, sheet_name="summary", index=False)
     posthoc.to_excel(writer, sheet_name="posthoc", index=False)
+    if effects is not None:
+        effects.to_excel(writer, sheet_name="ci_vs_p0", index=False)
 
-print("Saved friedman_test_sharpness.xlsx with summary + posthoc results.")
+print("Saved friedman_test_sharpness.xlsx with summary + posthoc" + (" + ci_vs_p0" if effects is not None else "") + " results.")
 
-# --- Step 6: Plot boxplot ---
+# --- Step 7: Plot boxplot ---
 plt.figure(figsize=(8,6))
 df.boxplot(column="rel_sharpness", by="pipeline", grid=False)
 plt.title("Relative Sharpness by Pipeline")
@@ -0,0 +1,218 @@
+"""
+Bootstrap confidence intervals and permutation p-values for every pipeline
+versus the baseline (p0) on every metric.
+
+Replicates are drawn as batched arrays: bootstrap resamples as (chunk, n_images)
+index arrays (turned into per-image weights), permutations as (chunk, n_images)
+sign flips of the paired differences. Each chunk is evaluated for all pipelines
+and metrics at once, chunks are sized to stay under a memory budget, and they
+can be spread across processes. Every chunk gets its own seed from one
+SeedSequence, so results do not depend on the number of processes.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from stats_engine import metric_cube
+
+STATISTICS = ("mean", "median", "dz")
+
+# Per-process copy of the differences, set once per worker by _init_worker
+_DIFFS = None
+
+
+def paired_differences(cube, pipelines, baseline="p0"):
+    """
+    Per-image differences of every pipeline against the baseline.
+
+    Parameters:
+        cube (np.ndarray): (n_images, k_pipelines, n_metrics) from stats_engine.metric_cube.
+        pipelines (list[str]): Pipelines along axis 1 of the cube.
+        baseline (str): Pipeline to compare against.
+
+    Returns:
+        diffs (np.ndarray): (n_images, k_pipelines - 1, n_metrics), pipeline - baseline (NaN if either missing).
+        others (list[str]): Pipelines along axis 1 of diffs.
+    """
+    if baseline not in pipelines:
+        raise ValueError(f"Baseline {baseline!r} not in pipelines {pipelines}")
+    b = pipelines.index(baseline)
+    others = [p for p in pipelines if p != baseline]
+    idx = [pipelines.index(p) for p in others]
+    return cube[:, idx, :] - cube[:, b:b + 1, :], others
+
+
+def _statistic(diffs, statistic, weights=None, idx=None):
+    """
+    Statistic of each column of diffs (n, C), once per replicate.
+
+    Mean and d_z are computed from weights (R, n): resample counts for bootstrap
+    replicates, +/-1 sign flips for permutation replicates, all ones for the
+    observed value. The median needs the resampled values themselves, so
+    bootstrap replicates pass idx (R, n) instead. Missing differences are ignored.
+    """
+    if statistic == "median":
+        x = diffs[idx] if idx is not None else diffs[None] * weights[..., None]
+        with np.errstate(invalid="ignore"):
+            return np.nanmedian(x, axis=1)
+
+    valid = np.isfinite(diffs)
+    d = np.where(valid, diffs, 0.0)
+    counts = np.abs(weights) @ valid
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = (weights @ d) / counts
+        if statistic == "mean":
+            return mean
+        var = (np.abs(weights) @ (d * d) - counts * mean ** 2) / (counts - 1)
+        return mean / np.sqrt(var)
+
+
+def _init_worker(diffs):
+    global _DIFFS
+    _DIFFS = diffs
+
+
+def _run_chunk(task):
+    kind, seed, size, statistic = task
+    rng = np.random.default_rng(seed)
+    n = _DIFFS.shape[0]
+    if kind == "permutation":
+        signs = rng.choice(np.array([-1.0, 1.0]), size=(size, n))
+        return _statistic(_DIFFS, statistic, weights=signs)
+
+    idx = rng.integers(0, n, size=(size, n))
+    if statistic == "median":
+        return _statistic(_DIFFS, statistic, idx=idx)
+    # Index arrays -> per-image resample counts, one row per replicate
+    counts = np.zeros((size, n))
+    np.add.at(counts, (np.arange(size)[:, None], idx), 1.0)
+    return _statistic(_DIFFS, statistic, weights=counts)
+
+
+def _replicate_bytes(kind, n, n_cols, statistic):
+    """
+    Peak bytes _run_chunk allocates per replicate, for n images and n_cols columns
+    (measured with tracemalloc; the per-chunk copies of the differences come on top).
+    """
+    if statistic == "median":
+        # Resample indices or signs, then the (n, n_cols) float64 values. nanmedian works on
+        # a masked copy for axes shorter than 600 and on a partitioned copy otherwise.
+        return 16 * n + n * n_cols * (36 if n < 600 else 9)
+    if kind == "bootstrap":
+        # int64 indices, float64 resample counts and np.abs(counts) in _statistic
+        weights = 24 * n
+    else:
+        # rng.choice's int64 picks become the float64 signs, then np.abs(signs)
+        weights = 16 * n
+    # About six (n_cols,) float64 temporaries for the mean and variance
+    return weights + 6 * 8 * n_cols
+
+
+def _chunk_size(kind, n, n_cols, statistic, max_chunk_mb):
+    """Replicates per chunk so one chunk's working arrays stay under max_chunk_mb."""
+    per_replicate = _replicate_bytes(kind, n, n_cols, statistic)
+    # _statistic's zero-filled, validity and squared copies of the (n, n_cols) differences
+    per_chunk = 0 if statistic == "median" else 24 * n * n_cols
+    return max(1, int((max_chunk_mb * 1024 ** 2 - per_chunk) // per_replicate))
+
+
+def resample(diffs, kind, n_replicates, statistic="mean", seed=0, n_jobs=1, max_chunk_mb=256):
+    """
+    Bootstrap or sign-flip permutation replicates of `statistic` for every column.
+
+    Parameters:
+        diffs (np.ndarray): (n_images, ...) paired differences; trailing axes are flattened.
+        kind (str): 'bootstrap' or 'permutation'.
+        n_replicates (int): Number of replicates.
+        statistic (str): 'mean' (mean difference), 'median' (median difference) or
+                         'dz' (mean / sd of the differences, Cohen's d_z).
+        seed (int | np.random.SeedSequence): Seed the per-chunk seeds are spawned from.
+        n_jobs (int): Processes to spread chunks across (1 = in this process, -1 = all CPUs).
+        max_chunk_mb (float): Memory budget for one chunk's working arrays.
+
+    Returns:
+        replicates (np.ndarray): (n_replicates, *diffs.shape[1:]).
+    """
+    if kind not in ("bootstrap", "permutation"):
+        raise ValueError(f"kind must be 'bootstrap' or 'permutation', got {kind!r}")
+    if statistic not in STATISTICS:
+        raise ValueError(f"statistic must be one of {STATISTICS}, got {statistic!r}")
+
+    shape = diffs.shape
+    flat = diffs.reshape(shape[0], -1)
+    size = _chunk_size(kind, shape[0], flat.shape[1], statistic, max_chunk_mb)
+    sizes = [min(size, n_replicates - i) for i in range(0, n_replicates, size)]
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    seeds = seed.spawn(len(sizes))
+    tasks = [(kind, s, n, statistic) for s, n in zip(seeds, sizes)]
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(flat,)) as pool:
+            chunks = list(pool.map(_run_chunk, tasks))
+    else:
+        _init_worker(flat)
+        chunks = [_run_chunk(t) for t in tasks]
+    return np.concatenate(chunks).reshape((n_replicates,) + shape[1:])
+
+
+def effect_size_table(df, metrics, baseline="p0", statistic="mean", n_boot=2000, n_perm=2000,
+                      confidence=0.95, seed=0, n_jobs=1, max_chunk_mb=256):
+    """
+    Effect size of every pipeline versus the baseline on every metric, with a
+    percentile bootstrap CI and a two-sided sign-flip permutation p-value.
+
+    Parameters:
+        df (pd.DataFrame): Long metric sheet (image_name, pipeline, metric columns).
+        metrics (list[str]): Metric columns.
+        baseline (str): Reference pipeline (default 'p0').
+        statistic (str): 'mean', 'median' or 'dz' of the paired differences (pipeline - baseline).
+        n_boot, n_perm (int): Bootstrap / permutation replicates (0 skips that part).
+        confidence (float): CI coverage.
+        seed (int): Random seed (bootstrap and permutation use independent streams).
+        n_jobs (int): Processes for resampling.
+        max_chunk_mb (float): Memory budget per chunk of replicates.
+
+    Returns:
+        table (pd.DataFrame): metric, pipeline, baseline, statistic, n_images, effect,
+                              ci_low, ci_high, p_perm; one row per (metric, pipeline).
+    """
+    cube, _, pipelines = metric_cube(df, metrics)
+    diffs, others = paired_differences(cube, pipelines, baseline)
+    n_images = np.isfinite(diffs).sum(axis=0)
+    flat = diffs.reshape(diffs.shape[0], -1)
+    observed = _statistic(flat, statistic, weights=np.ones((1, flat.shape[0]))).reshape(diffs.shape[1:])
+
+    boot_seed, perm_seed = np.random.SeedSequence(seed).spawn(2)
+    ci_low = ci_high = p_perm = np.full(observed.shape, np.nan)
+    if n_boot:
+        boot = resample(diffs, "bootstrap", n_boot, statistic, boot_seed, n_jobs, max_chunk_mb)
+        tail = (1 - confidence) / 2 * 100
+        ci_low, ci_high = np.nanpercentile(boot, [tail, 100 - tail], axis=0)
+    if n_perm:
+        perm = resample(diffs, "permutation", n_perm, statistic, perm_seed, n_jobs, max_chunk_mb)
+        exceed = (np.abs(perm) >= np.abs(observed) - 1e-12).sum(axis=0)
+        p_perm = (exceed + 1) / (n_perm + 1)
+    # No effect to test (no paired values, or dz of constant differences): no CI, no p-value
+    undefined = ~np.isfinite(observed) | (n_images == 0)
+    ci_low, ci_high, p_perm = (np.where(undefined, np.nan, x) for x in (ci_low, ci_high, p_perm))
+
+    rows = []
+    for j, metric in enumerate(metrics):
+        for i, pipeline in enumerate(others):
+            rows.append({
+                "metric": metric,
+                "pipeline": pipeline,
+                "baseline": baseline,
+                "statistic": statistic,
+                "n_images": int(n_images[i, j]),
+                "effect": observed[i, j],
+                "ci_low": ci_low[i, j],
+                "ci_high": ci_high[i, j],
+                "p_perm": p_perm[i, j],
+            })
+    return pd.DataFrame(rows)
@@ -0,0 +1,286 @@
+"""
+Vectorised Friedman + pairwise Wilcoxon (Holm) engine for all metrics at once.
+
+friedman_all.py used to pivot the sheet once per metric and call scipy for every
+pipeline pair. Here the sheet is pivoted once into an (images, pipelines, metrics)
+cube, ranks are computed for every metric in one NumPy pass, and the Wilcoxon
+signed-rank tests for all pairs x metrics are computed together.
+
+Results match scipy.stats.friedmanchisquare, scipy.stats.wilcoxon (default
+zero_method='wilcox', no continuity correction) and statsmodels' Holm correction.
+Wilcoxon uses the normal approximation, which is what scipy picks for more than
+50 images; smaller samples fall back to scipy so its exact p-values are kept.
+"""
+import os
+import re
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+from scipy.stats import chi2, norm, wilcoxon
+
+# Below this many non-missing images scipy uses exact Wilcoxon p-values
+EXACT_WILCOXON_MAX_N = 50
+
+# Where batch_runner.py --dedupe writes the duplicates CSV, seen from analysis/
+DUPLICATES_PATH = "../data/duplicates.csv"
+
+
+def _frame_stem(name):
+    """'T0018_BL (2)_processed_pipelinetest7.JPG' -> 'T0018_BL (2)'."""
+    stem = os.path.splitext(os.path.basename(str(name)))[0]
+    return re.sub(r"_processed_pip(?:e)?linetest\d+$", "", stem)
+
+
+def drop_duplicate_frames(df, duplicates_path):
+    """
+    Drops near-duplicate burst frames so each cluster counts once in the statistics.
+
+    Parameters:
+        df (pd.DataFrame): Metric sheet with an image_name column.
+        duplicates_path (str): duplicates.csv written by src/phash_index.py (image_name -> representative).
+
+    Returns:
+        df (pd.DataFrame): Rows of representative (and unclustered) images only.
+    """
+    linked = {_frame_stem(n) for n in pd.read_csv(duplicates_path)["image_name"]}
+    keep = ~df["image_name"].map(_frame_stem).isin(linked)
+    print(f"Dropped {int((~keep).sum())} rows of near-duplicate frames ({len(linked)} frames linked)")
+    return df[keep]
+
+
+def dedupe_sheet(df, duplicates_path=None):
+    """
+    drop_duplicate_frames with the duplicates CSV of a --dedupe run.
+
+    Parameters:
+        df (pd.DataFrame): Metric sheet with an image_name column.
+        duplicates_path (str | None): Explicit duplicates CSV, which must exist; None uses
+                                      DUPLICATES_PATH if present and keeps every frame otherwise.
+
+    Returns:
+        df (pd.DataFrame): The sheet without near-duplicate frames.
+
+    Raises:
+        FileNotFoundError: If duplicates_path is given but missing.
+    """
+    if duplicates_path is not None:
+        if not os.path.exists(duplicates_path):
+            raise FileNotFoundError(f"Dedupe requested but {duplicates_path} does not exist "
+                                    f"(written by src/batch_runner.py --dedupe)")
+        return drop_duplicate_frames(df, duplicates_path)
+    if os.path.exists(DUPLICATES_PATH):
+        print(f"Using {DUPLICATES_PATH}")
+        return drop_duplicate_frames(df, DUPLICATES_PATH)
+    print(f"No {DUPLICATES_PATH}: every burst frame is counted (run src/batch_runner.py --dedupe to write it)")
+    return df
+
+
+def metric_cube(df, metrics, pipelines=None):
+    """
+    Pivots a long metric sheet (image_name, pipeline, metric columns) into a cube.
+
+    Parameters:
+        df (pd.DataFrame): One row per (image_name, pipeline).
+        metrics (list[str]): Metric columns to include.
+        pipelines (list[str] | None): Pipeline order; default is sorted like df.pivot.
+
+    Returns:
+        cube (np.ndarray): float array of shape (n_images, k_pipelines, n_metrics), NaN if missing.
+        images (pd.Index): Image names along axis 0.
+        pipelines (list[str]): Pipelines along axis 1.
+    """
+    wide = df.set_index(["image_name", "pipeline"])[list(metrics)].unstack("pipeline")
+    if pipelines is None:
+        pipelines = sorted(wide.columns.get_level_values("pipeline").unique())
+    cols = pd.MultiIndex.from_product([list(metrics), list(pipelines)])
+    wide = wide.reindex(columns=cols)
+    values = wide.to_numpy(dtype=float).reshape(len(wide), len(metrics), len(pipelines))
+    return values.transpose(0, 2, 1), wide.index, list(pipelines)
+
+
+def average_ranks(x, axis=0):
+    """
+    Average ranks (ties share the mean rank, like scipy.stats.rankdata) along one axis.
+
+    Non-finite entries sort last and must be masked out by the caller.
+
+    Returns:
+        ranks (np.ndarray): Same shape as x.
+        tie_sizes (np.ndarray): Size of the tie group each element belongs to.
+    """
+    x = np.moveaxis(np.asarray(x, dtype=float), axis, 0)
+    shape = x.shape
+    x = np.where(np.isfinite(x), x, np.inf).reshape(shape[0], -1)
+    n = x.shape[0]
+
+    order = np.argsort(x, axis=0, kind="mergesort")
+    xs = np.take_along_axis(x, order, axis=0)
+    pos = np.arange(n)[:, None]
+
+    starts_group = np.ones(xs.shape, dtype=bool)
+    starts_group[1:] = xs[1:] != xs[:-1]
+    ends_group = np.ones(xs.shape, dtype=bool)
+    ends_group[:-1] = starts_group[1:]
+
+    start = np.maximum.accumulate(np.where(starts_group, pos, 0), axis=0)
+    end = np.minimum.accumulate(np.where(ends_group, pos, n - 1)[::-1], axis=0)[::-1]
+
+    ranks = np.empty_like(xs)
+    tie_sizes = np.empty_like(xs)
+    np.put_along_axis(ranks, order, (start + end) / 2.0 + 1.0, axis=0)
+    np.put_along_axis(tie_sizes, order, (end - start + 1).astype(float), axis=0)
+    return (np.moveaxis(ranks.reshape(shape), 0, axis),
+            np.moveaxis(tie_sizes.reshape(shape), 0, axis))
+
+
+def friedman_batch(cube):
+    """
+    Friedman chi-square, p-value and Kendall's W for every metric of a cube.
+
+    Each metric uses only the images that have a value for every pipeline
+    (the same as pivot(...).dropna() per metric).
+
+    Returns:
+        result (dict[str, np.ndarray]): 'friedman_chi2', 'p_value', 'kendalls_w', 'n_images',
+                                        one entry per metric.
+    """
+    n_images, k, n_metrics = cube.shape
+    complete = np.isfinite(cube).all(axis=1)                       # (n, m)
+    n = complete.sum(axis=0).astype(float)                         # (m,)
+
+    ranks, ties = average_ranks(cube, axis=1)                      # (n, k, m)
+    ranks = np.where(complete[:, None, :], ranks, 0.0)
+    rank_sums = ranks.sum(axis=0)                                  # (k, m)
+    ssbn = (rank_sums ** 2).sum(axis=0)                            # (m,)
+
+    # Tie correction: sum over tie groups of (t^3 - t) == sum over elements of (t^2 - 1)
+    tie_term = np.where(complete[:, None, :], ties ** 2 - 1.0, 0.0).sum(axis=(0, 1))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        c = 1.0 - tie_term / (k * (k * k - 1.0) * n)
+        stat = (12.0 / (n * k * (k + 1.0)) * ssbn - 3.0 * n * (k + 1.0)) / c
+        kendalls_w = stat / (n * k * (k - 1.0))
+    return {
+        "friedman_chi2": stat,
+        "p_value": chi2.sf(stat, k - 1),
+        "kendalls_w": kendalls_w,
+        "n_images": n.astype(int),
+    }
+
+
+def wilcoxon_pairs_batch(cube, pairs):
+    """
+    Two-sided Wilcoxon signed-rank p-values for every (pair, metric), normal approximation.
+
+    Matches scipy.stats.wilcoxon(a, b) with its defaults when more than 50 images
+    are compared: zero differences dropped, tie-corrected variance, no continuity
+    correction. Rows missing any pipeline for a metric are excluded, as in the
+    per-metric dropna().
+
+    Parameters:
+        cube (np.ndarray): (n_images, k_pipelines, n_metrics).
+        pairs (list[tuple[int, int]]): Pipeline index pairs to compare.
+
+    Returns:
+        pvals (np.ndarray): (n_pairs, n_metrics) p-values (NaN where every difference is zero).
+    """
+    complete = np.isfinite(cube).all(axis=1)                       # (n, m)
+    ia = np.array([a for a, _ in pairs])
+    ib = np.array([b for _, b in pairs])
+    d = cube[:, ia, :] - cube[:, ib, :]                            # (n, P, m)
+    valid = complete[:, None, :] & (d != 0)
+
+    absd = np.where(valid, np.abs(d), np.inf)
+    ranks, ties = average_ranks(absd, axis=0)
+
+    count = valid.sum(axis=0).astype(float)                        # (P, m)
+    r_plus = np.where(valid & (d > 0), ranks, 0.0).sum(axis=0)
+    r_minus = np.where(valid & (d < 0), ranks, 0.0).sum(axis=0)
+    T = np.minimum(r_plus, r_minus)
+
+    mn = count * (count + 1.0) * 0.25
+    se = count * (count + 1.0) * (2.0 * count + 1.0)
+    se -= 0.5 * np.where(valid, ties ** 2 - 1.0, 0.0).sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = (T - mn) / np.sqrt(se / 24.0)
+    pvals = 2.0 * norm.sf(np.abs(z))
+    pvals[count == 0] = np.nan
+    return pvals
+
+
+def holm(pvals, alpha=0.05):
+    """
+    Holm step-down correction along axis 0 (one column per family of tests).
+
+    Same as statsmodels.stats.multitest.multipletests(p, method='holm') per column.
+
+    Returns:
+        reject (np.ndarray[bool]), p_adjusted (np.ndarray): Same shape as pvals.
+    """
+    pvals = np.asarray(pvals, dtype=float)
+    n_tests = pvals.shape[0]
+    order = np.argsort(pvals, axis=0, kind="mergesort")
+    p_sorted = np.take_along_axis(pvals, order, axis=0)
+    factors = np.arange(n_tests, 0, -1).reshape((-1,) + (1,) * (pvals.ndim - 1))
+    adj_sorted = np.minimum(np.maximum.accumulate(p_sorted * factors, axis=0), 1.0)
+    p_adj = np.empty_like(adj_sorted)
+    np.put_along_axis(p_adj, order, adj_sorted, axis=0)
+    return p_adj <= alpha, p_adj
+
+
+def friedman_all_metrics(df, metrics, alpha=0.05):
+    """
+    Friedman + Holm-corrected pairwise Wilcoxon for every metric, in batch.
+
+    Produces the same tables friedman_all.py writes: one summary row per metric and
+    one post-hoc table per metric (sorted by p_holm). Metrics with fewer than 3
+    pipelines or no complete images are skipped.
+
+    Returns:
+        summary (pd.DataFrame): metric, friedman_chi2, df, p_value, kendalls_w, n_images, k_pipelines.
+        posthoc (dict[str, pd.DataFrame]): comparison, p_raw, p_holm, significant per metric.
+    """
+    cube, _, pipelines = metric_cube(df, metrics)
+    k = len(pipelines)
+    if k < 3:
+        print(f"Skipping all metrics: not enough pipelines ({k})")
+        return pd.DataFrame(), {}
+
+    fr = friedman_batch(cube)
+    pairs = list(combinations(range(k), 2))
+    labels = [f"{pipelines[a]} vs {pipelines[b]}" for a, b in pairs]
+    pvals = wilcoxon_pairs_batch(cube, pairs)
+
+    # Small samples: scipy's exact distribution, so results stay identical to before
+    complete = np.isfinite(cube).all(axis=1)
+    for j in np.nonzero(fr["n_images"] <= EXACT_WILCOXON_MAX_N)[0]:
+        rows = cube[complete[:, j], :, j]
+        for p, (a, b) in enumerate(pairs):
+            try:
+                pvals[p, j] = wilcoxon(rows[:, a], rows[:, b]).pvalue
+            except ValueError:
+                pvals[p, j] = np.nan
+
+    summary_rows, posthoc = [], {}
+    for j, metric in enumerate(metrics):
+        if fr["n_images"][j] == 0:
+            print(f"Skipping {metric}: no image has a value for every pipeline")
+            continue
+        reject, p_adj = holm(pvals[:, j], alpha)
+        posthoc[metric] = pd.DataFrame({
+            "comparison": labels,
+            "p_raw": pvals[:, j],
+            "p_holm": p_adj,
+            "significant": reject,
+        }).sort_values("p_holm")
+        summary_rows.append({
+            "metric": metric,
+            "friedman_chi2": fr["friedman_chi2"][j],
+            "df": k - 1,
+            "p_value": fr["p_value"][j],
+            "kendalls_w": fr["kendalls_w"][j],
+            "n_images": int(fr["n_images"][j]),
+            "k_pipelines": k,
+        })
+    return pd.DataFrame(summary_rows), posthoc
@@ -0,0 +1,283 @@
+"""
+Autotuner: quality versus throughput for the p0-p13 pipelines and their stage parameters.
+
+Every candidate (a pipeline plus one setting of the parameters of the stages it
+uses) is run on the same sample images. For each candidate the CPU time per
+image and the mean output metrics (batch_post.frame_metrics) are
+recorded. The script prints the Pareto front of images/sec versus the target
+metrics and recommends the fastest candidate that meets every target within
+the CPU budget. A recommendation needs at least one --targets entry, and
+pipelines that run no stages (p0 returns its input) are never recommended:
+
+    python benchmarks/autotune.py --images data/raw_images --n-images 8 \\
+        --targets "laplacian_var>=150,histogram_entropy>=6.5" --cpus 4 --output tune.json
+
+Throughput is projected from CPU seconds per image, measured with OpenCV
+limited to --threads threads: a budget of N CPUs runs N single-threaded
+workers (as batch_runner/shards do), so images/sec = N / cpu_s_per_image.
+"""
+import argparse
+import itertools
+import json
+import operator
+import os
+import sys
+import time
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import cv2
+import numpy as np
+
+from bench_pipelines import load_frames, machine_info, parse_sizes
+
+from batch_post import frame_metrics
+from pipelines import PIPELINES, STAGES, run_pipeline, stages_used
+
+# Stage parameters to sweep when --grid is 'default'. The values the stages
+# default to are included so the untuned pipelines are always candidates.
+DEFAULT_GRID = {
+    "homomorphic_filter_color": {"cutoff": [15.0, 30.0, 60.0]},
+    "clahe_preserve_color": {"clipLimit": [1.5, 2.0, 3.0]},
+    "gaussian_denoise": {"kernel_size": [(3, 3), (5, 5), (7, 7)]},
+    "wavelet_denoise_lab_cv": {"wavelet_levels": [1, 2]},
+    "tophat_extract_l_channel": {"kernel_size": [(5, 5), (15, 15)]},
+    # None = the notebook's fixed 0.2 downscale, otherwise resolution-adaptive detection
+    "hough_crop_eye": {"target_pixels": [None, 480 * 920]},
+}
+
+METRICS = ("mean_brightness", "rms_contrast", "laplacian_var", "histogram_entropy")
+
+_OPS = {">=": operator.ge, "<=": operator.le}
+
+
+def parse_value(text):
+    """'5x5' -> (5, 5), '2' -> 2, '1.5' -> 1.5, 'none' -> None, anything else stays a string."""
+    text = text.strip()
+    if text.lower() == "none":
+        return None
+    if "x" in text and all(p.isdigit() for p in text.split("x")):
+        return tuple(int(p) for p in text.split("x"))
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def parse_grid(text):
+    """
+    'default', 'none' or 'stage.param=v1,v2;stage.param=v1,v2' -> {stage: {param: [values]}}.
+    """
+    if text == "default":
+        return DEFAULT_GRID
+    grid = {}
+    if text == "none":
+        return grid
+    for item in filter(None, (p.strip() for p in text.split(";"))):
+        key, values = item.split("=")
+        stage_name, param = key.strip().split(".")
+        if stage_name not in STAGES:
+            raise ValueError(f"Unknown stage {stage_name!r} in grid, expected one of {list(STAGES)}")
+        grid.setdefault(stage_name, {})[param] = [parse_value(v) for v in values.split(",")]
+    return grid
+
+
+def parse_targets(text):
+    """'laplacian_var>=150,histogram_entropy>=6.5' -> [(metric, op, value), ...]."""
+    targets = []
+    for item in filter(None, (p.strip() for p in text.split(","))):
+        for op in _OPS:
+            if op in item:
+                metric, value = item.split(op)
+                metric = metric.strip()
+                if metric not in METRICS:
+                    raise ValueError(f"Unknown metric {metric!r}, expected one of {list(METRICS)}")
+                targets.append((metric, op, float(value)))
+                break
+        else:
+            raise ValueError(f"Target {item!r} must look like 'metric>=value' or 'metric<=value'")
+    return targets
+
+
+def candidates(pipelines, grid, probe):
+    """
+    Every (pipeline, params) combination to try.
+
+    Returns:
+        configs (list[tuple[str, dict]]): params is {stage: {param: value}}, only for
+                                          stages that pipeline uses.
+    """
+    configs = []
+    for pipeline in pipelines:
+        axes = [(s, p, values) for s in stages_used(pipeline, probe) if s in grid
+                for p, values in grid[s].items()]
+        for combo in itertools.product(*(values for _, _, values in axes)):
+            params = {}
+            for (stage_name, param, _), value in zip(axes, combo):
+                params.setdefault(stage_name, {})[param] = value
+            configs.append((pipeline, params))
+    return configs
+
+
+def config_label(pipeline, params):
+    """'p13[clahe_preserve_color.clipLimit=3.0 ...]' for tables."""
+    items = [f"{s}.{p}={'x'.join(map(str, v)) if isinstance(v, tuple) else v}"
+             for s, ps in params.items() for p, v in ps.items()]
+    return f"{pipeline}[{' '.join(items)}]" if items else pipeline
+
+
+def evaluate(pipeline, params, frames, repeat=1):
+    """
+    Runs one candidate on every sample frame.
+
+    Returns:
+        result (dict): cpu_s / wall_s per image, per-metric means over the frames
+                       that succeeded, and the failure rate.
+    """
+    def stage(name, *args, **kwargs):
+        return STAGES[name](*args, **{**kwargs, **params.get(name, {})})
+
+    cpu, wall, rows, errors = [], [], [], []
+    for img, fname in frames:
+        try:
+            for _ in range(repeat):
+                c0, w0 = time.process_time(), time.perf_counter()
+                out, _ = run_pipeline(pipeline, img, fname, stage=stage)
+                cpu.append(time.process_time() - c0)
+                wall.append(time.perf_counter() - w0)
+        except Exception as e:
+            errors.append(f"{fname}: {e}")
+            continue
+        metrics = frame_metrics(out)
+        rows.append([metrics[m] for m in METRICS])
+
+    result = {
+        "pipeline": pipeline,
+        "params": params,
+        "label": config_label(pipeline, params),
+        "n_images": len(frames),
+        "fail_rate": len(errors) / len(frames),
+        "errors": errors[:3],
+    }
+    if cpu:
+        result.update(cpu_s=float(np.median(cpu)), wall_s=float(np.median(wall)))
+    if rows:
+        result.update(zip(METRICS, np.mean(rows, axis=0).tolist()))
+    return result
+
+
+def meets_targets(result, targets, max_fail_rate=0.0, max_cpu_ms=None):
+    """
+    True if the candidate ran, hits every target and fits the per-image CPU budget.
+    Without targets nothing qualifies (any candidate, p0 included, would).
+    """
+    if not targets or "cpu_s" not in result or result["fail_rate"] > max_fail_rate:
+        return False
+    if max_cpu_ms is not None and result["cpu_s"] * 1000 > max_cpu_ms:
+        return False
+    return all(_OPS[op](result[m], value) for m, op, value in targets)
+
+
+def pareto_front(results, objectives):
+    """
+    Candidates not dominated on images/sec and the objective metrics.
+
+    Parameters:
+        results (list[dict]): evaluate() results that have images_per_sec.
+        objectives (list[tuple[str, str]]): (metric, '>=' or '<=') - the direction that is better.
+
+    Returns:
+        front (list[dict]): Sorted by images/sec, fastest first.
+    """
+    signs = np.array([1.0] + [1.0 if op == ">=" else -1.0 for _, op in objectives])
+    points = np.array([[r["images_per_sec"]] + [r[m] for m, _ in objectives] for r in results]) * signs
+    # i is dominated if some j is >= on every objective and > on at least one
+    ge = (points[None, :, :] >= points[:, None, :]).all(axis=2)
+    gt = (points[None, :, :] > points[:, None, :]).any(axis=2)
+    dominated = (ge & gt).any(axis=1)
+    front = [r for r, d in zip(results, dominated) if not d]
+    return sorted(front, key=lambda r: -r["images_per_sec"])
+
+
+def print_results(title, results, objectives):
+    cols = [m for m, _ in objectives]
+    print(f"\n{title}")
+    print(f"{'candidate':<64}{'img/s':>9}{'cpu ms':>9}{'fail':>6}" + "".join(f"{c:>19}" for c in cols))
+    for r in results:
+        print(f"{r['label']:<64}{r['images_per_sec']:>9.2f}{r['cpu_s'] * 1000:>9.0f}{r['fail_rate']:>6.0%}"
+              + "".join(f"{r[c]:>19.3f}" for c in cols))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pipelines", default="all", help="Comma-separated pipeline keys or 'all'")
+    parser.add_argument("--grid", default="default",
+                        help="'default', 'none' or 'stage.param=v1,v2;...', e.g. 'clahe_preserve_color.clipLimit=1,2,4'")
+    parser.add_argument("--targets", default="", help="Metric targets, e.g. 'laplacian_var>=150,histogram_entropy>=6.5'")
+    parser.add_argument("--objective", default="laplacian_var",
+                        help="Quality metric for the Pareto front when no targets are given")
+    parser.add_argument("--images", default=None, help="Folder of sample images (default: synthetic)")
+    parser.add_argument("--n-images", type=int, default=4, help="Sample images per candidate")
+    parser.add_argument("--size", default="2400x4600", help="HEIGHTxWIDTH the sample images are resized to")
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per image")
+    parser.add_argument("--cpus", type=int, default=1, help="CPU budget: parallel single-threaded workers")
+    parser.add_argument("--max-cpu-ms", type=float, default=None, help="Per-image CPU time budget")
+    parser.add_argument("--max-fail-rate", type=float, default=0.0, help="Allowed fraction of failed images")
+    parser.add_argument("--threads", type=int, default=1, help="OpenCV threads while measuring")
+    parser.add_argument("--output", default=None, help="JSON file for all candidates")
+    args = parser.parse_args(argv)
+
+    cv2.setNumThreads(args.threads)
+    pipelines = list(PIPELINES) if args.pipelines == "all" else [p.strip() for p in args.pipelines.split(",")]
+    unknown = [p for p in pipelines if p not in PIPELINES]
+    if unknown:
+        parser.error(f"unknown pipelines {unknown}, expected some of {list(PIPELINES)}")
+    targets = parse_targets(args.targets)
+    objectives = [(m, op) for m, op, _ in targets] or [(args.objective, ">=")]
+
+    frames = load_frames(parse_sizes(args.size)[0], args.images, args.n_images)
+    probe = (cv2.resize(frames[0][0], (64, 64)), frames[0][1])
+    configs = candidates(pipelines, parse_grid(args.grid), probe)
+    print(f"{len(configs)} candidates x {len(frames)} images")
+
+    results = []
+    for i, (pipeline, params) in enumerate(configs, 1):
+        print(f"[TUNE {i}/{len(configs)}] {config_label(pipeline, params)}", flush=True)
+        result = evaluate(pipeline, params, frames, args.repeat)
+        if "cpu_s" in result:
+            # A zero CPU reading (p0 is a no-op) would project infinite throughput
+            result["images_per_sec"] = args.cpus / max(result["cpu_s"], 1e-6)
+        results.append(result)
+
+    ran = [r for r in results if "cpu_s" in r and r["fail_rate"] <= args.max_fail_rate]
+    if ran:
+        print_results(f"Pareto front ({args.cpus} CPU budget)", pareto_front(ran, objectives), objectives)
+
+    # Identity pipelines do no work, their throughput is only timer noise
+    no_op = {p for p in pipelines if not stages_used(p, probe)}
+    ok = [r for r in results if r["pipeline"] not in no_op
+          and meets_targets(r, targets, args.max_fail_rate, args.max_cpu_ms)]
+    best = max(ok, key=lambda r: r["images_per_sec"], default=None)
+    if not targets:
+        print("\nNo --targets given: pass at least one quality target to get a recommendation.")
+    elif best is None:
+        print("\nNo candidate meets the targets within the CPU budget.")
+    else:
+        print(f"\nRecommended: {best['label']} - {best['images_per_sec']:.2f} images/sec on {args.cpus} CPU(s), "
+              f"{best['cpu_s'] * 1000:.0f} ms CPU per image")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({"meta": {**machine_info(), "args": vars(args)},
+                       "targets": targets, "recommended": best, "results": results}, f, indent=2)
+        print(f"Results saved to {args.output}")
+    return 0 if best is not None or not targets else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+"""
+Benchmark suite for the src/ stages and the p0-p13 pipeline compositions.
+
+Every case (one stage or one pipeline at one input resolution) runs in a fresh
+process so its peak RSS is its own. The input frames are generated once per
+resolution in the parent and handed to the case as .npy files, so synthesis
+never counts towards a case's memory; the report gives the peak RSS above the
+loaded inputs. Results are written as JSON so two commits can be compared on
+the same machine:
+
+    python benchmarks/bench_pipelines.py --output before.json
+    ... change things ...
+    python benchmarks/bench_pipelines.py --output after.json --compare before.json
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from queue import Empty
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, SRC_DIR)
+
+import cv2
+import numpy as np
+
+from pipelines import PIPELINES, STAGES, list_images, run_pipeline
+from synthetic_eye import synthesize_eye
+
+# Raw captures are roughly 2400x4600, everything after cropping is 600x600
+DEFAULT_SIZES = "600x600,1200x2300,2400x4600"
+
+# Stages that need something other than (bgr_img, fname) as input
+STAGE_ARGS = {
+    "contour_crop_binary": lambda img, fname: (STAGES["otsu_threshold"](img, fname)[0], img, fname),
+}
+
+# Older path-only modules, benchmarked from a temporary file on disk
+LEGACY_STAGES = {
+    "clahe_color_image": ("contrast", "clahe_color_image"),
+    "tophat_enhance_color": ("tophat_optimization", "tophat_enhance_color"),
+}
+
+
+def parse_sizes(text):
+    """'600x600,2400x4600' -> [(600, 600), (2400, 4600)] as (height, width)."""
+    sizes = []
+    for item in text.split(","):
+        h, w = item.lower().split("x")
+        sizes.append((int(h), int(w)))
+    return sizes
+
+
+def load_frames(size, images_dir=None, n_images=1):
+    """n_images BGR frames at `size`, from images_dir if given (resized) or from synthetic_eye."""
+    h, w = size
+    if images_dir:
+        frames = []
+        for path in list_images(images_dir)[:n_images]:
+            img = cv2.imread(path)
+            if img is None:
+                continue
+            frames.append((cv2.resize(img, (w, h), interpolation=cv2.INTER_AREA), os.path.basename(path)))
+        if frames:
+            return frames
+        print(f"No readable images in {images_dir}, using synthetic frames")
+    return [(synthesize_eye(h, w, seed=i)[0], f"synthetic_{i:03d}.jpg") for i in range(n_images)]
+
+
+def save_frames(frames, workdir):
+    """Writes frames to .npy files in workdir; returns [(npy_path, fname)] for bench_case."""
+    saved = []
+    for i, (img, fname) in enumerate(frames):
+        path = os.path.join(workdir, f"frame_{i:03d}.npy")
+        np.save(path, img)
+        saved.append((path, fname))
+    return saved
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (since reset_peak_rss), in MB."""
+    # Linux: VmHWM belongs to this address space. ru_maxrss would also carry the
+    # parent's high-water mark across the fork + exec of a spawned case.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def reset_peak_rss():
+    """Resets the peak RSS to the current RSS where the OS allows it (Linux >= 4.0)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _legacy_caller(name, workdir):
+    module_name, func_name = LEGACY_STAGES[name]
+    func = getattr(__import__(module_name), func_name)
+
+    def call(img, fname):
+        cv2.imwrite(os.path.join(workdir, fname), img)
+        return func(fname, raw_folder=workdir)
+
+    return call
+
+
+def _case_callable(kind, name, workdir):
+    """Returns f(img, fname) -> {stage_name: seconds} for a stage or a pipeline."""
+    if kind == "pipeline":
+        def call(img, fname):
+            stage_times = {}
+
+            def timed_stage(stage_name, *args, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return STAGES[stage_name](*args, **kwargs)
+                finally:
+                    stage_times[stage_name] = stage_times.get(stage_name, 0.0) + time.perf_counter() - t0
+
+            run_pipeline(name, img, fname, stage=timed_stage)
+            return stage_times
+        return call
+
+    if name in LEGACY_STAGES:
+        func = _legacy_caller(name, workdir)
+        build_args = lambda img, fname: (img, fname)
+    else:
+        func = STAGES[name]
+        build_args = STAGE_ARGS.get(name, lambda img, fname: (img, fname))
+
+    def call(img, fname):
+        func(*build_args(img, fname))
+        return {}
+    return call
+
+
+def bench_case(kind, name, size, repeat=3, warmup=1, images_dir=None, n_images=1, frames=None):
+    """
+    Times one stage or pipeline at one resolution in the current process.
+
+    Parameters:
+        frames (list[tuple[np.ndarray | str, str]] | None): Input (image, fname) pairs, where an
+            image may be a .npy path (see save_frames); default load_frames(size, images_dir, n_images).
+
+    Returns:
+        result (dict): Timings, throughput and peak RSS for the JSON report. baseline_rss_mb is
+                       taken once the inputs are loaded and peak_delta_mb = peak_rss_mb - baseline_rss_mb.
+    """
+    if frames is None:
+        frames = load_frames(size, images_dir, n_images)
+    # np.load allocates just the array, so the baseline is the interpreter plus the inputs
+    frames = [(np.load(img) if isinstance(img, str) else img, fname) for img, fname in frames]
+    reset_peak_rss()
+    baseline_rss = peak_rss_mb()
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    result = {"kind": kind, "name": name, "size": list(size), "n_images": len(frames),
+              "repeat": repeat, "status": "ok"}
+    try:
+        call = _case_callable(kind, name, workdir)
+        for _ in range(warmup):
+            for img, fname in frames:
+                call(img, fname)
+
+        times, stage_totals = [], {}
+        for _ in range(repeat):
+            for img, fname in frames:
+                t0 = time.perf_counter()
+                stage_times = call(img, fname)
+                times.append(time.perf_counter() - t0)
+                for stage_name, t in stage_times.items():
+                    stage_totals[stage_name] = stage_totals.get(stage_name, 0.0) + t
+    except Exception as e:
+        result.update(status="error", error=f"{type(e).__name__}: {e}")
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    times = np.array(times)
+    result.update(
+        median_s=float(np.median(times)),
+        mean_s=float(times.mean()),
+        min_s=float(times.min()),
+        images_per_sec=float(len(times) / times.sum()),
+        stage_s={k: v / len(times) for k, v in stage_totals.items()},
+        baseline_rss_mb=baseline_rss,
+        peak_rss_mb=peak_rss_mb(),
+    )
+    result["peak_delta_mb"] = result["peak_rss_mb"] - baseline_rss
+    return result
+
+
+def _child(queue, args, kwargs):
+    queue.put(bench_case(*args, **kwargs))
+
+
+def bench_case_isolated(*args, **kwargs):
+    """Runs bench_case in a fresh spawned interpreter so peak RSS is per case."""
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(queue, args, kwargs))
+    proc.start()
+    while True:
+        try:
+            result = queue.get(timeout=1.0)
+            break
+        except Empty:
+            # Worker died without reporting (e.g. killed for running out of memory)
+            if not proc.is_alive():
+                result = {"kind": args[0], "name": args[1], "size": list(args[2]), "status": "error",
+                          "error": f"worker exited with {proc.exitcode}"}
+                break
+    proc.join()
+    return result
+
+
+def machine_info():
+    """Metadata stored with every result file so runs are comparable."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=os.path.dirname(SRC_DIR)).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+    }
+
+
+def print_table(results):
+    # Peak RSS above the process with its inputs loaded (ru_maxrss is a lifetime high-water mark)
+    print(f"\n{'case':<34}{'size':>11}{'median ms':>11}{'img/s':>10}{'+peak MB':>10}")
+    for r in results:
+        label = f"{r['kind']}:{r['name']}"
+        size = "x".join(map(str, r["size"]))
+        if r["status"] != "ok":
+            print(f"{label:<34}{size:>11}  {r['error']}")
+            continue
+        print(f"{label:<34}{size:>11}{r['median_s'] * 1000:>11.1f}{r['images_per_sec']:>10.2f}{r['peak_delta_mb']:>10.0f}")
+        for stage_name, t in r["stage_s"].items():
+            print(f"    {stage_name:<30}{'':>11}{t * 1000:>11.1f}")
+
+
+def compare(results, baseline_path, threshold=1.10):
+    """
+    Prints the median-time ratio of each case against a previous results file.
+
+    Returns:
+        regressions (list[str]): Cases that got slower than `threshold` x baseline.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old = {(r["kind"], r["name"], tuple(r["size"])): r for r in baseline["results"] if r["status"] == "ok"}
+
+    print(f"\nComparison against {baseline_path} (commit {baseline['meta'].get('commit') or '?'})")
+    regressions = []
+    for r in results:
+        key = (r["kind"], r["name"], tuple(r["size"]))
+        if r["status"] != "ok" or key not in old:
+            continue
+        ratio = r["median_s"] / old[key]["median_s"]
+        flag = "  SLOWER" if ratio > threshold else ("  faster" if ratio < 1 / threshold else "")
+        label = f"{r['kind']}:{r['name']} @ {'x'.join(map(str, r['size']))}"
+        print(f"{label:<50}{old[key]['median_s'] * 1000:>10.1f} -> {r['median_s'] * 1000:>8.1f} ms  x{ratio:.2f}{flag}")
+        if ratio > threshold:
+            regressions.append(label)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="HEIGHTxWIDTH list (default: %(default)s)")
+    parser.add_argument("--stages", default="all", help="Comma-separated stage names, 'all' or 'none'")
+    parser.add_argument("--pipelines", default="all", help="Comma-separated pipeline keys, 'all' or 'none'")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--images", default=None, help="Folder of real images to resize (default: synthetic)")
+    parser.add_argument("--n-images", type=int, default=1, help="Images per case")
+    parser.add_argument("--output", default=None, help="JSON results file")
+    parser.add_argument("--compare", default=None, help="Previous JSON results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.10, help="Slowdown ratio counted as a regression")
+    parser.add_argument("--no-isolate", action="store_true",
+                        help="Run all cases in this process (memory freed by one case may stay resident)")
+    args = parser.parse_args(argv)
+
+    def pick(choice, available):
+        if choice == "all":
+            return list(available)
+        if choice == "none":
+            return []
+        return [c.strip() for c in choice.split(",") if c.strip()]
+
+    cases = [("stage", s) for s in pick(args.stages, list(STAGES) + list(LEGACY_STAGES))]
+    cases += [("pipeline", p) for p in pick(args.pipelines, PIPELINES)]
+    runner = bench_case if args.no_isolate else bench_case_isolated
+
+    results = []
+    frames_dir = tempfile.mkdtemp(prefix="bench_frames_")
+    try:
+        for size in parse_sizes(args.sizes):
+            # Generated here once per size, so neither synthesis nor decoding counts towards a case
+            size_dir = os.path.join(frames_dir, f"{size[0]}x{size[1]}")
+            os.makedirs(size_dir)
+            frames = save_frames(load_frames(size, args.images, args.n_images), size_dir)
+            for kind, name in cases:
+                print(f"[BENCH] {kind}:{name} @ {size[0]}x{size[1]}", flush=True)
+                results.append(runner(kind, name, size, repeat=args.repeat, warmup=args.warmup, frames=frames))
+    finally:
+        shutil.rmtree(frames_dir, ignore_errors=True)
+
+    print_table(results)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({"meta": machine_info(), "results": results}, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) slower than x{args.threshold:.2f}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,100 @@
 import numpy as np
 import cv2 as cv
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Working size the radius/distance defaults were tuned for: a 2400x4600 capture at 0.2x
+REFERENCE_PIXELS = 480 * 920
+
+
+def detect_eye_circle(img, target_pixels=REFERENCE_PIXELS, dp=1.2, minDist=100, param1=100, param2=60,
+                      minRadius=80, maxRadius=250, refine=True, refine_factor=2.0, refine_tolerance=0.15):
+    """
+    Resolution-independent circle detection, coarse to fine.
+
+    The image is resized so it has about `target_pixels` pixels whatever the sensor
+    produced, and minDist/minRadius/maxRadius (given for REFERENCE_PIXELS) are scaled
+    to that size, so the accumulator work stays constant across cameras. The coarse
+    circle is then refined by a second Hough pass on a small window around it at
+    `refine_factor` times the working resolution, with the radius bounds narrowed
+    to +/- refine_tolerance. If the refinement finds nothing the coarse circle is kept.
+
+    Parameters:
+        img (np.ndarray): BGR or grayscale image at full resolution.
+        target_pixels (int): Pixel count of the coarse working image.
+        dp, param1, param2: As in cv.HoughCircles.
+        minDist, minRadius, maxRadius (int): Bounds at REFERENCE_PIXELS.
+        refine (bool): Run the fine pass.
+        refine_factor (float): Fine-pass resolution relative to the coarse one (capped at full resolution).
+        refine_tolerance (float): Relative radius search range of the fine pass.
+
+    Returns:
+        circle (tuple[float, float, float] | None): (x, y, r) in full-resolution pixels, or None.
+    """
+    def to_gray(a):
+        return cv.cvtColor(a, cv.COLOR_BGR2GRAY) if a.ndim == 3 else a
+
+    h, w = img.shape[:2]
+    scale = min(1.0, np.sqrt(target_pixels / (h * w)))
+    # Images smaller than target_pixels are not upsampled, scale the bounds to what is left
+    bounds = scale * np.sqrt(h * w / REFERENCE_PIXELS)
+
+    def shrink(a, f):
+        # INTER_AREA reads every source pixel; for big reductions go most of the way with
+        # INTER_LINEAR (reads ~4 per output pixel) so the cost tracks the output size
+        if f < 0.5:
+            a = cv.resize(a, (0, 0), fx=2 * f, fy=2 * f, interpolation=cv.INTER_LINEAR)
+            f = 0.5
+        return cv.resize(a, (0, 0), fx=f, fy=f, interpolation=cv.INTER_AREA)
+
+    # Resize first, so only working-size pixels are converted to gray
+    small = to_gray(shrink(img, scale))
+    circles = cv.HoughCircles(small, cv.HOUGH_GRADIENT, dp=dp, minDist=minDist * bounds,
+                              param1=param1, param2=param2,
+                              minRadius=int(minRadius * bounds), maxRadius=int(np.ceil(maxRadius * bounds)))
+    if circles is None:
+        return None
+    x, y, r = (float(v) / scale for v in circles[0, 0])
+    if not refine or scale >= 1.0:
+        return x, y, r
+
+    # Fine pass: window of about 1.5 r around the coarse circle, at a higher resolution
+    fine = min(1.0, scale * refine_factor)
+    half = 1.5 * r
+    x1, y1 = int(max(x - half, 0)), int(max(y - half, 0))
+    x2, y2 = int(min(x + half, w)), int(min(y + half, h))
+    window = to_gray(shrink(img[y1:y2, x1:x2], fine))
+    refined = cv.HoughCircles(window, cv.HOUGH_GRADIENT, dp=dp, minDist=max(window.shape),
+                              param1=param1, param2=param2 * fine / scale,
+                              minRadius=int(r * fine * (1 - refine_tolerance)),
+                              maxRadius=int(np.ceil(r * fine * (1 + refine_tolerance))))
+    if refined is None:
+        return x, y, r
+    fx, fy, fr = (float(v) / fine for v in refined[0, 0])
+    return x1 + fx, y1 + fy, fr
+
 
 #color or grayscale version (depends on what was passed in!)
-def hough_crop_eye(filename, input_folder='data/raw_images', 
+def hough_crop_eye(img_or_filename, fname=None, input_folder='data/raw_images',
                    dp=1.2, minDist=100, param1=100, param2=60, 
-                   minRadius=80, maxRadius=250, output_size=(600, 600)):
+                   minRadius=80, maxRadius=250, output_size=(600, 600),
+                   target_pixels=None, refine=True):
     """
     Uses Hough Circle Transform to detect circular features (e.g., cornea or pupil) and crops the image around the detected circle.
 
+    By default the image is downsized by a fixed 0.2 (the notebook behaviour, kept
+    so p3 outputs do not change). With target_pixels set, detection runs through
+    detect_eye_circle instead: the working resolution and radius bounds adapt to
+    the input size, the circle is refined coarse-to-fine and the crop box is taken
+    in full-resolution coordinates.
+
+    Accepts:
+        - NumPy image array (BGR) + fname
+        - Filename (loads from input_folder)
+
     Parameters:
-        filename (str): Name of the image file (e.g. 'image01.jpg').
+        img_or_filename (np.ndarray | str): Image array or name of the image file (e.g. 'image01.jpg').
+        fname (str | None): Filename for logging/saving, required when passing an array.
         input_folder (str): Folder where preprocessed (CLAHE or grayscale) images are stored.
         dp (float): Inverse ratio of accumulator resolution to image resolution (usually 1.0–2.0).
         minDist (int): Minimum distance between detected circles.
@@ -19,15 +103,42 @@ def hough_crop_eye(filename, input_folder='data/raw_images',
         minRadius (int): Minimum radius of circles to detect.
         maxRadius (int): Maximum radius of circles to detect.
         output_size (tuple): Final size of the cropped and resized image.
+        target_pixels (int | None): Resolution-adaptive mode, e.g. REFERENCE_PIXELS (None = fixed 0.2 scale).
+        refine (bool): Coarse-to-fine refinement in the adaptive mode.
 
     Returns:
         final_img (np.ndarray): Cropped and resized image centered on detected circle.
         filename (str): Original filename (for saving/logging downstream).
     """
-    image_path = os.path.join(input_folder, filename)
-    img = cv.imread(image_path)
+    # Case 1: already an image array
+    if isinstance(img_or_filename, np.ndarray):
+        if fname is None:
+            raise ValueError("fname must be provided when passing an image array")
+        img = img_or_filename
+        filename = os.path.basename(fname)
+
+    # Case 2: filename (loads from disk)
+    else:
+        filename = img_or_filename
+        image_path = os.path.join(input_folder, filename)
+        img = cv.imread(image_path)
 
-    assert img is not None, f"Image not found or unreadable: {image_path}"
+        assert img is not None, f"Image not found or unreadable: {image_path}"
+
+    if target_pixels is not None:
+        circle = detect_eye_circle(img, target_pixels, dp=dp, minDist=minDist, param1=param1, param2=param2,
+                                   minRadius=minRadius, maxRadius=maxRadius, refine=refine)
+        if circle is None:
+            raise ValueError(f"Hough Transform failed to detect a circle in: {filename}")
+        x, y, r = circle
+        # Same 20 px padding as below, in working-resolution pixels
+        pad = 20 * np.sqrt(img.shape[0] * img.shape[1] / target_pixels)
+        x1, y1 = int(max(x - r - pad, 0)), int(max(y - r - pad, 0))
+        x2, y2 = int(min(x + r + pad, img.shape[1])), int(min(y + r + pad, img.shape[0]))
+        final_img = cv.resize(img[y1:y2, x1:x2], output_size)
+        if final_img.ndim == 2:
+            final_img = cv.cvtColor(final_img, cv.COLOR_GRAY2BGR)
+        return final_img, filename
 
     # Scale the image down because its WAY too big
     scale_factor = 0.2
@@ -65,4 +176,32 @@ def hough_crop_eye(filename, input_folder='data/raw_images',
     if len(final_img.shape) == 2:  # grayscale
         final_img = cv.cvtColor(final_img, cv.COLOR_GRAY2BGR)
 
-    return final_img, filename
\ No newline at end of file
+    return final_img, filename
+
+
+def hough_crop_eye_batch(images, fnames, workers=None, **kwargs):
+    """
+    Runs hough_crop_eye over many images, detections in parallel threads
+    (OpenCV releases the GIL). Defaults to the resolution-adaptive mode.
+
+    Parameters:
+        images (list[np.ndarray]): BGR images, any mix of resolutions.
+        fnames (list[str]): Matching filenames.
+        workers (int | None): Threads (default: ThreadPoolExecutor's default).
+        **kwargs: Passed to hough_crop_eye.
+
+    Returns:
+        results (list[tuple[np.ndarray | None, str]]): (crop, filename) per image,
+                                                       crop is None where no circle was found.
+    """
+    kwargs.setdefault("target_pixels", REFERENCE_PIXELS)
+
+    def crop(args):
+        img, fname = args
+        try:
+            return hough_crop_eye(img, fname, **kwargs)
+        except ValueError:
+            return None, os.path.basename(fname)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(crop, zip(images, fnames)))
@@ -0,0 +1,200 @@
+import cv2
+import numpy as np
+
+from frame import Frame
+
+
+def stack_frames(frames):
+    """
+    Stacks same-sized BGR frames (e.g. the 600x600 crops) into one (N, H, W, 3) batch.
+
+    Parameters:
+        frames (list[np.ndarray]): Images of identical shape.
+
+    Returns:
+        batch (np.ndarray): Contiguous uint8 array of shape (N, H, W, 3).
+    """
+    shapes = {f.shape for f in frames}
+    if len(shapes) != 1:
+        raise ValueError(f"All frames in a batch must have the same shape, got {sorted(shapes)}")
+    return np.stack(frames)
+
+
+def to_rgb_batch(batch):
+    """BGR -> RGB for a whole batch (same result as cv2.COLOR_BGR2RGB per frame)."""
+    return np.ascontiguousarray(batch[..., ::-1])
+
+
+def gray_batch(batch):
+    """
+    Grayscale for a whole batch, identical to cv2.COLOR_BGR2GRAY per frame.
+
+    The frames are viewed as one tall image so OpenCV converts them in a single call.
+
+    Returns:
+        gray (np.ndarray): uint8 array of shape (N, H, W).
+    """
+    n, h, w, _ = batch.shape
+    return cv2.cvtColor(batch.reshape(n * h, w, 3), cv2.COLOR_BGR2GRAY).reshape(n, h, w)
+
+
+def gaussian_blur_batch(batch, kernel_size=(5, 5), sigma=0):
+    """
+    Gaussian blur for a whole batch, identical to cv2.GaussianBlur per frame.
+
+    Each frame is reflect-padded by half the kernel height so that blurring the
+    stacked frames in one call never mixes rows of neighbouring frames.
+
+    Parameters:
+        batch (np.ndarray): (N, H, W, C) uint8 batch.
+        kernel_size (tuple[int, int]): Gaussian kernel size (both odd, positive).
+        sigma (int | float): Standard deviation; 0 lets OpenCV infer it from kernel_size.
+
+    Returns:
+        blurred (np.ndarray): Same shape and dtype as batch.
+    """
+    if any(k <= 0 or k % 2 == 0 for k in kernel_size):
+        raise ValueError(f"kernel_size must be two positive odd ints, got {kernel_size}")
+    n, h, w = batch.shape[:3]
+    pad = kernel_size[1] // 2
+    if pad == 0:
+        return cv2.GaussianBlur(batch.reshape(n * h, w, -1), tuple(kernel_size), sigma).reshape(batch.shape)
+
+    # np.pad 'reflect' is OpenCV's default BORDER_REFLECT_101
+    padded = np.pad(batch, ((0, 0), (pad, pad), (0, 0), (0, 0)), mode="reflect")
+    tall = padded.reshape(n * (h + 2 * pad), w, -1)
+    blurred = cv2.GaussianBlur(tall, tuple(kernel_size), sigma).reshape(padded.shape)
+    return np.ascontiguousarray(blurred[:, pad:-pad])
+
+
+def normalize_batch(batch, mean=None, std=None):
+    """
+    Scales a uint8 batch to float32 [0, 1] and optionally standardises per channel,
+    e.g. for feeding the 600x600 crops to a model.
+
+    Parameters:
+        batch (np.ndarray): (N, H, W, C) uint8 batch.
+        mean (sequence[float] | None): Per-channel mean to subtract (in [0, 1] units).
+        std (sequence[float] | None): Per-channel std to divide by (in [0, 1] units).
+
+    Returns:
+        normalized (np.ndarray): float32 array with the same shape as batch.
+    """
+    out = batch.astype(np.float32)
+    out *= 1.0 / 255.0
+    if mean is not None:
+        out -= np.asarray(mean, np.float32)
+    if std is not None:
+        out /= np.asarray(std, np.float32)
+    return out
+
+
+def frame_metrics_batch(batch, gray=None):
+    """
+    Cheap per-frame quality metrics for a whole batch in vectorised NumPy/OpenCV.
+
+    Parameters:
+        batch (np.ndarray): (N, H, W, 3) uint8 BGR batch.
+        gray (np.ndarray | None): Precomputed gray_batch(batch), if available.
+
+    Returns:
+        metrics (dict[str, np.ndarray]): One value per frame for
+            'mean_brightness' (gray mean, the testtest.py darkness check),
+            'rms_contrast' (gray standard deviation),
+            'laplacian_var' (variance of the Laplacian, a sharpness measure),
+            'histogram_entropy' (Shannon entropy of the 256-bin gray histogram, bits).
+    """
+    if gray is None:
+        gray = gray_batch(batch)
+    n = gray.shape[0]
+    flat = gray.reshape(n, -1)
+
+    # Frames as channels: one Laplacian call per 512 frames (OpenCV's channel limit)
+    lap_var = np.empty(n)
+    for i in range(0, n, 512):
+        chans = np.ascontiguousarray(gray[i:i + 512].transpose(1, 2, 0))
+        lap = cv2.Laplacian(chans, cv2.CV_64F)
+        lap_var[i:i + 512] = lap.reshape(-1, chans.shape[2]).var(axis=0)
+
+    # All histograms at once: offset every frame into its own block of 256 bins
+    offsets = (np.arange(n, dtype=np.int64) * 256)[:, None]
+    hist = np.bincount((flat + offsets).ravel(), minlength=256 * n).reshape(n, 256)
+    p = hist / flat.shape[1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        entropy = -np.where(p > 0, p * np.log2(p), 0.0).sum(axis=1)
+
+    return {
+        "mean_brightness": flat.mean(axis=1),
+        "rms_contrast": flat.std(axis=1),
+        "laplacian_var": lap_var,
+        "histogram_entropy": entropy,
+    }
+
+
+def frame_metrics(image):
+    """
+    frame_metrics_batch for a single frame, computed from its Frame views.
+
+    Inside a frame_scope, Frame.of returns the registered Frame, so a frame whose
+    gray, histogram or Laplacian was already computed (or that several pipelines
+    share, see fanout.py) is not converted again.
+
+    Parameters:
+        image (np.ndarray | frame.Frame): BGR (H, W, 3) or grayscale (H, W) uint8 frame.
+
+    Returns:
+        metrics (dict[str, float]): Same keys as frame_metrics_batch.
+    """
+    frame = Frame.of(image)
+    gray = frame.gray()
+    p = frame.histogram() / gray.size
+    p = p[p > 0]
+    return {
+        "mean_brightness": float(gray.mean()),
+        "rms_contrast": float(gray.std()),
+        "laplacian_var": frame.laplacian_var(),
+        "histogram_entropy": float(-(p * np.log2(p)).sum()),
+    }
+
+
+def edge_metrics(image, reference=None):
+    """
+    Edge metrics of image_test.ipynb from the Frame Sobel magnitude view.
+
+    Parameters:
+        image (np.ndarray | frame.Frame): Processed BGR or grayscale uint8 frame.
+        reference (np.ndarray | frame.Frame | None): Frame it was processed from (same size),
+                                                     for edge preservation.
+
+    Returns:
+        metrics (dict[str, float]): 'edge_density' (% of pixels above the Otsu threshold of the
+            8-bit normalised magnitude) and 'edge_preservation' (Pearson r between the reference's
+            and the image's magnitudes; NaN without a reference or for a flat magnitude).
+    """
+    mag = Frame.of(image).sobel_magnitude()
+    m8 = cv2.normalize(mag, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    _, edges = cv2.threshold(m8, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    preservation = np.nan
+    if reference is not None:
+        ref = Frame.of(reference).sobel_magnitude()
+        if ref.shape != mag.shape:
+            raise ValueError(f"Edge preservation needs frames of one size, got {ref.shape} and {mag.shape}")
+        if ref.std() >= 1e-9 and mag.std() >= 1e-9:
+            preservation = float(np.corrcoef(ref.ravel(), mag.ravel())[0, 1])
+    return {"edge_density": float((edges > 0).mean() * 100.0), "edge_preservation": preservation}
+
+
+# Post-crop stages the batch runner can apply to grouped outputs (uint8 in, uint8 out)
+POST_STAGES = {
+    "to_rgb": to_rgb_batch,
+    "blur": gaussian_blur_batch,
+}
+
+
+def run_post_stages(batch, names):
+    """Applies the named POST_STAGES to a batch, in order."""
+    for name in names:
+        if name not in POST_STAGES:
+            raise ValueError(f"Unknown post stage {name!r}, expected one of {list(POST_STAGES)}")
+        batch = POST_STAGES[name](batch)
+    return batch
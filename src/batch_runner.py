@@ -0,0 +1,310 @@
+import os
+import csv
+import time
+import argparse
+from contextlib import nullcontext
+
+import cv2
+
+from checkpoint import JOURNAL_PATH, atomic_imwrite
+from pipelines import PIPELINES, call_stage, list_images, output_name, run_pipeline
+from tracing import print_total_time
+
+
+METRIC_FIELDS = ["image_name", "pipeline", "mean_brightness", "rms_contrast", "laplacian_var", "histogram_entropy"]
+
+
+def run_batch(pipeline, raw_dir='data/raw_images', out_dir='data/processed_images', tracer=None,
+              post_stages=(), batch_size=16, metrics_path=None, files=None,
+              quality_gate=None, gate_report_path=None, ledger_path=None, journal_path=None,
+              resume=False, retry_failed=False):
+    """
+    Runs one pipeline over every image in raw_dir and saves the outputs, the same
+    loop as the pipelinetest notebooks.
+
+    When post-crop work is requested (post_stages or metrics_path), same-shaped
+    outputs (the 600x600 crops) are grouped into batches of up to batch_size and
+    processed as one (N, 600, 600, 3) array by batch_post before being saved.
+
+    Parameters:
+        pipeline (str): Pipeline key, e.g. 'p7'.
+        raw_dir (str): Folder of raw images.
+        out_dir (str): Folder to save processed images to (filename + pipeline suffix).
+        tracer (tracing.Tracer | None): Optional tracer; when given, every image, decode,
+                                        stage, post stage and imwrite call is recorded as a span.
+        post_stages (sequence[str]): batch_post.POST_STAGES names to apply after the pipeline.
+        batch_size (int): Maximum frames per post-crop batch.
+        metrics_path (str | None): Write per-image batch_post.frame_metrics_batch rows to this CSV
+                                    (metrics of the pipeline outputs, before post_stages).
+        files (list[str] | None): Explicit image paths to process instead of everything in raw_dir.
+        quality_gate (dict | None): If given, screen each image with quality_gate.check_quality
+                                    (these threshold overrides, {} for the defaults) on a
+                                    reduced-resolution decode and skip rejected ones.
+        gate_report_path (str | None): Write every image's gate statistics and reasons to this CSV.
+        ledger_path (str | None): Append per-image and per-stage timings of this run to this
+                                  SQLite runtime ledger (see ledger.py).
+        journal_path (str | None): Record every finished image in this checkpoint journal
+                                   (see checkpoint.py); needed for resume / retry_failed.
+        resume (bool): Skip images the journal lists as done under the same configuration.
+        retry_failed (bool): Only process images whose last journalled attempt failed.
+
+    Returns:
+        ok (int): Number of images saved.
+        fail (int): Number of images that failed (including quality-gate rejections).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    if files is None:
+        files = list_images(raw_dir)
+    if not files:
+        print(f"No images found in {raw_dir}")
+        return 0, 0
+
+    journal = None
+    if journal_path:
+        from checkpoint import RunJournal
+        journal = RunJournal(journal_path, pipeline, {"post_stages": list(post_stages),
+                                                      "quality_gate": quality_gate,
+                                                      "out_dir": os.path.abspath(out_dir)})
+        files, skipped = journal.select(files, out_dir, resume, retry_failed)
+        if skipped:
+            print(f"Journal: skipping {skipped} images, {len(files)} to process ({journal_path})")
+
+    span = tracer.span if tracer is not None else (lambda *a, **k: nullcontext())
+    stage = tracer.stage if tracer is not None else call_stage
+    group_size = batch_size if (post_stages or metrics_path) else 1
+
+    metrics_file = writer = None
+    if metrics_path:
+        # A resumed run adds its rows to the metrics of the interrupted one
+        append = (resume or retry_failed) and os.path.exists(metrics_path)
+        metrics_file = open(metrics_path, "a" if append else "w", newline="")
+        writer = csv.DictWriter(metrics_file, fieldnames=METRIC_FIELDS)
+        if not append:
+            writer.writeheader()
+
+    gate_rows = []
+    if quality_gate is not None:
+        from quality_gate import check_quality, gate_report_row
+
+    ledger = run_id = None
+    timings = {}  # in_path -> (input shape, total seconds, stage seconds) until the image is logged
+    if ledger_path:
+        from ledger import RuntimeLedger, timed_stage_caller
+        ledger = RuntimeLedger(ledger_path)
+        run_id = ledger.start_run(pipeline, {"post_stages": list(post_stages), "batch_size": batch_size,
+                                             "quality_gate": quality_gate, "n_files": len(files)})
+
+    def log_image(in_path, status, error=None, output=None):
+        if journal is not None:
+            journal.record(in_path, status, output, error)
+        if ledger is not None:
+            shape, total_s, stage_times = timings.pop(in_path, (None, None, None))
+            ledger.record_image(run_id, os.path.basename(in_path), shape, status, total_s, stage_times, error)
+
+    pending = []  # (in_path, out_name, final_img) waiting for the next batch
+
+    def flush():
+        nonlocal ok, fail
+        if not pending:
+            return
+        frames = [img for _, _, img in pending]
+        if post_stages or writer is not None:
+            from batch_post import frame_metrics_batch, run_post_stages, stack_frames
+            try:
+                with span("post", cat="post", n=len(frames)):
+                    batch = stack_frames(frames)
+                    # Metrics describe the pipeline outputs, before any layout or colour change
+                    if writer is not None:
+                        metrics = frame_metrics_batch(batch)
+                    batch = run_post_stages(batch, post_stages)
+            except Exception as e:
+                for in_path, _, _ in pending:
+                    fail += 1
+                    print(f"[FAIL] {os.path.basename(in_path)}: post-crop batch failed → {e}")
+                    log_image(in_path, "fail", f"post-crop batch failed: {e}")
+                pending.clear()
+                return
+            frames = list(batch)
+        for i, ((in_path, out_name, _), final_img) in enumerate(zip(pending, frames)):
+            try:
+                with span("imwrite", cat="io"):
+                    atomic_imwrite(os.path.join(out_dir, out_name), final_img)
+                if writer is not None:
+                    writer.writerow({"image_name": out_name, "pipeline": pipeline,
+                                     **{k: float(v[i]) for k, v in metrics.items()}})
+                ok += 1
+                print(f"[OK] {os.path.basename(in_path)} -> {out_name}")
+                log_image(in_path, "ok", output=out_name)
+            except Exception as e:
+                fail += 1
+                print(f"[FAIL] {os.path.basename(in_path)}: {e}")
+                log_image(in_path, "fail", str(e))
+        pending.clear()
+
+    start_time = time.time()
+    ok = fail = rejected = 0
+    try:
+        for in_path in files:
+            fname = os.path.basename(in_path)
+            if quality_gate is not None:
+                try:
+                    with span("quality_gate", cat="gate"):
+                        passed, reasons, stats = check_quality(in_path, quality_gate)
+                except Exception as e:
+                    passed, reasons, stats = False, [str(e)], {}
+                gate_rows.append(gate_report_row(in_path, passed, reasons, stats))
+                if not passed:
+                    fail += 1
+                    rejected += 1
+                    print(f"[REJECT] {fname}: {'; '.join(reasons)}")
+                    log_image(in_path, "rejected", "; ".join(reasons))
+                    continue
+
+            stage_times, img = {}, None
+            image_stage = timed_stage_caller(stage, stage_times) if ledger is not None else stage
+            t0 = time.perf_counter()
+            try:
+                with span(fname, cat="image", pipeline=pipeline):
+                    with span("decode", cat="io"):
+                        img = cv2.imread(in_path)
+                    stage_times["decode"] = time.perf_counter() - t0
+                    if img is None:
+                        raise RuntimeError("cv2.imread returned None")
+
+                    final_img, fname = run_pipeline(pipeline, img, fname, stage=image_stage)
+            except Exception as e:
+                fail += 1
+                print(f"[FAIL] {os.path.basename(in_path)}: {e}")
+                timings[in_path] = (img.shape if img is not None else None, None, stage_times)
+                log_image(in_path, "fail", str(e))
+                continue
+            timings[in_path] = (img.shape, time.perf_counter() - t0, stage_times)
+
+            # Batches only hold one frame shape (p0 passes raw sizes through)
+            if pending and pending[0][2].shape != final_img.shape:
+                flush()
+            pending.append((in_path, output_name(fname, pipeline), final_img))
+            if len(pending) >= group_size:
+                flush()
+        flush()
+    finally:
+        if metrics_file is not None:
+            metrics_file.close()
+        if ledger is not None:
+            ledger.finish_run(run_id, ok, fail)
+        if journal is not None:
+            journal.close()
+
+    if gate_report_path and gate_rows:
+        fields = list(dict.fromkeys(k for row in gate_rows for k in row))
+        with open(gate_report_path, "w", newline="") as f:
+            gate_writer = csv.DictWriter(f, fieldnames=fields)
+            gate_writer.writeheader()
+            gate_writer.writerows(gate_rows)
+
+    rejected_note = f" ({rejected} rejected by quality gate)" if rejected else ""
+    print(f"\nDone. Saved {ok}. Failed {fail}{rejected_note}. Output: {out_dir}")
+    print_total_time(start_time)
+    return ok, fail
+
+
+def link_duplicates(linked, out_dir, pipeline, duplicates_path):
+    """Hard-links skipped near-duplicates to their representative's output (see phash_index.link_outputs)."""
+    from phash_index import link_outputs
+    n = link_outputs(linked, out_dir, lambda f: output_name(f, pipeline), duplicates_path)
+    print(f"Linked {n} near-duplicate outputs. Map: {duplicates_path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a preprocessing pipeline over a folder of images.")
+    parser.add_argument("pipeline", choices=list(PIPELINES))
+    parser.add_argument("--raw", default="data/raw_images", help="Input folder (default: %(default)s)")
+    parser.add_argument("--out", default="data/processed_images", help="Output folder (default: %(default)s)")
+    parser.add_argument("--post", default="", help="Comma-separated post-crop stages to apply in batches (to_rgb, blur)")
+    parser.add_argument("--batch-size", type=int, default=16, help="Frames per post-crop batch (default: %(default)s)")
+    parser.add_argument("--metrics", default=None, help="Write per-image quality metrics to this CSV")
+    parser.add_argument("--gate", action="store_true", help="Reject unusable images from a thumbnail before processing")
+    parser.add_argument("--gate-thresholds", default="", help="Overrides, e.g. 'min_brightness=10,min_laplacian_var=none'")
+    parser.add_argument("--gate-report", default=None, help="Write quality-gate statistics and reasons to this CSV")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes, scheduled under --memory-budget (default: 1, or all CPUs with a budget)")
+    parser.add_argument("--memory-budget", type=float, default=None, help="MB the images in flight may use (see memory_budget.py)")
+    parser.add_argument("--memory-profile", default=None, help="JSON file of observed stage peaks to read and update")
+    parser.add_argument("--ledger", default="data/runtime_ledger.sqlite",
+                        help="SQLite runtime ledger to append timings to (default: %(default)s)")
+    parser.add_argument("--no-ledger", action="store_true", help="Do not record this run in the ledger")
+    parser.add_argument("--journal", default=JOURNAL_PATH,
+                        help="Checkpoint journal of finished images, shared across output folders; "
+                             "--resume and --retry-failed read it (default: %(default)s)")
+    parser.add_argument("--no-journal", action="store_true", help="Do not keep a checkpoint journal")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip images already done with this configuration, retry the rest")
+    parser.add_argument("--retry-failed", action="store_true", help="Only re-run images whose last attempt failed")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="Process one frame per near-duplicate cluster and link the others (see phash_index.py)")
+    parser.add_argument("--dedupe-distance", default="10,12",
+                        help="Max dHash,pHash bit distances for --dedupe (default: %(default)s)")
+    parser.add_argument("--hash-index", default="data/phash_index.csv",
+                        help="Perceptual-hash index reused across --dedupe runs (default: %(default)s)")
+    parser.add_argument("--duplicates", default="data/duplicates.csv",
+                        help="Where --dedupe writes the duplicates CSV the analysis scripts read (default: %(default)s)")
+    parser.add_argument("--trace", default=None, help="Write a Chrome trace / Perfetto JSON file here")
+    parser.add_argument("--trace-memory", action="store_true", help="Also sample allocations per span (slower)")
+    args = parser.parse_args(argv)
+
+    if args.no_journal and (args.resume or args.retry_failed):
+        parser.error("--resume and --retry-failed need the journal")
+    journal_path = None if args.no_journal else args.journal
+    if journal_path:
+        os.makedirs(os.path.dirname(os.path.abspath(journal_path)), exist_ok=True)
+    os.makedirs(args.out, exist_ok=True)
+
+    files, linked = None, {}
+    if args.dedupe:
+        from phash_index import dedupe_files
+        max_dhash, max_phash = (int(v) for v in args.dedupe_distance.split(","))
+        os.makedirs(os.path.dirname(os.path.abspath(args.hash_index)), exist_ok=True)
+        files, linked = dedupe_files(list_images(args.raw), args.hash_index, max_dhash, max_phash)
+        print(f"Dedupe: {len(files)} representatives, {len(linked)} near-duplicates linked")
+
+    if (args.workers or 1) > 1 or args.memory_budget is not None:
+        if args.post or args.metrics or args.gate or args.gate_thresholds or args.trace or args.trace_memory:
+            parser.error("--workers/--memory-budget cannot be combined with --post, --metrics, --gate or --trace")
+        from memory_budget import run_budgeted
+        ok, fail = run_budgeted(args.pipeline, args.raw, args.out, workers=args.workers,
+                                budget_mb=args.memory_budget, profile_path=args.memory_profile, files=files,
+                                ledger_path=None if args.no_ledger else args.ledger, journal_path=journal_path,
+                                resume=args.resume, retry_failed=args.retry_failed)
+        if args.dedupe:
+            link_duplicates(linked, args.out, args.pipeline, args.duplicates)
+        return 1 if fail and not ok else 0
+
+    tracer = None
+    if args.trace or args.trace_memory:
+        from tracing import Tracer
+        tracer = Tracer(memory=args.trace_memory)
+
+    quality_gate = None
+    if args.gate or args.gate_thresholds:
+        from quality_gate import parse_thresholds
+        quality_gate = parse_thresholds(args.gate_thresholds)
+
+    post_stages = [p.strip() for p in args.post.split(",") if p.strip()]
+    ok, fail = run_batch(args.pipeline, args.raw, args.out, tracer=tracer,
+                         post_stages=post_stages, batch_size=args.batch_size, metrics_path=args.metrics,
+                         quality_gate=quality_gate, gate_report_path=args.gate_report, files=files,
+                         ledger_path=None if args.no_ledger else args.ledger, journal_path=journal_path,
+                         resume=args.resume, retry_failed=args.retry_failed)
+    if args.dedupe:
+        link_duplicates(linked, args.out, args.pipeline, args.duplicates)
+
+    if tracer is not None:
+        tracer.print_summary()
+        if args.trace:
+            tracer.save_chrome_trace(args.trace)
+            print(f"\nTrace saved to {args.trace}")
+    return 1 if fail and not ok else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
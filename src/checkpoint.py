@@ -0,0 +1,197 @@
+"""
+Checkpoint journal for resumable batch runs.
+
+Every image batch_runner.py finishes is recorded in a SQLite journal keyed by
+(input content hash, pipeline configuration hash), committed as soon as the
+output is on disk. Outputs are written to a temporary file and renamed into
+place, so an interrupted run never leaves a truncated image behind. A restarted
+run with --resume skips everything already done under the same configuration
+(a renamed input is still recognised, an edited one is not) and retries the rest;
+--retry-failed only re-runs the images whose last attempt failed.
+
+    python src/batch_runner.py p7                  # journals to data/run_journal.sqlite
+    python src/batch_runner.py p7 --resume         # continue where an interrupted run stopped
+    python src/batch_runner.py p7 --retry-failed   # only the FAIL list
+    python src/checkpoint.py status
+    python src/checkpoint.py failed --journal data/run_journal.sqlite
+
+The journal lives next to the runtime ledger, outside the output folders, and is
+shared by runs into different folders: the output folder is part of the
+configuration a run is journalled under.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+
+import cv2
+
+# Default journal, next to the runtime ledger (data/runtime_ledger.sqlite)
+JOURNAL_PATH = "data/run_journal.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS inputs (
+    path TEXT PRIMARY KEY, size INTEGER, mtime REAL, digest TEXT);
+CREATE TABLE IF NOT EXISTS configs (
+    config TEXT PRIMARY KEY, pipeline TEXT, body TEXT);
+CREATE TABLE IF NOT EXISTS entries (
+    digest TEXT, config TEXT, image_name TEXT, status TEXT, output TEXT, error TEXT,
+    attempts INTEGER, finished REAL, PRIMARY KEY (digest, config));
+"""
+
+# Statuses that --resume treats as finished (a rejection is deterministic for a given input and gate)
+DONE = ("ok", "rejected")
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """BLAKE2b (128-bit) hex digest of a file's bytes."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def config_key(pipeline, config):
+    """Short hash of the pipeline name and every setting that changes its outputs."""
+    body = json.dumps({"pipeline": pipeline, **config}, sort_keys=True, default=str)
+    return hashlib.sha1(body.encode()).hexdigest()[:16], body
+
+
+def atomic_imwrite(path, img):
+    """
+    cv2.imwrite that never leaves a partial file: encode, write a hidden temp file
+    in the same folder, fsync and rename over `path`.
+
+    Raises:
+        RuntimeError: If the image cannot be encoded for the file's extension.
+    """
+    directory, name = os.path.split(path)
+    ok, buf = cv2.imencode(os.path.splitext(name)[1] or ".jpg", img)
+    if not ok:
+        raise RuntimeError("cv2.imencode returned False")
+    tmp = os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(buf.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return True
+
+
+class RunJournal:
+    """
+    Journal of finished images for one pipeline configuration.
+
+    Parameters:
+        journal_path (str): SQLite file, created if missing (WAL mode, one commit per image).
+        pipeline (str): Pipeline key.
+        config (dict): Settings besides the pipeline that change the outputs (post stages, quality gate).
+    """
+
+    def __init__(self, journal_path, pipeline, config=None):
+        self.journal_path = journal_path
+        self.pipeline = pipeline
+        self.config, body = config_key(pipeline, config or {})
+        self.conn = sqlite3.connect(journal_path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute("INSERT OR IGNORE INTO configs VALUES (?, ?, ?)", (self.config, pipeline, body))
+        self._digests = {}
+
+    def digest(self, path):
+        """Content hash of an input, cached in the journal by (path, size, mtime)."""
+        if path in self._digests:
+            return self._digests[path]
+        st = os.stat(path)
+        row = self.conn.execute("SELECT size, mtime, digest FROM inputs WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime:
+            digest = row[2]
+        else:
+            digest = file_digest(path)
+            self.conn.execute("INSERT OR REPLACE INTO inputs VALUES (?, ?, ?, ?)",
+                              (path, st.st_size, st.st_mtime, digest))
+        self._digests[path] = digest
+        return digest
+
+    def entry(self, path):
+        """(status, output, error) of the last attempt at this input under this configuration, or None."""
+        return self.conn.execute("SELECT status, output, error FROM entries WHERE digest = ? AND config = ?",
+                                 (self.digest(path), self.config)).fetchone()
+
+    def select(self, files, out_dir, resume=False, retry_failed=False):
+        """
+        Filters a run's inputs.
+
+        Parameters:
+            files (list[str]): Candidate input paths.
+            out_dir (str): Output folder (a finished image whose output is gone is run again).
+            resume (bool): Skip inputs already finished under this configuration.
+            retry_failed (bool): Only inputs whose last attempt failed.
+
+        Returns:
+            todo (list[str]): Inputs to process, in the given order.
+            skipped (int): Inputs left out.
+        """
+        if not (resume or retry_failed):
+            return list(files), 0
+        todo = []
+        for path in files:
+            entry = self.entry(path)
+            if retry_failed:
+                run = entry is not None and entry[0] == "fail"
+            else:
+                run = entry is None or entry[0] not in DONE or (
+                    entry[0] == "ok" and not os.path.exists(os.path.join(out_dir, entry[1])))
+            if run:
+                todo.append(path)
+        return todo, len(files) - len(todo)
+
+    def record(self, path, status, output=None, error=None):
+        """Commits the outcome of one image ('ok', 'fail' or 'rejected')."""
+        self.conn.execute(
+            "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, 1, ?) ON CONFLICT (digest, config) DO UPDATE SET "
+            "image_name = excluded.image_name, status = excluded.status, output = excluded.output, "
+            "error = excluded.error, attempts = attempts + 1, finished = excluded.finished",
+            (self.digest(path), self.config, os.path.basename(path), status, output, error, time.time()))
+
+    def close(self):
+        self.conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["status", "failed"])
+    parser.add_argument("--journal", default=JOURNAL_PATH, help="Journal to inspect (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.journal):
+        parser.error(f"no journal at {args.journal}")
+    conn = sqlite3.connect(args.journal)
+    if args.command == "status":
+        rows = conn.execute(
+            "SELECT c.pipeline, c.config, c.body, e.status, COUNT(*) FROM entries e JOIN configs c "
+            "USING (config) GROUP BY c.config, e.status ORDER BY c.pipeline, c.config, e.status").fetchall()
+        last = None
+        for pipeline, config, body, status, n in rows:
+            if config != last:
+                print(f"\n{pipeline} [{config}] {body}")
+                last = config
+            print(f"  {status:<10}{n:>8}")
+    else:
+        for pipeline, name, error, attempts in conn.execute(
+                "SELECT c.pipeline, e.image_name, e.error, e.attempts FROM entries e JOIN configs c "
+                "USING (config) WHERE e.status = 'fail' ORDER BY c.pipeline, e.image_name"):
+            print(f"[FAIL] {pipeline} {name} (attempts: {attempts}): {error}")
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,6 +2,46 @@ import numpy as np
 import cv2 as cv
 import os
 
+from frame import Frame
+
+def eye_bounding_box(img, padding=30, fname="image"):
+    """
+    Padded bounding box of the largest Otsu contour, the ROI contour_crop_eye crops.
+
+    Parameters:
+        img (np.ndarray): BGR or grayscale image.
+        padding (int): Pixels added on every side (clipped to the image).
+        fname (str): Filename for the error message.
+
+    Returns:
+        box (tuple[int, int, int, int]): (x1, y1, x2, y2) in image pixels.
+    """
+    gray = Frame.of(img).gray()
+
+    # Apply Otsu's threshold 
+    _, thresh = cv.threshold(gray, 0, 255, cv.THRESH_BINARY + cv.THRESH_OTSU)
+
+    # Invert if needed to help find the contours
+    if np.mean(thresh) > 127:
+        thresh = cv.bitwise_not(thresh)
+
+    # Find contours
+    contours, _ = cv.findContours(thresh, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        raise ValueError(f"No contours found in image: {fname}")
+
+    # Get largest contour (most likely the iris)
+    largest_contour = max(contours, key=cv.contourArea)
+    x, y, w, h = cv.boundingRect(largest_contour)
+
+    # Apply padding with bounds check
+    x1 = max(x - padding, 0)
+    y1 = max(y - padding, 0)
+    x2 = min(x + w + padding, img.shape[1])
+    y2 = min(y + h + padding, img.shape[0])
+    return x1, y1, x2, y2
+
+
 def contour_crop_eye(img_or_filename, fname=None, input_folder='data/raw_images', output_size=(600,600), padding=30):
     """
     Detects the largest contour in the image (assumed to be the eye region), crops around it, and resizes.
@@ -29,33 +69,8 @@ def contour_crop_eye(img_or_filename, fname=None, input_folder='data/raw_images'
         if img is None:
             raise ValueError(f"Image not found or unreadable: {image_path}")
 
-    # Convert to grayscale if it's color (needed for the sake of the CV function, will convert back after)
-    if len(img.shape) == 3:
-        gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
-    else:
-        gray = img.copy()
-
-    # Apply Otsu's threshold 
-    _, thresh = cv.threshold(gray, 0, 255, cv.THRESH_BINARY + cv.THRESH_OTSU)
-
-    # Invert if needed to help find the contours
-    if np.mean(thresh) > 127:
-        thresh = cv.bitwise_not(thresh)
-
-    # Find contours
-    contours, _ = cv.findContours(thresh, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
-    if not contours:
-        raise ValueError(f"No contours found in image: {base_filename}")
-
-    # Get largest contour (most likely the iris)
-    largest_contour = max(contours, key=cv.contourArea)
-    x, y, w, h = cv.boundingRect(largest_contour)
-
-    # Apply padding with bounds check
-    x1 = max(x - padding, 0)
-    y1 = max(y - padding, 0)
-    x2 = min(x + w + padding, img.shape[1])
-    y2 = min(y + h + padding, img.shape[0])
+    # ROI around the largest Otsu contour
+    x1, y1, x2, y2 = eye_bounding_box(img, padding, base_filename)
 
     # Create the variable for the final image
     cropped = img[y1:y2, x1:x2]
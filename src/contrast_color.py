@@ -2,6 +2,8 @@ import numpy as np
 import cv2
 import os
 
+from frame import Frame
+
 def clahe_preserve_color(image_or_path, raw_folder='data/raw_images', clipLimit=2.0, tileGridSize=(8, 8), fname=None):
     """
     Applies CLAHE contrast enhancement to color images by converting to LAB color space,
@@ -40,7 +42,7 @@ def clahe_preserve_color(image_or_path, raw_folder='data/raw_images', clipLimit=
             raise ValueError(f"Image not found: {image_path}")
 
     # Convert to LAB and split channels
-    lab = cv2.cvtColor(bgr, cv2.COLOR_BGR2LAB)
+    lab = Frame.of(bgr).lab()
     l, a, b = cv2.split(lab)
 
     # Apply CLAHE to the lightness channel
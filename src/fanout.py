@@ -0,0 +1,270 @@
+"""
+Single-decode fan-out: run many pipelines over a dataset in one pass.
+
+Comparing pipelines used to mean one run (or notebook) per pipeline, each
+re-globbing data/raw_images, re-decoding every JPEG and re-running the stages
+pipelines have in common. Here each image is decoded once and pushed through
+every requested pipeline with a memoising stage caller: a stage call is keyed
+by the stage name, the calls that produced its image arguments (the DAG node)
+and its other arguments, so a shared prefix runs once. p10, p12 and p13 all
+start with homomorphic -> CLAHE -> Otsu on the same input, for example, and
+p7/p8 share the CLAHE of the raw image.
+
+The DAG is traced once on a small probe image to count how many pipelines
+consume each node; a node's output is dropped as soon as its last consumer has
+asked for it, so only live intermediates stay in memory.
+
+    python src/fanout.py --pipelines p1,p7,p10,p12,p13 --raw data/raw_images \\
+        --out data/processed_images --metrics data/fanout_metrics.csv
+"""
+import os
+import csv
+import time
+import argparse
+import warnings
+import weakref
+from collections import Counter
+
+import cv2
+import numpy as np
+
+from batch_runner import METRIC_FIELDS
+from checkpoint import atomic_imwrite
+from frame import frame_scope
+from pipelines import PIPELINES, call_stage, list_images, output_name, run_pipeline
+from tracing import print_total_time
+
+
+class _Failed:
+    """A memoised stage exception, re-raised for every pipeline that shares the node."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+class SharedStageCaller:
+    """
+    Stage caller for one image that runs each distinct stage call once across pipelines.
+
+    Parameters:
+        img (np.ndarray): Decoded input.
+        fname (str): Its filename (stage calls passing it are keyed on the token '<fname>').
+        consumers (Counter | None): Requests per call key over all pipelines (from trace_plan);
+                                    outputs are released after their last request.
+        stage (callable): Underlying stage caller.
+        scope (frame.FrameScope | None): Scope that keeps outputs (and their Frame views) alive.
+    """
+
+    def __init__(self, img, fname, consumers=None, stage=call_stage, scope=None):
+        self.fname = fname
+        self.consumers = Counter(consumers or {})
+        self.stage = stage
+        self.scope = scope
+        self._nodes = {id(img): (weakref.ref(img), ("input",))}   # id(array) -> (array, call key that made it)
+        self._memo = {}
+        self.requested = self.executed = 0
+        self.pipeline = None
+        self.stage_times = {}                 # pipeline -> {stage: seconds} for calls it actually ran
+
+    def key(self, name, args, kwargs):
+        def token(v):
+            if isinstance(v, np.ndarray):
+                ref, node = self._nodes.get(id(v), (None, None))
+                return node if ref is not None and ref() is v else ("array", id(v))
+            if isinstance(v, str) and v == self.fname:
+                return "<fname>"
+            return repr(v)
+        return (name, tuple(token(a) for a in args), tuple(sorted((k, token(v)) for k, v in kwargs.items())))
+
+    def __call__(self, name, *args, **kwargs):
+        key = self.key(name, args, kwargs)
+        self.requested += 1
+        if key in self._memo:
+            result = self._memo[key]
+        else:
+            self.executed += 1
+            t0 = time.perf_counter()
+            try:
+                result = self.stage(name, *args, **kwargs)
+            except Exception as e:
+                result = _Failed(e)
+            times = self.stage_times.setdefault(self.pipeline, {})
+            times[name] = times.get(name, 0.0) + time.perf_counter() - t0
+            self._memo[key] = result
+            if isinstance(result, tuple) and isinstance(result[0], np.ndarray):
+                self._nodes[id(result[0])] = (weakref.ref(result[0]), key)
+                if self.scope is not None:
+                    self.scope.own(result[0])
+        self._release(key)
+        if isinstance(result, _Failed):
+            raise result.error
+        return result
+
+    def _release(self, key):
+        if key not in self.consumers:
+            return  # not in the traced plan: kept until the image is done
+        self.consumers[key] -= 1
+        if self.consumers[key] <= 0:
+            # No other pipeline asks for this node again; the running one still holds the array
+            result = self._memo.pop(key, None)
+            if self.scope is not None and isinstance(result, tuple) and isinstance(result[0], np.ndarray):
+                self.scope.release(result[0])
+
+
+def trace_plan(pipelines, probe=None):
+    """
+    Traces the stage DAG of a set of pipelines on a probe image.
+
+    Returns:
+        consumers (Counter): Requests per call key (as built by SharedStageCaller.key).
+        requested (int): Stage calls the pipelines make when run separately.
+        executed (int): Distinct stage calls (DAG nodes).
+    """
+    if probe is None:
+        probe = (np.random.default_rng(0).integers(0, 256, (64, 64, 3), dtype=np.uint8), "probe.jpg")
+    img, fname = probe
+    caller = SharedStageCaller(img, fname)
+    keys = Counter()
+
+    def record(name, *args, **kwargs):
+        keys[caller.key(name, args, kwargs)] += 1
+        return caller(name, *args, **kwargs)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for pipeline in pipelines:
+            try:
+                run_pipeline(pipeline, img, fname, stage=record)
+            except Exception:
+                pass  # the crop failing on noise is fine, every stage call before it was recorded
+    return keys, caller.requested, caller.executed
+
+
+def run_fanout(pipelines, raw_dir='data/raw_images', out_dir='data/processed_images', metrics_path=None,
+               files=None, ledger_path=None):
+    """
+    Decodes each image once and runs it through every pipeline, sharing common stage calls.
+
+    Parameters:
+        pipelines (list[str]): Pipeline keys, e.g. ['p1', 'p7', 'p12'].
+        raw_dir (str): Folder of raw images.
+        out_dir (str): Folder for every pipeline's outputs (filename + pipeline suffix).
+        metrics_path (str | None): Write batch_post.frame_metrics rows (one per image and pipeline) to this CSV;
+                                   pipelines whose outputs are the same node share one computation.
+        files (list[str] | None): Explicit image paths instead of everything in raw_dir.
+        ledger_path (str | None): Record one run per pipeline in this runtime ledger (see ledger.py);
+                                  a shared stage's time is charged to the first pipeline that ran it.
+
+    Returns:
+        ok (int): Outputs saved (images x pipelines).
+        fail (int): Outputs that failed.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    if files is None:
+        files = list_images(raw_dir)
+    if not files:
+        print(f"No images found in {raw_dir}")
+        return 0, 0
+
+    consumers, requested, executed = trace_plan(pipelines)
+    print(f"{len(pipelines)} pipelines: {requested} stage calls per image, {executed} after sharing")
+
+    metrics_file = writer = None
+    if metrics_path:
+        from batch_post import frame_metrics
+        metrics_file = open(metrics_path, "w", newline="")
+        writer = csv.DictWriter(metrics_file, fieldnames=METRIC_FIELDS)
+        writer.writeheader()
+
+    ledger, run_ids = None, {}
+    if ledger_path:
+        from ledger import RuntimeLedger
+        ledger = RuntimeLedger(ledger_path)
+        run_ids = {p: ledger.start_run(p, {"fanout": list(pipelines), "n_files": len(files)}) for p in pipelines}
+    counts = {p: [0, 0] for p in pipelines}
+
+    start_time = time.time()
+    ok = fail = 0
+    try:
+        for in_path in files:
+            fname = os.path.basename(in_path)
+            t0 = time.perf_counter()
+            img = cv2.imread(in_path)
+            decode_s = time.perf_counter() - t0
+            if img is None:
+                fail += len(pipelines)
+                print(f"[FAIL] {fname}: cv2.imread returned None")
+                for p in pipelines:
+                    counts[p][1] += 1
+                    if ledger is not None:
+                        ledger.record_image(run_ids[p], fname, None, "fail", None, {"decode": decode_s},
+                                            "cv2.imread returned None")
+                continue
+
+            outputs = {}
+            with frame_scope() as scope:
+                scope.own(img)
+                caller = SharedStageCaller(img, fname, consumers, scope=scope)
+                for p in pipelines:
+                    caller.pipeline = p
+                    try:
+                        final_img, _ = run_pipeline(p, img, fname, stage=caller)
+                        out_name = output_name(fname, p)
+                        atomic_imwrite(os.path.join(out_dir, out_name), final_img)
+                        # Owned until the image is done, so pipelines ending on the same node share metrics
+                        outputs[p] = (out_name, scope.own(final_img))
+                        counts[p][0] += 1
+                        ok += 1
+                        print(f"[OK] {fname} -> {out_name}")
+                        status, error = "ok", None
+                    except Exception as e:
+                        counts[p][1] += 1
+                        fail += 1
+                        print(f"[FAIL] {fname} ({p}): {e}")
+                        status, error = "fail", str(e)
+                    if ledger is not None:
+                        times = {"decode": decode_s if p == pipelines[0] else 0.0,
+                                 **caller.stage_times.get(p, {})}
+                        ledger.record_image(run_ids[p], fname, img.shape, status, sum(times.values()),
+                                            times, error)
+
+                if writer is not None:
+                    for p, (out_name, frame) in outputs.items():
+                        writer.writerow({"image_name": out_name, "pipeline": p, **frame_metrics(frame)})
+    finally:
+        if metrics_file is not None:
+            metrics_file.close()
+        if ledger is not None:
+            for p in pipelines:
+                ledger.finish_run(run_ids[p], *counts[p])
+
+    print(f"\nDone. Saved {ok}. Failed {fail}. Output: {out_dir}")
+    for p in pipelines:
+        print(f"  {p:<5} saved {counts[p][0]}, failed {counts[p][1]}")
+    print_total_time(start_time)
+    return ok, fail
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pipelines", default=",".join(p for p in PIPELINES if p != "p0"),
+                        help="Comma-separated pipeline keys (default: p1-p13)")
+    parser.add_argument("--raw", default="data/raw_images", help="Input folder (default: %(default)s)")
+    parser.add_argument("--out", default="data/processed_images", help="Output folder (default: %(default)s)")
+    parser.add_argument("--metrics", default=None, help="Write per-image, per-pipeline quality metrics to this CSV")
+    parser.add_argument("--ledger", default="data/runtime_ledger.sqlite",
+                        help="SQLite runtime ledger to append timings to (default: %(default)s)")
+    parser.add_argument("--no-ledger", action="store_true", help="Do not record this run in the ledger")
+    args = parser.parse_args(argv)
+
+    pipelines = [p.strip() for p in args.pipelines.split(",") if p.strip()]
+    unknown = [p for p in pipelines if p not in PIPELINES]
+    if unknown:
+        parser.error(f"unknown pipelines {unknown}, expected some of {list(PIPELINES)}")
+    ok, fail = run_fanout(pipelines, args.raw, args.out, args.metrics,
+                          ledger_path=None if args.no_ledger else args.ledger)
+    return 1 if fail and not ok else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
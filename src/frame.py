@@ -0,0 +1,185 @@
+"""
+Frames with memoised derived views.
+
+Several stages and the quality checks derive the same data from one image: the
+homomorphic, CLAHE and top-hat stages all start from its LAB conversion,
+otsu_threshold and contour_crop_eye from its grayscale, the quality gate and
+the output metrics (batch_post.frame_metrics) from the grayscale histogram and
+Laplacian, and the edge metrics (batch_post.edge_metrics) from the Sobel
+gradient magnitude. A Frame computes each view the first time it is asked for and
+keeps it until its pixels change.
+
+run_pipeline opens a frame_scope, so every array flowing through a pipeline
+(the decoded input and each stage's output) is registered and a stage can ask
+Frame.of(image) for the shared views instead of converting again. Registered
+arrays are made read-only for the scope's lifetime, so an in-place write fails
+loudly instead of leaving stale views; write through Frame.edit() or assign
+Frame.pixels, both of which drop the cached views.
+
+    with frame_scope() as scope:
+        frame = scope.own(img)
+        gray = frame.gray()                     # computed
+        gray = Frame.of(img).gray()             # same array, from the cache
+"""
+import threading
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+# id(array) -> [Frame, references, writeable before], for arrays owned by an open frame_scope
+_REGISTRY = {}
+_LOCK = threading.Lock()
+
+
+def _frozen(view):
+    view.flags.writeable = False
+    return view
+
+
+class Frame:
+    """
+    One image plus lazily computed, memoised derived views.
+
+    Views are returned read-only and shared; copy one before modifying it.
+
+    Parameters:
+        pixels (np.ndarray): BGR (H, W, 3) or grayscale (H, W) uint8 image.
+    """
+
+    def __init__(self, pixels):
+        self._pixels = pixels
+        self._views = {}
+
+    @classmethod
+    def of(cls, image):
+        """The registered Frame of an array (or the Frame itself); a private Frame for anything else."""
+        if isinstance(image, Frame):
+            return image
+        entry = _REGISTRY.get(id(image))
+        if entry is not None and entry[0]._pixels is image:
+            return entry[0]
+        return cls(image)
+
+    @property
+    def pixels(self):
+        return self._pixels
+
+    @pixels.setter
+    def pixels(self, new_pixels):
+        self._pixels = new_pixels
+        self.invalidate()
+
+    @contextmanager
+    def edit(self):
+        """Writable pixels for in-place changes; cached views are dropped afterwards."""
+        was_writeable = self._pixels.flags.writeable
+        self._pixels.flags.writeable = True
+        try:
+            yield self._pixels
+        finally:
+            self._pixels.flags.writeable = was_writeable
+            self.invalidate()
+
+    def invalidate(self):
+        self._views.clear()
+
+    def _view(self, key, compute):
+        view = self._views.get(key)
+        if view is None:
+            view = self._views[key] = compute()
+        return view
+
+    def gray(self):
+        """Grayscale (H, W) uint8 (the pixels themselves for a grayscale frame)."""
+        if self._pixels.ndim == 2:
+            return self._pixels
+        return self._view("gray", lambda: _frozen(cv2.cvtColor(self._pixels, cv2.COLOR_BGR2GRAY)))
+
+    def lab(self):
+        """cv2 COLOR_BGR2LAB conversion, (H, W, 3) uint8."""
+        return self._view("lab", lambda: _frozen(cv2.cvtColor(self._pixels, cv2.COLOR_BGR2LAB)))
+
+    def blurred_gray(self, kernel_size=(5, 5), sigma=0):
+        """cv2.GaussianBlur of the grayscale view."""
+        key = ("blurred_gray", tuple(kernel_size), sigma)
+        return self._view(key, lambda: _frozen(cv2.GaussianBlur(self.gray(), tuple(kernel_size), sigma)))
+
+    def histogram(self):
+        """256-bin grayscale histogram (int64 counts)."""
+        return self._view("histogram", lambda: _frozen(np.bincount(self.gray().ravel(), minlength=256)))
+
+    def sobel_magnitude(self, ksize=3):
+        """Gradient magnitude sqrt(gx^2 + gy^2) of the grayscale view, float32."""
+        def compute():
+            gray = self.gray()
+            gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=ksize)
+            gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=ksize)
+            return _frozen(cv2.magnitude(gx, gy))
+        return self._view(("sobel", ksize), compute)
+
+    def laplacian_var(self):
+        """Variance of the grayscale Laplacian (CV_64F), a sharpness measure."""
+        return self._view("laplacian_var", lambda: float(cv2.Laplacian(self.gray(), cv2.CV_64F).var()))
+
+
+class FrameScope:
+    """Registers arrays as Frames until the scope closes (see frame_scope)."""
+
+    def __init__(self):
+        self._owned = []
+
+    def own(self, image):
+        """
+        Registers an ndarray (other values pass through) and makes it read-only
+        until the scope closes. Returns its Frame, or the value unchanged.
+        """
+        if not isinstance(image, np.ndarray):
+            return image
+        with _LOCK:
+            entry = _REGISTRY.get(id(image))
+            if entry is None or entry[0]._pixels is not image:
+                entry = _REGISTRY[id(image)] = [Frame(image), 0, image.flags.writeable]
+                image.flags.writeable = False
+            entry[1] += 1
+        self._owned.append(image)
+        return entry[0]
+
+    def release(self, image):
+        """Gives up this scope's claim on one owned array before the scope closes."""
+        for i, owned in enumerate(self._owned):
+            if owned is image:
+                del self._owned[i]
+                with _LOCK:
+                    _unregister(image)
+                return
+
+    def close(self):
+        with _LOCK:
+            for image in self._owned:
+                _unregister(image)
+        self._owned.clear()
+
+
+def _unregister(image):
+    entry = _REGISTRY.get(id(image))
+    if entry is None:
+        return
+    entry[1] -= 1
+    if entry[1] == 0:
+        del _REGISTRY[id(image)]
+        # Frame.pixels may have been reassigned; restore the array that was registered
+        try:
+            image.flags.writeable = entry[2]
+        except ValueError:
+            pass  # a view whose base is still owned elsewhere stays read-only
+
+
+@contextmanager
+def frame_scope():
+    """Context manager yielding a FrameScope; owned arrays get their views dropped and writability back on exit."""
+    scope = FrameScope()
+    try:
+        yield scope
+    finally:
+        scope.close()
@@ -1,3 +1,7 @@
+import os
+import cv2
+import numpy as np
+
 def gaussian_denoise(
     img_or_filename,
     fname=None,
@@ -21,10 +25,6 @@ def gaussian_denoise(
         denoised_img (np.ndarray): Blurred (denoised) image in BGR.
         base_filename (str): Base filename (no directory), for downstream saving.
     """
-    import os
-    import cv2
-    import numpy as np
-
     # Case 1: Input is already an image array
     if isinstance(img_or_filename, np.ndarray):
         if fname is None:
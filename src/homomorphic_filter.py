@@ -2,6 +2,8 @@ import os
 import cv2
 import numpy as np
 
+from frame import Frame
+
 def homomorphic_filter_color(
     img_or_filename,
     fname=None,
@@ -43,7 +45,7 @@ def homomorphic_filter_color(
             raise ValueError(f"Image not found: {image_path}")
 
     # Convert to LAB and split channels
-    lab = cv2.cvtColor(bgr, cv2.COLOR_BGR2LAB)
+    lab = Frame.of(bgr).lab()
     l, a, b = cv2.split(lab)
 
     # Normalize L to [0,1] and apply log transform
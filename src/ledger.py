@@ -0,0 +1,346 @@
+"""
+Runtime ledger: per-image, per-stage timings of every pipeline run in SQLite.
+
+batch_runner.py (and the --workers / shards paths built on it) appends one row
+per run (host, versions, git commit, pipeline configuration), one row per image
+(input resolution, status, total seconds) and one row per stage call, so
+deployment cost can be compared across runs and machines later:
+
+    python src/ledger.py runs   --db data/runtime_ledger.sqlite
+    python src/ledger.py report --db data/runtime_ledger.sqlite [--pipeline p7 --host edge01]
+    python src/ledger.py plot   --db data/runtime_ledger.sqlite --out figures/runtime
+    python src/ledger.py export --db data/runtime_ledger.sqlite --output runtime.csv   # boxplot.py input
+
+The ledger uses SQLite's rollback journal, not WAL: shard workers on several
+nodes append to one ledger on the shared filesystem (shards.py init --ledger),
+and WAL needs shared memory on a single host. Like the shard coordinator, it
+relies on the mount's POSIX locks.
+"""
+import os
+import json
+import time
+import socket
+import sqlite3
+import platform
+import argparse
+import subprocess
+from contextlib import contextmanager
+
+DEFAULT_LEDGER = "data/runtime_ledger.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT, started REAL, finished REAL, pipeline TEXT,
+    config TEXT, host TEXT, platform TEXT, cpu_count INTEGER, python TEXT, numpy TEXT,
+    opencv TEXT, git_commit TEXT, n_ok INTEGER, n_fail INTEGER);
+CREATE TABLE IF NOT EXISTS images (
+    run_id INTEGER, image_name TEXT, height INTEGER, width INTEGER, status TEXT,
+    total_s REAL, error TEXT);
+CREATE TABLE IF NOT EXISTS stages (
+    run_id INTEGER, image_name TEXT, stage TEXT, seconds REAL);
+CREATE INDEX IF NOT EXISTS images_run ON images (run_id);
+CREATE INDEX IF NOT EXISTS stages_run ON stages (run_id, stage);
+"""
+
+
+def host_info():
+    """Machine and library versions stored with every run."""
+    import cv2
+    import numpy as np
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "host": socket.gethostname(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "git_commit": commit,
+    }
+
+
+def timed_stage_caller(stage, stage_times):
+    """Wraps a stage caller so each call's seconds are added to stage_times[name]."""
+    def call(name, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return stage(name, *args, **kwargs)
+        finally:
+            stage_times[name] = stage_times.get(name, 0.0) + time.perf_counter() - t0
+    return call
+
+
+class RuntimeLedger:
+    """
+    Append-only SQLite store of run timings. Rows are buffered and written in
+    batches; finish_run flushes what is left.
+
+    Parameters:
+        db_path (str): SQLite file, created if missing.
+        flush_every (int): Image rows buffered before a write.
+
+    Note: safe to share between hosts over a filesystem with POSIX locking,
+    because it stays in rollback-journal mode (see module docstring).
+    """
+
+    def __init__(self, db_path=DEFAULT_LEDGER, flush_every=200):
+        self.db_path = db_path
+        self.flush_every = flush_every
+        self._images, self._stages = [], []
+        if os.path.dirname(os.path.abspath(db_path)):
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            # Rollback journal (also turns a ledger left in WAL mode back)
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=60)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def start_run(self, pipeline, config=None):
+        """Records a new run and returns its run_id."""
+        info = host_info()
+        with self._connect() as conn:
+            cur = conn.execute(
+                "INSERT INTO runs (started, pipeline, config, host, platform, cpu_count, python, numpy, opencv, "
+                "git_commit) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), pipeline, json.dumps(config or {}, sort_keys=True), info["host"], info["platform"],
+                 info["cpu_count"], info["python"], info["numpy"], info["opencv"], info["git_commit"]))
+            return cur.lastrowid
+
+    def record_image(self, run_id, image_name, shape, status, total_s, stage_times=None, error=None):
+        """
+        Buffers one image's result.
+
+        Parameters:
+            shape (tuple | None): Input (height, width, ...) if it was decoded.
+            status (str): 'ok', 'fail' or 'rejected'.
+            total_s (float | None): Decode + pipeline seconds.
+            stage_times (dict[str, float] | None): Seconds per stage (and 'decode').
+        """
+        h, w = shape[:2] if shape is not None else (None, None)
+        self._images.append((run_id, image_name, h, w, status, total_s, error))
+        self._stages.extend((run_id, image_name, s, t) for s, t in (stage_times or {}).items())
+        if len(self._images) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._images and not self._stages:
+            return
+        with self._connect() as conn:
+            conn.executemany("INSERT INTO images VALUES (?, ?, ?, ?, ?, ?, ?)", self._images)
+            conn.executemany("INSERT INTO stages VALUES (?, ?, ?, ?)", self._stages)
+        self._images, self._stages = [], []
+
+    def finish_run(self, run_id, ok, fail):
+        self.flush()
+        with self._connect() as conn:
+            conn.execute("UPDATE runs SET finished = ?, n_ok = ?, n_fail = ? WHERE run_id = ?",
+                         (time.time(), ok, fail, run_id))
+
+
+# =========================
+# Queries and reports (pandas / matplotlib only needed here)
+# =========================
+def _filters(pipeline=None, host=None, since_days=None, run_ids=None):
+    clauses, params = [], []
+    if pipeline:
+        clauses.append("r.pipeline = ?")
+        params.append(pipeline)
+    if host:
+        clauses.append("r.host = ?")
+        params.append(host)
+    if since_days is not None:
+        clauses.append("r.started >= ?")
+        params.append(time.time() - since_days * 86400)
+    if run_ids:
+        clauses.append(f"r.run_id IN ({','.join('?' * len(run_ids))})")
+        params.extend(run_ids)
+    return (" AND " + " AND ".join(clauses) if clauses else ""), params
+
+
+def load_runs(db_path):
+    import pandas as pd
+
+    with sqlite3.connect(db_path) as conn:
+        return pd.read_sql_query("SELECT * FROM runs ORDER BY run_id", conn)
+
+
+def load_image_times(db_path, **filters):
+    """
+    Successful images with their run context and one column per stage.
+
+    Returns:
+        df (pd.DataFrame): run_id, pipeline, host, image_name, height, width, megapixels,
+                           total_s, then '<stage>' seconds columns.
+    """
+    import pandas as pd
+
+    where, params = _filters(**filters)
+    with sqlite3.connect(db_path) as conn:
+        images = pd.read_sql_query(
+            "SELECT i.run_id, r.pipeline, r.host, i.image_name, i.height, i.width, i.total_s "
+            f"FROM images i JOIN runs r USING (run_id) WHERE i.status = 'ok'{where}", conn, params=params)
+        stages = pd.read_sql_query(
+            "SELECT s.run_id, s.image_name, s.stage, s.seconds "
+            f"FROM stages s JOIN runs r USING (run_id) WHERE 1 = 1{where}", conn, params=params)
+    if not stages.empty:
+        wide = stages.pivot_table(index=["run_id", "image_name"], columns="stage", values="seconds", aggfunc="sum")
+        images = images.merge(wide.reset_index(), on=["run_id", "image_name"], how="left")
+    images["megapixels"] = images["height"] * images["width"] / 1e6
+    return images
+
+
+def throughput_table(df):
+    """Per pipeline / host / resolution: images, median and p95 s/image, images/sec and stage medians (ms)."""
+    import pandas as pd
+
+    stage_cols = [c for c in df.columns if c not in
+                  {"run_id", "pipeline", "host", "image_name", "height", "width", "megapixels", "total_s"}]
+    df = df.assign(resolution=df["height"].astype("Int64").astype(str) + "x" + df["width"].astype("Int64").astype(str))
+    rows = []
+    for (pipeline, host, resolution), g in df.groupby(["pipeline", "host", "resolution"], sort=False):
+        row = {
+            "pipeline": pipeline, "host": host, "resolution": resolution,
+            "runs": g["run_id"].nunique(), "images": len(g),
+            "median_s": g["total_s"].median(), "p95_s": g["total_s"].quantile(0.95),
+            "images_per_sec": len(g) / g["total_s"].sum(),
+        }
+        row.update({f"{s}_ms": g[s].median() * 1000 for s in stage_cols if g[s].notna().any()})
+        rows.append(row)
+    table = pd.DataFrame(rows)
+    if table.empty:
+        return table
+    order = table["pipeline"].str.extract(r"(\d+)", expand=False).astype(float)
+    return table.assign(_o=order).sort_values(["_o", "host", "resolution"]).drop(columns="_o")
+
+
+def plot_runtime(df, out_dir):
+    """
+    boxplot.py-style figures: seconds per image across pipelines (p0 gray, others
+    blue), plus one per-stage breakdown per pipeline.
+
+    Returns:
+        paths (list[str]): Saved PNGs.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib.lines import Line2D
+
+    matplotlib.rcParams["font.family"] = "Times New Roman"
+    matplotlib.rcParams["font.size"] = 12
+    os.makedirs(out_dir, exist_ok=True)
+    ordered = sorted(df["pipeline"].unique(), key=lambda p: int(p.lstrip("p") or 0))
+    paths = []
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    box = ax.boxplot([df.loc[df["pipeline"] == p, "total_s"] for p in ordered], patch_artist=True, widths=0.7,
+                     flierprops=dict(marker="o", markersize=3, linestyle="none", markerfacecolor="black", alpha=0.6))
+    # Tick labels set separately: boxplot's labels= keyword was renamed in matplotlib 3.9
+    ax.set_xticks(range(1, len(ordered) + 1), ordered)
+    for patch, p in zip(box["boxes"], ordered):
+        patch.set_facecolor("lightgray" if p == "p0" else "#4C72B0")
+        patch.set_alpha(0.7)
+    ax.set_title("Runtime per Image Across Pre-processing Pipelines", fontsize=16, pad=20)
+    ax.set_xlabel("Pipeline", fontsize=14)
+    ax.set_ylabel("Seconds per Image", fontsize=14)
+    ax.yaxis.grid(True, linestyle="--", alpha=0.4)
+    ax.legend(handles=[Line2D([0], [0], color="lightgray", lw=6, label="p0 = Baseline (Raw)"),
+                       Line2D([0], [0], color="#4C72B0", lw=6, label="p(n) = Pipeline n")],
+              loc="upper left", bbox_to_anchor=(1.02, 1), frameon=False)
+    plt.tight_layout()
+    paths.append(os.path.join(out_dir, "runtime_per_image.png"))
+    plt.savefig(paths[-1], dpi=300, bbox_inches="tight")
+    plt.close(fig)
+
+    stage_cols = [c for c in df.columns if c not in
+                  {"run_id", "pipeline", "host", "image_name", "height", "width", "megapixels", "total_s"}]
+    for p in ordered:
+        g = df[df["pipeline"] == p]
+        cols = [c for c in stage_cols if g[c].notna().any()]
+        if not cols:
+            continue
+        fig, ax = plt.subplots(figsize=(8, 6))
+        ax.boxplot([g[c].dropna() * 1000 for c in cols], patch_artist=True, widths=0.7,
+                   boxprops=dict(facecolor="#4C72B0", alpha=0.7),
+                   flierprops=dict(marker="o", markersize=3, linestyle="none", markerfacecolor="black", alpha=0.6))
+        ax.set_xticks(range(1, len(cols) + 1), cols)
+        ax.set_title(f"Stage Runtime in {p}", fontsize=16, pad=20)
+        ax.set_ylabel("Milliseconds per Image", fontsize=14)
+        ax.yaxis.grid(True, linestyle="--", alpha=0.4)
+        plt.setp(ax.get_xticklabels(), rotation=30, ha="right")
+        plt.tight_layout()
+        paths.append(os.path.join(out_dir, f"runtime_stages_{p}.png"))
+        plt.savefig(paths[-1], dpi=300, bbox_inches="tight")
+        plt.close(fig)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_ in [("runs", "List recorded runs"), ("report", "Throughput table per pipeline/host/resolution"),
+                        ("plot", "Runtime boxplots per pipeline"), ("export", "Per-image runtimes as CSV/Excel")]:
+        p = sub.add_parser(name, help=help_)
+        p.add_argument("--db", default=DEFAULT_LEDGER)
+        p.add_argument("--pipeline", default=None)
+        p.add_argument("--host", default=None)
+        p.add_argument("--since-days", type=float, default=None)
+        p.add_argument("--runs", default=None, help="Comma-separated run ids")
+    sub.choices["report"].add_argument("--output", default=None, help="Also save the table (.csv or .xlsx)")
+    sub.choices["plot"].add_argument("--out", default="Pipeline_Images/figures_dissertation")
+    sub.choices["export"].add_argument("--output", required=True, help=".csv or .xlsx")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        parser.error(f"no ledger at {args.db}")
+    filters = {"pipeline": args.pipeline, "host": args.host, "since_days": args.since_days,
+               "run_ids": [int(r) for r in args.runs.split(",")] if args.runs else None}
+
+    if args.command == "runs":
+        runs = load_runs(args.db)
+        runs["started"] = runs["started"].map(lambda t: time.strftime("%Y-%m-%d %H:%M", time.localtime(t)))
+        print(runs[["run_id", "started", "pipeline", "host", "git_commit", "n_ok", "n_fail", "config"]]
+              .to_string(index=False))
+        return 0
+
+    df = load_image_times(args.db, **filters)
+    if df.empty:
+        print("No successful images match.")
+        return 1
+
+    if args.command == "report":
+        table = throughput_table(df)
+        print(table.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+        if args.output:
+            save = table.to_excel if args.output.endswith(".xlsx") else table.to_csv
+            save(args.output, index=False)
+            print(f"\nSaved to {args.output}")
+    elif args.command == "plot":
+        for path in plot_runtime(df, args.out):
+            print(f"Saved {path}")
+    elif args.command == "export":
+        # image_name + pipeline + numeric columns: the layout boxplot.py reads
+        cols = ["image_name", "pipeline", "total_s", "megapixels"] + \
+               [c for c in df.columns if c not in {"run_id", "pipeline", "host", "image_name", "height", "width",
+                                                   "megapixels", "total_s"}]
+        save = df[cols].to_excel if args.output.endswith(".xlsx") else df[cols].to_csv
+        save(args.output, index=False)
+        print(f"{len(df)} rows saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
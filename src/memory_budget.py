@@ -0,0 +1,411 @@
+"""
+Memory-budget-aware scheduling of pipeline workers.
+
+Every stage declares its estimated peak memory as a function of the input shape
+(STAGE_MEMORY). A pipeline's estimate is its input frame, the intermediate
+outputs it keeps alive and the largest stage peak. The scheduler only admits an
+image to the worker pool while the estimates of everything in flight stay under
+the budget, so e.g. several p12 workers (homomorphic FFTs plus float64 wavelet
+copies) cannot exhaust RAM on a small box.
+
+Workers measure the peak of every stage with tracemalloc and the observations
+can be saved to a profile file for the next run. tracemalloc only sees
+allocations made through Python's allocator (NumPy arrays, not most of OpenCV's
+native buffers), so an observation can raise a stage's estimate above its
+declared STAGE_MEMORY but never lower it:
+
+    python src/batch_runner.py p12 --workers 4 --memory-budget 3000 --memory-profile mem.json
+    python src/memory_budget.py p12 p13 --size 2400x4600 --profile mem.json
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import struct
+import time
+import tracemalloc
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+
+from checkpoint import atomic_imwrite
+from pipelines import PIPELINES, call_stage, list_images, output_name, run_pipeline, stages_used
+from tracing import print_total_time
+
+# Crop stages return a 600x600 BGR frame whatever the input size
+_CROP_BYTES = 600 * 600 * 3
+
+# Peak memory of each stage above its input, in bytes, for an (h, w) BGR input.
+# Measured with tracemalloc on 1200x2300 and 2400x4600 frames and rounded up.
+STAGE_MEMORY = {
+    # LAB planes + float32 log L, then complex128 FFT, shifted, filtered and inverse
+    # arrays (16 B/px each, up to 4 alive) and the float32 U/V/D/H grids
+    "homomorphic_filter_color": lambda h, w: 84 * h * w,
+    "clahe_preserve_color": lambda h, w: 13 * h * w,
+    "tophat_extract_l_channel": lambda h, w: 14 * h * w,
+    # float64 RGB, Lab and lab2rgb copies (24 B/px each) plus the wavelet coefficients
+    "wavelet_denoise_lab_cv": lambda h, w: 190 * h * w,
+    "gaussian_denoise": lambda h, w: 3 * h * w,
+    "otsu_threshold": lambda h, w: 3 * h * w,
+    "contour_crop_eye": lambda h, w: 5 * h * w + _CROP_BYTES,
+    "contour_crop_binary": lambda h, w: h * w + _CROP_BYTES,
+    # Works on a fixed 0.2x downscale
+    "hough_crop_eye": lambda h, w: h * w + _CROP_BYTES,
+}
+
+# Estimates from observed peaks are scaled up by this much
+SAFETY_MARGIN = 1.2
+
+# After a worker crash the budget drops to this fraction of what was admitted
+CRASH_BACKOFF = 0.5
+
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def image_shape(path):
+    """
+    (height, width) of an image without decoding it: read from the JPEG SOF or PNG
+    IHDR header, falling back to a 1/8 decode for anything else.
+    """
+    with open(path, "rb") as f:
+        head = f.read(256 * 1024)
+    if head[:8] == b"\x89PNG\r\n\x1a\n":
+        w, h = struct.unpack(">II", head[16:24])
+        return h, w
+    if head[:2] == b"\xff\xd8":
+        i = 2
+        while i + 9 <= len(head):
+            if head[i] != 0xFF:
+                break
+            marker = head[i + 1]
+            if marker == 0xFF:  # fill byte
+                i += 1
+                continue
+            if marker in _SOF_MARKERS:
+                h, w = struct.unpack(">HH", head[i + 5:i + 9])
+                return h, w
+            i += 2 + struct.unpack(">H", head[i + 2:i + 4])[0]
+
+    thumb = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if thumb is None:
+        raise ValueError(f"Image not found or unreadable: {path}")
+    return thumb.shape[0] * 8, thumb.shape[1] * 8
+
+
+class MemoryModel:
+    """
+    Peak-memory estimates for stages and pipelines, raised by observed peaks.
+
+    Parameters:
+        profile_path (str | None): JSON file of observed peaks (bytes per input pixel,
+                                   per stage) to start from and save to.
+        margin (float): Factor applied to observed peaks.
+    """
+
+    def __init__(self, profile_path=None, margin=SAFETY_MARGIN):
+        self.profile_path = profile_path
+        self.margin = margin
+        self.observed = {}
+        self._stages = {}
+        if profile_path and os.path.exists(profile_path):
+            with open(profile_path) as f:
+                self.observed = json.load(f)
+
+    def stage_bytes(self, stage, shape):
+        """
+        Estimated peak bytes of one stage for an input of this shape: the declared
+        STAGE_MEMORY estimate, or the observed peak (with margin) if that is larger.
+        """
+        h, w = shape[:2]
+        declared = STAGE_MEMORY[stage](h, w)
+        if stage in self.observed:
+            return max(declared, int(self.observed[stage] * h * w * self.margin))
+        return declared
+
+    def pipeline_bytes(self, pipeline, shape):
+        """
+        Estimated peak bytes of one pipeline run: the decoded input, one BGR frame per
+        stage output (the compositions keep intermediates referenced) and the largest
+        stage peak.
+        """
+        if pipeline not in self._stages:
+            self._stages[pipeline] = stages_used(pipeline)
+        stages = self._stages[pipeline]
+        h, w = shape[:2]
+        frame = h * w * 3
+        return frame * (1 + len(stages)) + max((self.stage_bytes(s, shape) for s in stages), default=0)
+
+    def observe(self, stage, shape, peak_bytes):
+        """Records a measured stage peak; the largest bytes-per-pixel seen is kept (see stage_bytes)."""
+        h, w = shape[:2]
+        ratio = peak_bytes / (h * w)
+        self.observed[stage] = max(self.observed.get(stage, 0.0), ratio)
+
+    def save(self, path=None):
+        path = path or self.profile_path
+        if not path:
+            return
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.observed, f, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+
+
+def _init_worker(observe):
+    if observe:
+        tracemalloc.start()
+
+
+def _process_image(pipeline, in_path, out_dir, observe):
+    """Worker task: decode, run the pipeline, save. Returns a result dict for the scheduler."""
+    peaks, stage_times = {}, {}
+
+    def stage(name, *args, **kwargs):
+        t0 = time.perf_counter()
+        if observe:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        try:
+            return call_stage(name, *args, **kwargs)
+        finally:
+            stage_times[name] = stage_times.get(name, 0.0) + time.perf_counter() - t0
+            if observe:
+                peaks[name] = max(peaks.get(name, 0), tracemalloc.get_traced_memory()[1] - before)
+
+    result = {"in_path": in_path, "peaks": peaks, "stage_times": stage_times, "shape": None,
+              "total_s": None, "error": None}
+    t0 = time.perf_counter()
+    try:
+        img = cv2.imread(in_path)
+        stage_times["decode"] = time.perf_counter() - t0
+        if img is None:
+            raise RuntimeError("cv2.imread returned None")
+        result["shape"] = img.shape[:2]
+        final_img, fname = run_pipeline(pipeline, img, os.path.basename(in_path), stage=stage)
+        result["total_s"] = time.perf_counter() - t0
+        result["out_name"] = output_name(fname, pipeline)
+        atomic_imwrite(os.path.join(out_dir, result["out_name"]), final_img)
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def _failed_result(in_path, shape, error):
+    """Result dict (as returned by _process_image) for an image that failed outside a worker."""
+    return {"in_path": in_path, "peaks": {}, "stage_times": {}, "shape": shape, "total_s": None, "error": error}
+
+
+class MemoryBudgetScheduler:
+    """
+    Runs a pipeline over images in a process pool, admitting an image only while
+    the summed estimates of the images in flight stay under budget_mb.
+
+    Images are admitted in order. An image whose estimate alone exceeds the budget
+    runs by itself once everything else has finished.
+
+    If a worker dies (usually the OOM killer) the pool breaks and every image in
+    flight is lost with it. The scheduler then starts a new pool, lowers the budget
+    to CRASH_BACKOFF times what was admitted at the crash and requeues the lost
+    images; an image lost more than `retries` times is counted as failed.
+
+    Parameters:
+        budget_mb (float | None): Memory budget for the images in flight, in MB (None = no limit).
+        workers (int | None): Pool size (default: CPU count).
+        model (MemoryModel | None): Estimates to use and refine.
+        observe (bool): Measure stage peaks in the workers (tracemalloc, some overhead).
+        on_result (callable | None): Called with the result dict of every image, including ones
+                                     that failed before reaching a worker (e.g. to log timings).
+        retries (int): Times an image lost to a worker crash is run again.
+    """
+
+    def __init__(self, budget_mb, workers=None, model=None, observe=True, on_result=None, retries=1):
+        self.budget = budget_mb * 1024 ** 2 if budget_mb is not None else float("inf")
+        self.workers = workers or os.cpu_count() or 1
+        self.model = model or MemoryModel()
+        self.observe = observe
+        self.on_result = on_result
+        self.retries = retries
+        self.peak_admitted = 0
+        self.crashes = 0
+
+    def _pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=mp.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(self.observe,))
+
+    def run(self, pipeline, files, out_dir):
+        """
+        Returns:
+            ok (int): Number of images saved.
+            fail (int): Number of images that failed.
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        queue = deque(files)
+        shapes, in_flight, lost_count = {}, {}, {}
+        used = ok = fail = 0
+
+        pool = self._pool()
+        try:
+            while queue or in_flight:
+                # Admit from the head of the queue while it fits
+                while queue and len(in_flight) < self.workers:
+                    in_path = queue[0]
+                    try:
+                        if in_path not in shapes:
+                            shapes[in_path] = image_shape(in_path)
+                        estimate = self.model.pipeline_bytes(pipeline, shapes[in_path])
+                    except Exception as e:
+                        # Never reaches a worker, but is journalled and logged like one that failed
+                        queue.popleft()
+                        fail += 1
+                        print(f"[FAIL] {os.path.basename(in_path)}: {e}")
+                        if self.on_result is not None:
+                            self.on_result(_failed_result(in_path, shapes.get(in_path), str(e)))
+                        continue
+                    if in_flight and used + estimate > self.budget:
+                        break
+                    if estimate > self.budget:
+                        print(f"[WARN] {os.path.basename(in_path)}: estimated {estimate / 1024 ** 2:.0f} MB "
+                              f"exceeds the {self.budget / 1024 ** 2:.0f} MB budget, running it alone")
+                    queue.popleft()
+                    future = pool.submit(_process_image, pipeline, in_path, out_dir, self.observe)
+                    in_flight[future] = (in_path, estimate)
+                    used += estimate
+                    self.peak_admitted = max(self.peak_admitted, used)
+
+                if not in_flight:
+                    continue
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                admitted = used
+                crashed = any(isinstance(f.exception(), BrokenProcessPool) for f in done)
+                if crashed:
+                    # The broken pool fails every other pending future too; collect them all
+                    pool.shutdown(wait=True)
+                    done = set(in_flight)
+
+                lost = []
+                for future in done:
+                    in_path, estimate = in_flight.pop(future)
+                    used -= estimate
+                    if isinstance(future.exception(), BrokenProcessPool):
+                        lost.append(in_path)
+                        continue
+                    result = future.result()
+                    fname = os.path.basename(result["in_path"])
+                    for stage_name, peak in result["peaks"].items():
+                        self.model.observe(stage_name, result["shape"], peak)
+                    if self.on_result is not None:
+                        self.on_result(result)
+                    if result["error"] is None:
+                        ok += 1
+                        print(f"[OK] {fname} -> {result['out_name']}")
+                    else:
+                        fail += 1
+                        print(f"[FAIL] {fname}: {result['error']}")
+
+                if crashed:
+                    self.crashes += 1
+                    self.budget = min(self.budget, admitted) * CRASH_BACKOFF
+                    print(f"[WARN] A worker died with {len(lost)} images in flight "
+                          f"({admitted / 1024 ** 2:.0f} MB admitted); budget lowered to "
+                          f"{self.budget / 1024 ** 2:.0f} MB")
+                    retry = []
+                    for in_path in lost:
+                        lost_count[in_path] = lost_count.get(in_path, 0) + 1
+                        if lost_count[in_path] <= self.retries:
+                            retry.append(in_path)
+                            continue
+                        fail += 1
+                        error = "worker process died (out of memory?)"
+                        print(f"[FAIL] {os.path.basename(in_path)}: {error}")
+                        if self.on_result is not None:
+                            self.on_result(_failed_result(in_path, shapes.get(in_path), error))
+                    queue.extendleft(reversed(retry))
+                    pool = self._pool()
+        finally:
+            pool.shutdown(wait=True)
+        return ok, fail
+
+
+def run_budgeted(pipeline, raw_dir='data/raw_images', out_dir='data/processed_images', workers=None,
+                 budget_mb=2048, profile_path=None, files=None, observe=True, ledger_path=None,
+                 journal_path=None, resume=False, retry_failed=False):
+    """
+    run_batch over a process pool under a memory budget (see MemoryBudgetScheduler).
+    ledger_path, journal_path, resume and retry_failed work as in run_batch.
+
+    Returns:
+        ok (int): Number of images saved.
+        fail (int): Number of images that failed.
+    """
+    if files is None:
+        files = list_images(raw_dir)
+    if not files:
+        print(f"No images found in {raw_dir}")
+        return 0, 0
+
+    journal = None
+    if journal_path:
+        from checkpoint import RunJournal
+        journal = RunJournal(journal_path, pipeline, {"post_stages": [], "quality_gate": None,
+                                                      "out_dir": os.path.abspath(out_dir)})
+        files, skipped = journal.select(files, out_dir, resume, retry_failed)
+        if skipped:
+            print(f"Journal: skipping {skipped} images, {len(files)} to process ({journal_path})")
+
+    ledger = run_id = None
+    if ledger_path:
+        from ledger import RuntimeLedger
+        ledger = RuntimeLedger(ledger_path)
+        run_id = ledger.start_run(pipeline, {"workers": workers, "memory_budget_mb": budget_mb,
+                                             "n_files": len(files)})
+
+    def on_result(result):
+        status = "ok" if result["error"] is None else "fail"
+        if journal is not None:
+            journal.record(result["in_path"], status, result.get("out_name"), result["error"])
+        if ledger is not None:
+            ledger.record_image(run_id, os.path.basename(result["in_path"]), result["shape"], status,
+                                result["total_s"], result["stage_times"], result["error"])
+
+    model = MemoryModel(profile_path)
+    scheduler = MemoryBudgetScheduler(budget_mb, workers, model, observe, on_result)
+    start_time = time.time()
+    ok, fail = scheduler.run(pipeline, files, out_dir)
+    if observe:
+        model.save()
+    if ledger is not None:
+        ledger.finish_run(run_id, ok, fail)
+    if journal is not None:
+        journal.close()
+
+    print(f"\nDone. Saved {ok}. Failed {fail}. Output: {out_dir}")
+    budget_note = f"of {budget_mb:.0f} MB " if budget_mb is not None else "(no budget) "
+    print(f"Peak admitted estimate: {scheduler.peak_admitted / 1024 ** 2:.0f} MB {budget_note}"
+          f"({scheduler.workers} workers)")
+    if scheduler.crashes:
+        print(f"Worker crashes: {scheduler.crashes}, budget lowered to {scheduler.budget / 1024 ** 2:.0f} MB")
+    print_total_time(start_time)
+    return ok, fail
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print per-image peak-memory estimates for pipelines.")
+    parser.add_argument("pipelines", nargs="*", default=list(PIPELINES))
+    parser.add_argument("--size", default="2400x4600", help="HEIGHTxWIDTH (default: %(default)s)")
+    parser.add_argument("--profile", default=None, help="Observed-peak profile written by --memory-profile")
+    args = parser.parse_args(argv)
+
+    shape = tuple(int(v) for v in args.size.lower().split("x"))
+    model = MemoryModel(args.profile)
+    print(f"{'pipeline':<10}{'estimate MB':>12}  largest stage")
+    for pipeline in args.pipelines:
+        stages = stages_used(pipeline)
+        largest = max(stages, key=lambda s: model.stage_bytes(s, shape), default="-")
+        print(f"{pipeline:<10}{model.pipeline_bytes(pipeline, shape) / 1024 ** 2:>12.0f}  {largest}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,63 @@
+"""
+Command-line entry point (installed as `ocularprep`).
+
+Subcommands import their module only when they run, so `ocularprep --help` and
+short commands start without loading OpenCV, and nothing imports scikit-image
+unless a pipeline calls the wavelet stage.
+
+    ocularprep run p7 --raw data/raw_images
+    ocularprep fanout --pipelines p7,p10,p12,p13 --metrics data/fanout_metrics.csv
+    ocularprep shards status --db runs/p7.db
+    ocularprep track data/videos/T0018_BL.mp4 --out data/roi_crops
+    ocularprep synth --out data/synthetic_images -n 50
+    ocularprep memory p12 --size 2400x4600
+    ocularprep ledger report --pipeline p7
+    ocularprep journal failed --journal data/run_journal.sqlite
+    ocularprep phash build --raw data/raw_images
+    ocularprep stages
+"""
+import argparse
+import sys
+from importlib import import_module
+
+# Subcommand -> (module with main(argv), help)
+COMMANDS = {
+    "run": ("batch_runner", "Run a pipeline over a folder of images"),
+    "fanout": ("fanout", "Run several pipelines in one pass, decoding each image once"),
+    "shards": ("shards", "Sharded multi-node runs (init, work, run, merge, status)"),
+    "track": ("roi_tracker", "Track the eye ROI through a video or bursts (600x600 crops)"),
+    "synth": ("synthetic_eye", "Write a folder of synthetic eye images"),
+    "memory": ("memory_budget", "Per-image peak-memory estimates for pipelines"),
+    "ledger": ("ledger", "Runtime ledger queries: runs, report, plot, export"),
+    "journal": ("checkpoint", "Checkpoint journal of resumable runs: status, failed"),
+    "phash": ("phash_index", "Perceptual-hash index of near-duplicate captures"),
+    "stages": (None, "List the pipelines and the stage registry"),
+}
+
+
+def list_stages():
+    from pipelines import PIPELINES, STAGE_SPECS
+
+    print("Pipelines: " + ", ".join(PIPELINES))
+    print("\nStages:")
+    for name, (module_name, func_name) in STAGE_SPECS.items():
+        print(f"  {name:<28}{module_name}.{func_name}")
+    return 0
+
+
+def main(argv=None):
+    epilog = "commands:\n" + "\n".join(f"  {name:<10}{help_}" for name, (_, help_) in COMMANDS.items())
+    parser = argparse.ArgumentParser(prog="ocularprep", description="Ocular image preprocessing pipelines.",
+                                     epilog=epilog, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=list(COMMANDS), metavar="command")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="Arguments for the command (see `ocularprep <command> -h`)")
+    args = parser.parse_args(argv)
+
+    module_name, _ = COMMANDS[args.command]
+    if module_name is None:
+        return list_stages()
+    return import_module(module_name).main(args.args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,9 @@
+import os
+import cv2 as cv
+import numpy as np
+
+from frame import Frame
+
 def otsu_threshold(image, fname='processed_image.jpg'):
     """
     Applies Otsu's thresholding to the provided image and returns the binary mask.
@@ -11,18 +17,11 @@ def otsu_threshold(image, fname='processed_image.jpg'):
         thresh (np.ndarray): Binary image after Otsu's thresholding.
         fname (str): Base filename only, with directory parts removed.
     """
-    import os
-    import cv2 as cv
-    import numpy as np
-
     # Ensure fname is just the base name
     base_fname = os.path.basename(fname)
 
-    # Convert to grayscale
-    gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
-    
-    # Apply Gaussian blur
-    blur = cv.GaussianBlur(gray, (5, 5), 0)
+    # Grayscale + 5x5 Gaussian blur (shared with other stages through the Frame)
+    blur = Frame.of(image).blurred_gray((5, 5), 0)
 
     # Apply Otsu's thresholding
     _, thresh = cv.threshold(blur, 0, 255, cv.THRESH_BINARY + cv.THRESH_OTSU)
@@ -0,0 +1,339 @@
+"""
+Perceptual-hash index for spotting near-duplicate captures.
+
+Clinic captures come in bursts ('T0018_2019-06-10_BL (1).JPG' ... '(6).JPG')
+whose frames are often nearly identical. Every image gets a 64-bit dHash and
+pHash from a 1/8 JPEG decode (see quality_gate.read_thumbnail), stored with the
+thumbnail's sharpness. Lookups XOR against the whole hash array and count bits
+with a lookup table, so a query is a couple of NumPy operations.
+
+Frames whose hashes are both within the distance thresholds are clustered; the
+sharpest frame is the cluster's representative. By default only frames of the
+same burst (same filename apart from the ' (n)' counter) are linked, so two
+patients whose eyes happen to hash alike are never merged.
+
+    python src/phash_index.py build --raw data/raw_images --index data/phash_index.csv
+    python src/phash_index.py clusters --index data/phash_index.csv --output data/duplicates.csv
+    python src/phash_index.py query --index data/phash_index.csv "data/raw_images/T0018_2019-06-10_BL (3).JPG"
+    python src/batch_runner.py p7 --dedupe          # one frame per cluster, the rest linked
+
+Both write the duplicates CSV to data/duplicates.csv by default, where
+analysis/friedman_all.py and friedman_test.py read it.
+"""
+import os
+import re
+import csv
+import shutil
+import argparse
+
+import cv2
+import numpy as np
+
+from frame import Frame
+from quality_gate import read_thumbnail
+
+INDEX_FIELDS = ["path", "size", "mtime", "dhash", "phash", "sharpness"]
+DUPLICATE_FIELDS = ["image_name", "representative", "dhash_distance", "phash_distance"]
+
+# Where the analysis scripts look for the duplicates CSV (relative to the repo root)
+DUPLICATES_PATH = "data/duplicates.csv"
+
+# Bits set in every byte value, for Hamming distances on uint8 views of the hashes
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+_BURST = re.compile(r"^(.*?)\s*\(\d+\)$")
+
+
+def _bits_to_int(bits):
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def dhash(gray):
+    """64-bit difference hash: is each pixel of a 9x8 resize brighter than its left neighbour."""
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    return _bits_to_int(small[:, 1:] > small[:, :-1])
+
+
+def phash(gray):
+    """64-bit DCT hash: 8x8 lowest frequencies of a 32x32 resize against their median (DC excluded)."""
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8]
+    return _bits_to_int(low > np.median(low.ravel()[1:]))
+
+
+def image_hashes(img_or_path, reduce=8):
+    """
+    dHash, pHash and thumbnail sharpness of one image.
+
+    Parameters:
+        img_or_path (np.ndarray | str): BGR image or path (decoded at 1/`reduce` resolution).
+        reduce (int): Thumbnail scale factor (2, 4 or 8).
+
+    Returns:
+        dhash (int), phash (int), sharpness (float): Hashes as unsigned 64-bit ints,
+                                                     sharpness as Laplacian variance.
+    """
+    thumb = img_or_path if isinstance(img_or_path, np.ndarray) else read_thumbnail(img_or_path, reduce)
+    frame = Frame.of(thumb)
+    gray = frame.gray()
+    return dhash(gray), phash(gray), frame.laplacian_var()
+
+
+def hamming(hashes, query):
+    """Bit distances between a uint64 array of hashes and one hash (or an array of the same shape)."""
+    x = np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.asarray(query, dtype=np.uint64))
+    bits = _POPCOUNT[np.ascontiguousarray(x).reshape(-1).view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+    return bits.reshape(x.shape)
+
+
+def burst_key(path):
+    """'T0018_2019-06-10_BL (3).JPG' -> 'T0018_2019-06-10_BL' (filenames without a counter are their own burst)."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    m = _BURST.match(stem)
+    return m.group(1) if m else stem
+
+
+class HashIndex:
+    """
+    Perceptual hashes of a set of images.
+
+    Parameters:
+        paths (list[str]): Image paths.
+        dhashes, phashes (sequence[int]): 64-bit hashes per path.
+        sharpness (sequence[float]): Thumbnail Laplacian variance per path.
+        sizes, mtimes (sequence | None): File size / mtime when hashed, to skip unchanged files on rebuild.
+    """
+
+    def __init__(self, paths, dhashes, phashes, sharpness, sizes=None, mtimes=None):
+        self.paths = list(paths)
+        self.dhash = np.array(dhashes, dtype=np.uint64)
+        self.phash = np.array(phashes, dtype=np.uint64)
+        self.sharpness = np.array(sharpness, dtype=float)
+        self.sizes = list(sizes) if sizes is not None else [None] * len(self.paths)
+        self.mtimes = list(mtimes) if mtimes is not None else [None] * len(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    @classmethod
+    def build(cls, files, previous=None, reduce=8):
+        """
+        Hashes every file, reusing entries of a previous index whose size and mtime are unchanged.
+
+        Unreadable files are skipped with a [FAIL] line.
+        """
+        known = {}
+        if previous is not None:
+            known = {p: i for i, p in enumerate(previous.paths)}
+        rows = []
+        for path in files:
+            st = os.stat(path)
+            i = known.get(path)
+            if i is not None and previous.sizes[i] == st.st_size and previous.mtimes[i] == st.st_mtime:
+                rows.append((path, int(previous.dhash[i]), int(previous.phash[i]), previous.sharpness[i],
+                             st.st_size, st.st_mtime))
+                continue
+            try:
+                rows.append((path, *image_hashes(path, reduce), st.st_size, st.st_mtime))
+            except Exception as e:
+                print(f"[FAIL] {os.path.basename(path)}: {e}")
+        if not rows:
+            return cls([], [], [], [])
+        paths, d, p, sharp, sizes, mtimes = zip(*rows)
+        return cls(paths, d, p, sharp, sizes, mtimes)
+
+    @classmethod
+    def load(cls, index_path):
+        with open(index_path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        return cls([r["path"] for r in rows], [int(r["dhash"], 16) for r in rows],
+                   [int(r["phash"], 16) for r in rows], [float(r["sharpness"]) for r in rows],
+                   [int(r["size"]) for r in rows], [float(r["mtime"]) for r in rows])
+
+    def save(self, index_path):
+        tmp = index_path + ".tmp"
+        with open(tmp, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(INDEX_FIELDS)
+            for i, path in enumerate(self.paths):
+                writer.writerow([path, self.sizes[i], self.mtimes[i], f"{int(self.dhash[i]):016x}",
+                                 f"{int(self.phash[i]):016x}", self.sharpness[i]])
+        os.replace(tmp, index_path)
+
+    def query(self, img_or_path, max_dhash=10, max_phash=12):
+        """
+        Indexed images near one image.
+
+        Returns:
+            matches (list[tuple[str, int, int]]): (path, dhash distance, phash distance), closest first.
+        """
+        d, p, _ = image_hashes(img_or_path)
+        dd, pd = hamming(self.dhash, d), hamming(self.phash, p)
+        hits = np.nonzero((dd <= max_dhash) & (pd <= max_phash))[0]
+        hits = hits[np.lexsort((pd[hits], dd[hits]))]
+        return [(self.paths[i], int(dd[i]), int(pd[i])) for i in hits]
+
+    def _pairs(self, idx, max_dhash, max_phash):
+        """Index pairs (i < j) within idx that are near-duplicates."""
+        idx = np.asarray(idx)
+        for start in range(0, len(idx), 1024):
+            rows = idx[start:start + 1024]
+            dd = hamming(self.dhash[idx][None, :], self.dhash[rows][:, None])
+            pd = hamming(self.phash[idx][None, :], self.phash[rows][:, None])
+            r, c = np.nonzero((dd <= max_dhash) & (pd <= max_phash))
+            keep = idx[c] > rows[r]
+            yield from zip(rows[r[keep]], idx[c[keep]])
+
+    def clusters(self, max_dhash=10, max_phash=12, same_burst_only=True):
+        """
+        Groups near-duplicate images (single linkage on both hash distances).
+
+        Returns:
+            clusters (list[list[int]]): Indices per cluster, sharpest first; singletons included.
+        """
+        parent = list(range(len(self.paths)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        if same_burst_only:
+            groups = {}
+            for i, path in enumerate(self.paths):
+                groups.setdefault(burst_key(path), []).append(i)
+            blocks = [g for g in groups.values() if len(g) > 1]
+        else:
+            blocks = [range(len(self.paths))]
+        for block in blocks:
+            for i, j in self._pairs(list(block), max_dhash, max_phash):
+                parent[find(i)] = find(j)
+
+        members = {}
+        for i in range(len(self.paths)):
+            members.setdefault(find(i), []).append(i)
+        return sorted((sorted(m, key=lambda i: (-self.sharpness[i], self.paths[i])) for m in members.values()),
+                      key=lambda m: self.paths[m[0]])
+
+    def duplicates(self, **cluster_kwargs):
+        """
+        Returns:
+            representatives (list[str]): One path per cluster (the sharpest frame).
+            linked (dict[str, tuple[str, int, int]]): Other path -> (representative, dhash, phash distance).
+        """
+        representatives, linked = [], {}
+        for cluster in self.clusters(**cluster_kwargs):
+            rep = cluster[0]
+            representatives.append(self.paths[rep])
+            for i in cluster[1:]:
+                linked[self.paths[i]] = (self.paths[rep], int(hamming(self.dhash[i], self.dhash[rep])),
+                                         int(hamming(self.phash[i], self.phash[rep])))
+        return representatives, linked
+
+
+def write_duplicates(linked, path):
+    """CSV of linked frames: image_name, representative and distances (base names)."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(DUPLICATE_FIELDS)
+        for member, (rep, dd, pd) in sorted(linked.items()):
+            writer.writerow([os.path.basename(member), os.path.basename(rep), dd, pd])
+
+
+def dedupe_files(files, index_path=None, max_dhash=10, max_phash=12, same_burst_only=True):
+    """
+    Picks one representative per near-duplicate cluster, updating the index file if given.
+
+    Returns:
+        representatives (list[str]): Files to process.
+        linked (dict[str, tuple[str, int, int]]): Skipped file -> (representative, distances).
+    """
+    previous = HashIndex.load(index_path) if index_path and os.path.exists(index_path) else None
+    index = HashIndex.build(files, previous)
+    if index_path:
+        index.save(index_path)
+    representatives, linked = index.duplicates(max_dhash=max_dhash, max_phash=max_phash,
+                                               same_burst_only=same_burst_only)
+    # Files that could not be hashed are still processed
+    hashed = set(index.paths)
+    representatives += [f for f in files if f not in hashed]
+    return sorted(representatives), linked
+
+
+def link_outputs(linked, out_dir, output_name, duplicates_path=DUPLICATES_PATH):
+    """
+    Gives every linked frame the output of its representative (hard link, or a copy
+    where links are not supported) and writes the duplicates CSV.
+
+    Parameters:
+        linked (dict): From dedupe_files.
+        out_dir (str): Pipeline output folder.
+        output_name (callable): fname -> output filename (e.g. partial(pipelines.output_name, pipeline=...)).
+        duplicates_path (str): Where to write the duplicates CSV (written even when nothing was linked).
+
+    Returns:
+        n_linked (int): Outputs created.
+    """
+    n_linked = 0
+    for member, (rep, _, _) in linked.items():
+        src = os.path.join(out_dir, output_name(rep))
+        dst = os.path.join(out_dir, output_name(member))
+        if not os.path.exists(src):
+            continue  # representative failed, nothing to link
+        if os.path.exists(dst):
+            os.remove(dst)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+        n_linked += 1
+    write_duplicates(linked, duplicates_path)
+    return n_linked
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_build = sub.add_parser("build", help="Hash a folder (unchanged files are reused)")
+    p_build.add_argument("--raw", default="data/raw_images")
+    p_build.add_argument("--index", default="data/phash_index.csv")
+
+    p_clusters = sub.add_parser("clusters", help="Write near-duplicate clusters as a duplicates CSV")
+    p_clusters.add_argument("--index", default="data/phash_index.csv")
+    p_clusters.add_argument("--output", default=DUPLICATES_PATH)
+
+    p_query = sub.add_parser("query", help="Indexed images near one image")
+    p_query.add_argument("image")
+    p_query.add_argument("--index", default="data/phash_index.csv")
+
+    for p in (p_clusters, p_query):
+        p.add_argument("--max-dhash", type=int, default=10, help="Max dHash bit distance (default: %(default)s)")
+        p.add_argument("--max-phash", type=int, default=12, help="Max pHash bit distance (default: %(default)s)")
+    p_clusters.add_argument("--across-bursts", action="store_true", help="Also link frames from different bursts")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        from pipelines import list_images
+        index_path = args.index
+        previous = HashIndex.load(index_path) if os.path.exists(index_path) else None
+        index = HashIndex.build(list_images(args.raw), previous)
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        index.save(index_path)
+        print(f"{len(index)} images hashed. Index: {index_path}")
+    elif args.command == "clusters":
+        index = HashIndex.load(args.index)
+        reps, linked = index.duplicates(max_dhash=args.max_dhash, max_phash=args.max_phash,
+                                        same_burst_only=not args.across_bursts)
+        write_duplicates(linked, args.output)
+        print(f"{len(index)} images in {len(reps)} clusters; {len(linked)} duplicates listed in {args.output}")
+    else:
+        for path, dd, pd in HashIndex.load(args.index).query(args.image, args.max_dhash, args.max_phash):
+            print(f"{dd:>3} {pd:>3}  {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,250 @@
+import os
+import glob
+import warnings
+from collections.abc import Mapping
+from importlib import import_module
+
+# Same extensions the pipeline notebooks glob for in data/raw_images
+IMAGE_EXTS = ("*.jpg", "*.JPG", "*.jpeg", "*.JPEG", "*.png", "*.PNG", "*.tif", "*.tiff", "*.bmp")
+
+# Every stage that works on an in-memory BGR array, by name: (module, function)
+STAGE_SPECS = {
+    "homomorphic_filter_color": ("homomorphic_filter", "homomorphic_filter_color"),
+    "clahe_preserve_color": ("contrast_color", "clahe_preserve_color"),
+    "tophat_extract_l_channel": ("tophat_optimization_l", "tophat_extract_l_channel"),
+    "wavelet_denoise_lab_cv": ("wavelet", "wavelet_denoise_lab_cv"),
+    "gaussian_denoise": ("gaussian_noise_filtering", "gaussian_denoise"),
+    "otsu_threshold": ("otsu", "otsu_threshold"),
+    "contour_crop_eye": ("contour_crop", "contour_crop_eye"),
+    "contour_crop_binary": ("contour_crop_2", "contour_crop_binary"),
+    "hough_crop_eye": ("Houghcrop", "hough_crop_eye"),
+}
+
+
+class LazyStages(Mapping):
+    """
+    Stage registry that imports a stage's module on first lookup.
+
+    Importing pipelines (and everything built on it) then only costs cv2/numpy;
+    scikit-image, PyWavelets and SciPy are loaded the first time a pipeline
+    actually calls wavelet_denoise_lab_cv.
+    """
+
+    def __init__(self, specs):
+        self._specs = specs
+        self._loaded = {}
+
+    def __getitem__(self, name):
+        if name not in self._loaded:
+            module_name, func_name = self._specs[name]
+            self._loaded[name] = getattr(import_module(module_name), func_name)
+        return self._loaded[name]
+
+    def __iter__(self):
+        return iter(self._specs)
+
+    def __len__(self):
+        return len(self._specs)
+
+
+STAGES = LazyStages(STAGE_SPECS)
+
+
+def call_stage(name, *args, **kwargs):
+    """Default stage caller: looks the stage up by name and runs it."""
+    return STAGES[name](*args, **kwargs)
+
+
+# =========================
+# Pipeline compositions (mirrors notebooks/pipelinetest<n>.ipynb)
+# Each takes the decoded BGR image, its filename and a stage caller,
+# and returns (final_img, fname) like the individual stages do.
+# =========================
+def _p0(img, fname, stage):
+    # Baseline: raw image, no processing
+    return img, fname
+
+
+def _p1(img, fname, stage):
+    return stage("contour_crop_eye", img, fname)
+
+
+def _p2(img, fname, stage):
+    binary_t, _ = stage("otsu_threshold", img, fname)
+    return stage("contour_crop_binary", binary_t, img, fname)
+
+
+def _p3(img, fname, stage):
+    return stage("hough_crop_eye", img, fname)
+
+
+def _p4(img, fname, stage):
+    # The notebook crops the raw image, the top-hat output is not used
+    stage("tophat_extract_l_channel", img, fname)
+    return stage("contour_crop_eye", img, fname)
+
+
+def _p5(img, fname, stage):
+    # The notebook crops the raw image, the filtered output is not used
+    stage("homomorphic_filter_color", img, fname)
+    return stage("contour_crop_eye", img, fname)
+
+
+def _p6(img, fname, stage):
+    # The notebook crops the raw image, the CLAHE output is not used
+    stage("clahe_preserve_color", img, fname=fname)
+    return stage("contour_crop_eye", img, fname)
+
+
+def _p7(img, fname, stage):
+    clahe_img, _ = stage("clahe_preserve_color", img, fname=fname)
+    binary_t, _ = stage("otsu_threshold", clahe_img, fname)
+    return stage("contour_crop_binary", binary_t, clahe_img, fname)
+
+
+def _p8(img, fname, stage):
+    clahe_img, _ = stage("clahe_preserve_color", img, fname=fname)
+    gn_img, _ = stage("gaussian_denoise", clahe_img, fname)
+    binary_t, _ = stage("otsu_threshold", gn_img, fname)
+    return stage("contour_crop_binary", binary_t, gn_img, fname)
+
+
+def _p9(img, fname, stage):
+    top_hat_img, _ = stage("tophat_extract_l_channel", img, fname)
+    hom_fil_img, _ = stage("homomorphic_filter_color", top_hat_img, fname)
+    return stage("contour_crop_eye", hom_fil_img, fname)
+
+
+def _p10(img, fname, stage):
+    hf_img, _ = stage("homomorphic_filter_color", img, fname)
+    clahe_img, _ = stage("clahe_preserve_color", hf_img, fname=fname)
+    binary_t, _ = stage("otsu_threshold", clahe_img, fname)
+    return stage("contour_crop_binary", binary_t, clahe_img, fname)
+
+
+def _p11(img, fname, stage):
+    top_hat_img, _ = stage("tophat_extract_l_channel", img, fname)
+    hom_fil_img, _ = stage("homomorphic_filter_color", top_hat_img, fname)
+    # The notebook runs wavelet denoising but crops the homomorphic output
+    stage("wavelet_denoise_lab_cv", hom_fil_img, fname=fname)
+    return stage("contour_crop_eye", hom_fil_img, fname)
+
+
+def _p12(img, fname, stage):
+    hf_img, _ = stage("homomorphic_filter_color", img, fname)
+    clahe_img, _ = stage("clahe_preserve_color", hf_img, fname=fname)
+    wave_img, _ = stage("wavelet_denoise_lab_cv", clahe_img, fname=fname)
+    binary_t, _ = stage("otsu_threshold", clahe_img, fname)
+    return stage("contour_crop_binary", binary_t, wave_img, fname)
+
+
+def _p13(img, fname, stage):
+    hf_img, _ = stage("homomorphic_filter_color", img, fname)
+    clahe_img, _ = stage("clahe_preserve_color", hf_img, fname=fname)
+    noise_img, _ = stage("gaussian_denoise", clahe_img, fname=fname)
+    binary_t, _ = stage("otsu_threshold", clahe_img, fname)
+    return stage("contour_crop_binary", binary_t, noise_img, fname)
+
+
+# pipelinetest14-16 notebooks are still empty, add them here once defined
+PIPELINES = {
+    "p0": _p0, "p1": _p1, "p2": _p2, "p3": _p3, "p4": _p4,
+    "p5": _p5, "p6": _p6, "p7": _p7, "p8": _p8, "p9": _p9,
+    "p10": _p10, "p11": _p11, "p12": _p12, "p13": _p13,
+}
+
+# Output suffixes exactly as the notebooks write them (typos included, the
+# metric sheets are keyed on these names)
+SUFFIXES = {
+    "p0": "",
+    "p1": "_processed_pipelinetest1",
+    "p2": "_processed_pipelinetest2",
+    "p3": "_processed_pipelinetest3",
+    "p4": "_processed_pipelinetest4",
+    "p5": "_processed_pipelinetest5",
+    "p6": "_processed_pipelinetest6",
+    "p7": "_processed_piplinetest7",
+    "p8": "_processed_pipelinetest8",
+    "p9": "_processed_pipelinetest9",
+    "p10": "_processed_piplinetest10",
+    "p11": "_processed_pipelinetest11",
+    "p12": "_processed_piplinetest12",
+    "p13": "_processed_piplinetest13",
+}
+
+
+def run_pipeline(name, img, fname, stage=call_stage):
+    """
+    Runs one pipeline composition on an already-decoded image.
+
+    Parameters:
+        name (str): Pipeline key, e.g. 'p7'.
+        img (np.ndarray): Decoded BGR image.
+        fname (str): Filename for logging/saving.
+        stage (callable): Stage caller `stage(name, *args, **kwargs)`. Swap this
+                          out to time, trace or cache individual stage calls.
+
+    The input and stage outputs are read-only while the pipeline runs (see frame.py).
+
+    Returns:
+        final_img (np.ndarray): Pipeline output (600x600 BGR for p1-p13).
+        base_filename (str): Base filename only.
+    """
+    if name not in PIPELINES:
+        raise ValueError(f"Unknown pipeline {name!r}, expected one of {list(PIPELINES)}")
+    from frame import frame_scope
+
+    # The input and every stage output are Frames for the duration of the run,
+    # so stages share derived views (gray, LAB, blurred gray) through Frame.of
+    with frame_scope() as scope:
+        def shared(stage_name, *args, **kwargs):
+            result = stage(stage_name, *args, **kwargs)
+            if isinstance(result, tuple):
+                scope.own(result[0])
+            return result
+
+        scope.own(img)
+        final_img, _ = PIPELINES[name](img, fname, shared)
+    return final_img, os.path.basename(fname)
+
+
+def stages_used(name, probe=None):
+    """
+    Names of the stages a pipeline calls, in order, found with a dry run on a tiny image.
+
+    Parameters:
+        name (str): Pipeline key.
+        probe (tuple[np.ndarray, str] | None): (image, fname) to run; default is 64x64 noise.
+
+    Returns:
+        stages (list[str]): Unique stage names.
+    """
+    if probe is None:
+        import numpy as np
+        probe = (np.random.default_rng(0).integers(0, 256, (64, 64, 3), dtype=np.uint8), "probe.jpg")
+    used = []
+
+    def record(stage_name, *args, **kwargs):
+        used.append(stage_name)
+        return STAGES[stage_name](*args, **kwargs)
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            run_pipeline(name, *probe, stage=record)
+    except Exception:
+        pass  # the crop failing on the probe is fine, every stage before it was recorded
+    return list(dict.fromkeys(used))
+
+
+def list_images(raw_dir):
+    """Sorted list of image paths in raw_dir, same glob as the notebooks."""
+    # set() because *.jpg and *.JPG match the same files on case-insensitive filesystems
+    files = {p for e in IMAGE_EXTS for p in glob.glob(os.path.join(raw_dir, e))}
+    return sorted(files)
+
+
+def output_name(fname, pipeline):
+    """Output filename for `fname` under `pipeline`: same name + suffix."""
+    base, ext = os.path.splitext(os.path.basename(fname))
+    return f"{base}{SUFFIXES[pipeline]}{ext or '.jpg'}"
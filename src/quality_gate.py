@@ -0,0 +1,125 @@
+import os
+
+import cv2
+import numpy as np
+
+from frame import Frame
+
+# Default rejection thresholds. Blur is measured on the 1/8 thumbnail, so
+# min_laplacian_var is not comparable with a full-resolution Laplacian variance.
+DEFAULT_THRESHOLDS = {
+    "min_brightness": 5.0,         # mean gray level (testtest.py's "too dark" check)
+    "max_brightness": 245.0,       # mean gray level (blown out)
+    "min_laplacian_var": 20.0,     # variance of the Laplacian (blurred / out of focus)
+    "max_glare_fraction": 0.25,    # fraction of gray pixels >= 250 (saturation / glare)
+    "min_roi_fraction": 0.01,      # largest Otsu contour as a fraction of the frame (no eye found)
+    "max_roi_fraction": 0.95,      # ... or the "eye" is the whole frame (no contrast)
+}
+
+# (threshold key, statistic, bound, rejection reason)
+_RULES = (
+    ("min_brightness", "brightness", "min", "too dark"),
+    ("max_brightness", "brightness", "max", "too bright"),
+    ("min_laplacian_var", "laplacian_var", "min", "blurred"),
+    ("max_glare_fraction", "glare_fraction", "max", "glare/saturated"),
+    ("min_roi_fraction", "roi_fraction", "min", "no eye region found"),
+    ("max_roi_fraction", "roi_fraction", "max", "no eye region found"),
+)
+
+# JPEG decoders can skip most of the work at these scales
+_REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def read_thumbnail(image_path, reduce=8):
+    """
+    Decodes an image at reduced resolution (1/2, 1/4 or 1/8). For JPEGs OpenCV
+    decodes straight to the smaller size, which is much cheaper than a full decode.
+
+    Returns:
+        thumb (np.ndarray): Reduced BGR image.
+    """
+    if reduce not in _REDUCED_FLAGS:
+        raise ValueError(f"reduce must be one of {list(_REDUCED_FLAGS)}, got {reduce}")
+    thumb = cv2.imread(image_path, _REDUCED_FLAGS[reduce])
+    if thumb is None:
+        raise ValueError(f"Image not found or unreadable: {image_path}")
+    return thumb
+
+
+def thumbnail_stats(thumb):
+    """
+    Cheap quality statistics of a (thumbnail) BGR image.
+
+    Returns:
+        stats (dict): brightness, laplacian_var, glare_fraction, roi_fraction.
+    """
+    frame = Frame.of(thumb)
+    gray = frame.gray()
+
+    # ROI presence: same Otsu + largest external contour idea as contour_crop_eye
+    _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if np.mean(thresh) > 127:
+        thresh = cv2.bitwise_not(thresh)
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    roi_area = max((cv2.contourArea(c) for c in contours), default=0.0)
+
+    return {
+        "brightness": float(gray.mean()),
+        "laplacian_var": frame.laplacian_var(),
+        "glare_fraction": float(frame.histogram()[250:].sum()) / gray.size,
+        "roi_fraction": roi_area / gray.size,
+    }
+
+
+def check_quality(img_or_path, thresholds=None, reduce=8):
+    """
+    Early-reject gate: decides from a reduced-resolution decode whether an image is
+    worth running through the full pipeline.
+
+    Accepts either:
+        - A filename/path (decoded at 1/`reduce` resolution)
+        - An already-loaded BGR array (downsized by `reduce` first)
+
+    Parameters:
+        img_or_path (np.ndarray | str): Image or path.
+        thresholds (dict | None): Overrides for DEFAULT_THRESHOLDS; None values disable a check.
+        reduce (int): Thumbnail scale factor (2, 4 or 8).
+
+    Returns:
+        passed (bool): True if no check failed.
+        reasons (list[str]): Why the image was rejected (empty if passed).
+        stats (dict): The statistics the decision was based on.
+    """
+    limits = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    unknown = set(limits) - set(DEFAULT_THRESHOLDS)
+    if unknown:
+        raise ValueError(f"Unknown quality thresholds: {sorted(unknown)}")
+
+    if isinstance(img_or_path, np.ndarray):
+        thumb = cv2.resize(img_or_path, None, fx=1 / reduce, fy=1 / reduce, interpolation=cv2.INTER_AREA)
+    else:
+        thumb = read_thumbnail(img_or_path, reduce)
+    stats = thumbnail_stats(thumb)
+
+    reasons = []
+    for key, stat, kind, label in _RULES:
+        limit, value = limits[key], stats[stat]
+        if limit is None:
+            continue
+        if (kind == "min" and value < limit) or (kind == "max" and value > limit):
+            reasons.append(f"{label} ({stat} = {value:.3g}, {key} = {limit:g})")
+    return not reasons, reasons, stats
+
+
+def parse_thresholds(text):
+    """'min_brightness=10,max_glare_fraction=0.1,min_roi_fraction=none' -> dict for check_quality."""
+    thresholds = {}
+    for item in filter(None, (p.strip() for p in text.split(","))):
+        key, value = item.split("=")
+        thresholds[key.strip()] = None if value.strip().lower() == "none" else float(value)
+    return thresholds
+
+
+def gate_report_row(path, passed, reasons, stats):
+    """One row for a quality-gate CSV report."""
+    return {"image_name": os.path.basename(path), "passed": passed, "reasons": "; ".join(reasons), **stats}
@@ -0,0 +1,301 @@
+"""
+Eye-ROI tracking for video captures and ordered bursts.
+
+Running contour or Hough detection on every frame of a slit-lamp video spends
+most of the frame budget on finding an eye that has barely moved. Here the ROI
+is detected on a keyframe and then followed by normalised template matching of
+the keyframe's ROI inside a search window around the last position, at a
+reduced working resolution. Detection runs again when the match score drops
+below min_confidence (blink, large motion, occlusion) or every
+keyframe_interval frames, which also picks up changes in scale. Every frame
+gives the same 600x600 BGR crop as contour_crop_eye / hough_crop_eye.
+
+    python src/roi_tracker.py data/videos/T0018_BL.mp4 --out data/roi_crops --video-out crops.mp4
+    python src/roi_tracker.py data/raw_images --out data/roi_crops --detector hough --log roi.csv
+
+Folders are read as bursts: frames of one burst ('T0018_2019-06-10_BL (1).JPG',
+'(2)', ...) in counter order, with the tracker reset between bursts.
+"""
+import os
+import re
+import csv
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from contour_crop import eye_bounding_box
+from Houghcrop import REFERENCE_PIXELS, detect_eye_circle
+from pipelines import list_images
+from tracing import print_total_time
+
+VIDEO_EXTS = (".mp4", ".avi", ".mov", ".mkv", ".m4v")
+TRACK_SUFFIX = "_roi_tracked"
+LOG_FIELDS = ["frame", "sequence", "mode", "confidence", "x1", "y1", "x2", "y2"]
+
+_COUNTER = re.compile(r"^(.*?)\s*\((\d+)\)$")
+
+
+def detect_contour_box(img, padding=30):
+    """contour_crop_eye's ROI."""
+    return eye_bounding_box(img, padding)
+
+
+def detect_hough_box(img, target_pixels=REFERENCE_PIXELS):
+    """ROI of the resolution-adaptive Hough circle, padded like hough_crop_eye(target_pixels=...)."""
+    circle = detect_eye_circle(img, target_pixels)
+    if circle is None:
+        raise ValueError("Hough Transform failed to detect a circle")
+    x, y, r = circle
+    h, w = img.shape[:2]
+    pad = 20 * np.sqrt(h * w / target_pixels)
+    return (int(max(x - r - pad, 0)), int(max(y - r - pad, 0)),
+            int(min(x + r + pad, w)), int(min(y + r + pad, h)))
+
+
+DETECTORS = {
+    "contour": detect_contour_box,
+    "hough": detect_hough_box,
+}
+
+
+def _gray(img):
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+
+
+class ROITracker:
+    """
+    Keyframe detection plus template tracking of one eye ROI.
+
+    Parameters:
+        detector (str | callable): 'contour', 'hough' or a function img -> (x1, y1, x2, y2).
+        keyframe_interval (int): Detect at least every this many frames (0 = only when tracking fails).
+        min_confidence (float): TM_CCOEFF_NORMED score below which the ROI is detected again.
+        search_margin (float): Search window margin around the last ROI, as a fraction of its size.
+        track_width (int): Width the ROI is scaled to for matching (smaller = faster, coarser).
+    """
+
+    def __init__(self, detector="contour", keyframe_interval=30, min_confidence=0.6,
+                 search_margin=0.25, track_width=128):
+        self.detect = DETECTORS[detector] if isinstance(detector, str) else detector
+        self.keyframe_interval = keyframe_interval
+        self.min_confidence = min_confidence
+        self.search_margin = search_margin
+        self.track_width = track_width
+        self.reset()
+
+    def reset(self):
+        """Forgets the ROI; the next frame is a keyframe."""
+        self.box = None
+        self.template = None
+        self.scale = 1.0
+        self.since_keyframe = 0
+
+    def _keyframe(self, img):
+        box = tuple(int(v) for v in self.detect(img))
+        x1, y1, x2, y2 = box
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            raise ValueError(f"Degenerate ROI {box}")
+        self.box = box
+        self.scale = min(1.0, self.track_width / (x2 - x1))
+        self.template = cv2.resize(_gray(img[y1:y2, x1:x2]), (0, 0), fx=self.scale, fy=self.scale,
+                                   interpolation=cv2.INTER_AREA)
+        self.since_keyframe = 0
+
+    def _track(self, img):
+        """Best match of the keyframe template around the last ROI: (box, score), or (None, 0.0)."""
+        x1, y1, x2, y2 = self.box
+        h, w = img.shape[:2]
+        mx, my = int((x2 - x1) * self.search_margin), int((y2 - y1) * self.search_margin)
+        wx1, wy1 = max(x1 - mx, 0), max(y1 - my, 0)
+        wx2, wy2 = min(x2 + mx, w), min(y2 + my, h)
+        window = cv2.resize(_gray(img[wy1:wy2, wx1:wx2]), (0, 0), fx=self.scale, fy=self.scale,
+                            interpolation=cv2.INTER_AREA)
+        th, tw = self.template.shape
+        if window.shape[0] < th or window.shape[1] < tw:
+            return None, 0.0  # the window was clipped by the frame edge below the template size
+        scores = cv2.matchTemplate(window, self.template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (bx, by) = cv2.minMaxLoc(scores)
+        nx1, ny1 = wx1 + int(round(bx / self.scale)), wy1 + int(round(by / self.scale))
+        nx1, ny1 = min(max(nx1, 0), w - (x2 - x1)), min(max(ny1, 0), h - (y2 - y1))
+        return (nx1, ny1, nx1 + (x2 - x1), ny1 + (y2 - y1)), float(score)
+
+    def update(self, img):
+        """
+        ROI of the next frame.
+
+        Returns:
+            box (tuple[int, int, int, int]): (x1, y1, x2, y2) in frame pixels.
+            mode (str): 'detect' (keyframe), 'track' or 'hold' (detection failed, last ROI kept).
+            confidence (float): Template match score (1.0 on keyframes).
+
+        Raises:
+            ValueError: If the ROI is lost and cannot be detected (no previous ROI to hold).
+        """
+        self.since_keyframe += 1
+        due = self.box is None or (self.keyframe_interval and self.since_keyframe >= self.keyframe_interval)
+        score = 0.0
+        if not due:
+            box, score = self._track(img)
+            if box is not None and score >= self.min_confidence:
+                self.box = box
+                return box, "track", score
+        try:
+            self._keyframe(img)
+        except ValueError:
+            if self.box is None:
+                raise
+            return self.box, "hold", score
+        return self.box, "detect", 1.0
+
+
+def crop_roi(img, box, output_size=(600, 600)):
+    """Crops a box and resizes it like the crop stages (3-channel BGR output)."""
+    x1, y1, x2, y2 = box
+    final_img = cv2.resize(img[y1:y2, x1:x2], output_size)
+    if final_img.ndim == 2:
+        final_img = cv2.cvtColor(final_img, cv2.COLOR_GRAY2BGR)
+    return final_img
+
+
+def burst_order(path):
+    """Sort key: burst name, then the ' (n)' counter as a number."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    m = _COUNTER.match(stem)
+    return (m.group(1), int(m.group(2))) if m else (stem, 0)
+
+
+def read_sequences(source):
+    """
+    Yields (sequence, frame_name, frame) in playback order.
+
+    A video file is one sequence (frames named '<stem>_000123.jpg'); a folder is
+    read as bursts, each burst one sequence.
+    """
+    if os.path.isfile(source) and source.lower().endswith(VIDEO_EXTS):
+        stem = os.path.splitext(os.path.basename(source))[0]
+        cap = cv2.VideoCapture(source)
+        if not cap.isOpened():
+            raise ValueError(f"Cannot open video: {source}")
+        try:
+            i = 0
+            while True:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                yield stem, f"{stem}_{i:06d}.jpg", frame
+                i += 1
+        finally:
+            cap.release()
+        return
+    for path in sorted(list_images(source), key=burst_order):
+        yield burst_order(path)[0], os.path.basename(path), cv2.imread(path)
+
+
+def video_fps(source, default=30.0):
+    if os.path.isfile(source) and source.lower().endswith(VIDEO_EXTS):
+        cap = cv2.VideoCapture(source)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        cap.release()
+        if fps and fps > 0:
+            return fps
+    return default
+
+
+def track_sequence(source, out_dir=None, detector="contour", video_out=None, log_path=None,
+                   output_size=(600, 600), **tracker_kwargs):
+    """
+    Tracks the eye ROI through a video or a folder of bursts and saves the crops.
+
+    Parameters:
+        source (str): Video file or folder of images.
+        out_dir (str | None): Save every crop here as '<frame name><TRACK_SUFFIX>.<ext>'.
+        detector (str): Keyframe detector, 'contour' or 'hough'.
+        video_out (str | None): Also write the crops as a video (mp4v) at the source frame rate.
+        log_path (str | None): CSV with each frame's mode, confidence and ROI.
+        output_size (tuple[int, int]): Crop size.
+        **tracker_kwargs: ROITracker parameters.
+
+    Returns:
+        ok (int): Frames cropped.
+        fail (int): Frames that failed (unreadable, or no ROI yet).
+    """
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    tracker = ROITracker(detector, **tracker_kwargs)
+    writer = log_file = log = None
+    if video_out:
+        writer = cv2.VideoWriter(video_out, cv2.VideoWriter_fourcc(*"mp4v"), video_fps(source), output_size)
+    if log_path:
+        log_file = open(log_path, "w", newline="")
+        log = csv.writer(log_file)
+        log.writerow(LOG_FIELDS)
+
+    start_time = time.time()
+    ok = fail = 0
+    modes = {"detect": 0, "track": 0, "hold": 0}
+    sequence = None
+    try:
+        for seq, name, frame in read_sequences(source):
+            if seq != sequence:
+                tracker.reset()
+                sequence = seq
+            if frame is None:
+                fail += 1
+                print(f"[FAIL] {name}: cv2.imread returned None")
+                continue
+            try:
+                box, mode, confidence = tracker.update(frame)
+            except ValueError as e:
+                fail += 1
+                print(f"[FAIL] {name}: {e}")
+                continue
+            modes[mode] += 1
+            final_img = crop_roi(frame, box, output_size)
+            if out_dir:
+                base, ext = os.path.splitext(name)
+                cv2.imwrite(os.path.join(out_dir, f"{base}{TRACK_SUFFIX}{ext or '.jpg'}"), final_img)
+            if writer is not None:
+                writer.write(final_img)
+            if log is not None:
+                log.writerow([name, seq, mode, f"{confidence:.4f}", *box])
+            ok += 1
+    finally:
+        if writer is not None:
+            writer.release()
+        if log_file is not None:
+            log_file.close()
+
+    print(f"\nDone. Saved {ok}. Failed {fail}. Output: {out_dir or video_out}")
+    elapsed = print_total_time(start_time)
+    print(f"Keyframe detections {modes['detect']}, tracked {modes['track']}, held {modes['hold']}"
+          f" ({ok / elapsed if elapsed else 0:.1f} frames/s)")
+    return ok, fail
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Video file or folder of burst images")
+    parser.add_argument("--out", default=None, help="Folder for the 600x600 crops")
+    parser.add_argument("--video-out", default=None, help="Write the crops as an mp4 video")
+    parser.add_argument("--log", default=None, help="Per-frame CSV of mode, confidence and ROI")
+    parser.add_argument("--detector", choices=list(DETECTORS), default="contour")
+    parser.add_argument("--keyframe-interval", type=int, default=30,
+                        help="Detect at least every N frames, 0 = only when tracking fails (default: %(default)s)")
+    parser.add_argument("--min-confidence", type=float, default=0.6,
+                        help="Match score below which the ROI is re-detected (default: %(default)s)")
+    parser.add_argument("--search-margin", type=float, default=0.25,
+                        help="Search window margin, fraction of the ROI size (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if not (args.out or args.video_out or args.log):
+        parser.error("give at least one of --out, --video-out or --log")
+    ok, fail = track_sequence(args.source, args.out, args.detector, args.video_out, args.log,
+                              keyframe_interval=args.keyframe_interval, min_confidence=args.min_confidence,
+                              search_margin=args.search_margin)
+    return 1 if fail and not ok else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
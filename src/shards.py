@@ -0,0 +1,441 @@
+"""
+Shard-based batch processing across several machines that share a filesystem.
+
+The image manifest is split into deterministic shards (hash of the filename), so
+every node agrees on which images belong to which shard without talking to each
+other. A run can either take a fixed shard range per invocation, or ask a small
+SQLite coordinator on the shared filesystem for the next free shard:
+
+    python src/shards.py init  --db run/coord.sqlite --raw data/raw_images --pipeline p7 --num-shards 64
+    python src/shards.py work  --db run/coord.sqlite          # on every node, as many times as wanted
+    python src/shards.py run   --db run/coord.sqlite --shards 0-7   # or: a fixed range, no claiming
+    python src/shards.py merge --db run/coord.sqlite          # metrics partitions -> one CSV
+    python src/shards.py status --db run/coord.sqlite
+
+Each shard writes its images to the usual output folder and its metric rows to
+its own partition (<run dir>/metrics/shard-00012.csv), so workers never write to
+the same file.
+"""
+import os
+import re
+import csv
+import glob
+import json
+import time
+import socket
+import sqlite3
+import hashlib
+import argparse
+import threading
+import multiprocessing as mp
+from contextlib import contextmanager
+
+from pipelines import PIPELINES, list_images
+from quality_gate import parse_thresholds
+
+
+def shard_of(fname, num_shards):
+    """Deterministic shard index of an image, from its base filename only."""
+    digest = hashlib.blake2b(os.path.basename(fname).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % num_shards
+
+
+def manifest_files(raw_dir):
+    """Absolute paths of the images in raw_dir (same glob as the notebooks), in manifest order."""
+    return [os.path.abspath(p) for p in list_images(raw_dir)]
+
+
+def write_manifest(files, manifest_path):
+    """Writes image paths into a manifest file, one path per line."""
+    with open(manifest_path, "w") as f:
+        f.writelines(p + "\n" for p in files)
+
+
+def read_manifest(manifest_path):
+    with open(manifest_path) as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+
+def shard_files(files, num_shards, shard):
+    """Paths from `files` that belong to `shard`, in manifest order."""
+    return [p for p in files if shard_of(p, num_shards) == shard]
+
+
+def parse_shard_range(text, num_shards):
+    """'0-7,12' -> [0, 1, ..., 7, 12]."""
+    shards = set()
+    for part in text.split(","):
+        part = part.strip()
+        if "-" in part:
+            a, b = part.split("-")
+            shards.update(range(int(a), int(b) + 1))
+        elif part:
+            shards.add(int(part))
+    bad = [s for s in shards if not 0 <= s < num_shards]
+    if bad:
+        raise ValueError(f"Shards {bad} out of range for {num_shards} shards")
+    return sorted(shards)
+
+
+class ShardCoordinator:
+    """
+    Hands out shards to workers through one SQLite file on the shared filesystem.
+
+    A claimed shard is leased to its worker, which refreshes a heartbeat while it
+    runs. If the worker dies, the lease expires and the shard is handed out again.
+    Shards that fail max_attempts times are left as 'failed'.
+
+    Note: SQLite relies on the filesystem's locks, so the shared mount must
+    support POSIX locking (NFSv4 and most cluster filesystems do).
+    """
+
+    def __init__(self, db_path, lease_seconds=600, max_attempts=3):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def init(self, num_shards, config, force=False):
+        """
+        Creates the shard table (all 'pending') and stores the run config.
+
+        Re-running init with the same config keeps the existing run and its progress.
+        A different config (other images, pipeline or shard count) would be paired
+        with shards partitioned for the old one, so it is refused unless force is
+        set, which drops the old run's shards.
+
+        Returns:
+            created (bool): True if a new run was set up, False if the same one already existed.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("""CREATE TABLE IF NOT EXISTS shards (
+                shard INTEGER PRIMARY KEY, status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT, heartbeat REAL, attempts INTEGER NOT NULL DEFAULT 0,
+                ok INTEGER, fail INTEGER, error TEXT)""")
+            row = conn.execute("SELECT value FROM meta WHERE key = 'config'").fetchone()
+            old = json.loads(row["value"]) if row is not None else None
+            if old == config:
+                conn.execute("COMMIT")
+                return False
+            if old is not None and not force:
+                conn.execute("ROLLBACK")
+                changed = sorted(k for k in set(old) | set(config) if old.get(k) != config.get(k))
+                raise ValueError(f"{self.db_path} already holds a run with a different {', '.join(changed)}; "
+                                 "use a new --db, or --force to start over")
+            conn.execute("DELETE FROM meta")
+            conn.execute("DELETE FROM shards")
+            conn.execute("INSERT INTO meta VALUES ('config', ?)", (json.dumps(config),))
+            conn.executemany("INSERT INTO shards (shard) VALUES (?)", [(s,) for s in range(num_shards)])
+            conn.execute("COMMIT")
+            return True
+
+    def config(self):
+        with self._connect() as conn:
+            return json.loads(conn.execute("SELECT value FROM meta WHERE key = 'config'").fetchone()[0])
+
+    def claim(self, worker):
+        """Leases the next pending (or expired) shard to worker; None when nothing is left."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                """SELECT shard FROM shards
+                   WHERE status = 'pending' OR (status = 'running' AND heartbeat < ?)
+                   ORDER BY shard LIMIT 1""", (now - self.lease_seconds,)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute("UPDATE shards SET status = 'running', worker = ?, heartbeat = ?, attempts = attempts + 1 "
+                         "WHERE shard = ?", (worker, now, row["shard"]))
+            conn.execute("COMMIT")
+            return row["shard"]
+
+    def heartbeat(self, shard, worker):
+        with self._connect() as conn:
+            conn.execute("UPDATE shards SET heartbeat = ? WHERE shard = ? AND worker = ?", (time.time(), shard, worker))
+
+    def complete(self, shard, worker, ok, fail, publish=None, leased=True):
+        """
+        Marks a shard done with its counts.
+
+        Parameters:
+            leased (bool): Only accept it from the worker that still holds the shard's lease;
+                           a worker whose lease expired and was handed out again is refused.
+                           False for shards run by explicit range (no claiming).
+            publish (callable | None): Called inside the same transaction once the shard is
+                                       accepted (e.g. to move the metrics partition into place),
+                                       so a refused worker never publishes anything.
+
+        Returns:
+            accepted (bool): False if the lease had been lost.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if leased:
+                cur = conn.execute("UPDATE shards SET status = 'done', ok = ?, fail = ?, error = NULL "
+                                   "WHERE shard = ? AND worker = ? AND status = 'running'",
+                                   (ok, fail, shard, worker))
+            else:
+                cur = conn.execute("UPDATE shards SET status = 'done', worker = ?, ok = ?, fail = ?, error = NULL "
+                                   "WHERE shard = ?", (worker, ok, fail, shard))
+            if cur.rowcount != 1:
+                conn.execute("ROLLBACK")
+                return False
+            try:
+                if publish is not None:
+                    publish()
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return True
+
+    def release(self, shard, worker, error):
+        """Gives a shard back after an error; it is retried until max_attempts."""
+        with self._connect() as conn:
+            conn.execute("UPDATE shards SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                         "error = ? WHERE shard = ? AND worker = ?", (self.max_attempts, error, shard, worker))
+
+    def status(self):
+        """Counts of shards per status, plus totals of saved / failed images."""
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM shards GROUP BY status").fetchall())
+            ok, fail = conn.execute("SELECT COALESCE(SUM(ok), 0), COALESCE(SUM(fail), 0) FROM shards").fetchone()
+        return {"shards": counts, "images_ok": ok, "images_failed": fail}
+
+
+def run_dir_of(db_path):
+    return os.path.dirname(os.path.abspath(db_path))
+
+
+def partition_path(run_dir, shard):
+    return os.path.join(run_dir, "metrics", f"shard-{shard:05d}.csv")
+
+
+def tmp_partition_path(run_dir, shard, worker=None):
+    """
+    Temporary metrics partition of a shard, named after the worker and process, so
+    two workers that both ran the shard (one of them after losing its lease) never
+    write the same file.
+    """
+    tag = re.sub(r"[^A-Za-z0-9_.-]", "_", worker or socket.gethostname())
+    return f"{partition_path(run_dir, shard)}.{tag}-{os.getpid()}.tmp"
+
+
+def run_shard(config, files, shard, run_dir, worker=None):
+    """
+    Processes one shard with batch_runner.run_batch into a temporary metrics partition.
+
+    The partition (tmp_partition_path) is moved into place by publish_partition
+    once the coordinator accepts the shard.
+
+    Returns:
+        ok (int), fail (int): Images saved / failed in this shard.
+        tmp_part (str | None): Temporary partition to publish (None for an empty shard).
+    """
+    from batch_runner import run_batch
+
+    paths = shard_files(files, config["num_shards"], shard)
+    print(f"\n=== Shard {shard} ({len(paths)} images) ===")
+    if not paths:
+        return 0, 0, None
+    tmp_part = tmp_partition_path(run_dir, shard, worker)
+    os.makedirs(os.path.dirname(tmp_part), exist_ok=True)
+    ok, fail = run_batch(config["pipeline"], out_dir=config["out_dir"], files=paths,
+                         post_stages=config.get("post_stages", ()), metrics_path=tmp_part,
+                         quality_gate=config.get("quality_gate"), ledger_path=config.get("ledger"))
+    return ok, fail, tmp_part
+
+
+def publish_partition(tmp_part, run_dir, shard):
+    """Atomically renames a shard's temporary partition to the name merge_metrics reads."""
+    if tmp_part is not None:
+        os.replace(tmp_part, partition_path(run_dir, shard))
+
+
+def discard_partition(tmp_part):
+    if tmp_part is not None and os.path.exists(tmp_part):
+        os.remove(tmp_part)
+
+
+def work(db_path, worker=None):
+    """
+    Worker loop: claims shards from the coordinator until none are left.
+
+    Returns:
+        shards_done (int): Number of shards this worker completed.
+    """
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    coord = ShardCoordinator(db_path)
+    config = coord.config()
+    files = read_manifest(config["manifest"])
+    run_dir = run_dir_of(db_path)
+
+    done = 0
+    while True:
+        shard = coord.claim(worker)
+        if shard is None:
+            return done
+
+        # Keep the lease alive while the shard runs
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(coord.lease_seconds / 3):
+                coord.heartbeat(shard, worker)
+
+        beater = threading.Thread(target=beat, daemon=True)
+        beater.start()
+        tmp_part = tmp_partition_path(run_dir, shard, worker)
+        try:
+            ok, fail, tmp_part = run_shard(config, files, shard, run_dir, worker)
+        except Exception as e:
+            discard_partition(tmp_part)
+            coord.release(shard, worker, f"{type(e).__name__}: {e}")
+            print(f"[FAIL] shard {shard}: {e}")
+            continue
+        finally:
+            stop.set()
+            beater.join()
+        if coord.complete(shard, worker, ok, fail, lambda: publish_partition(tmp_part, run_dir, shard)):
+            done += 1
+        else:
+            # The lease expired and the shard went to another worker, whose results stand
+            discard_partition(tmp_part)
+            print(f"[WARN] shard {shard}: lease lost to another worker, results discarded")
+
+
+def merge_metrics(run_dir, out_path=None):
+    """
+    Concatenates the per-shard metric partitions into one CSV, in shard order.
+
+    Returns:
+        out_path (str): Path of the merged CSV.
+        n_rows (int): Number of metric rows written.
+    """
+    parts = sorted(glob.glob(os.path.join(run_dir, "metrics", "shard-*.csv")))
+    out_path = out_path or os.path.join(run_dir, "metrics.csv")
+    n_rows = 0
+    with open(out_path, "w", newline="") as out:
+        writer = None
+        for part in parts:
+            with open(part, newline="") as f:
+                reader = csv.DictReader(f)
+                if writer is None:
+                    writer = csv.DictWriter(out, fieldnames=reader.fieldnames)
+                    writer.writeheader()
+                for row in reader:
+                    writer.writerow(row)
+                    n_rows += 1
+    return out_path, n_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_init = sub.add_parser("init", help="Write the manifest and create the coordinator database")
+    p_init.add_argument("--db", required=True)
+    p_init.add_argument("--raw", default="data/raw_images")
+    p_init.add_argument("--out", default="data/processed_images")
+    p_init.add_argument("--pipeline", required=True, choices=list(PIPELINES))
+    p_init.add_argument("--num-shards", type=int, default=64)
+    p_init.add_argument("--post", default="", help="Comma-separated post-crop stages (see batch_post.py)")
+    p_init.add_argument("--gate", action="store_true", help="Quality-gate images before processing (see quality_gate.py)")
+    p_init.add_argument("--gate-thresholds", default="", help="Quality-gate threshold overrides")
+    p_init.add_argument("--ledger", default=None, help="SQLite runtime ledger every shard appends to (see ledger.py)")
+    p_init.add_argument("--force", action="store_true",
+                        help="Replace an existing run in --db that has a different configuration (drops its progress)")
+
+    p_work = sub.add_parser("work", help="Claim and process shards until none are left")
+    p_work.add_argument("--db", required=True)
+    p_work.add_argument("--processes", type=int, default=1, help="Worker processes on this node")
+
+    p_run = sub.add_parser("run", help="Process a fixed shard range without claiming")
+    p_run.add_argument("--db", required=True)
+    p_run.add_argument("--shards", required=True, help="e.g. 0-7,12")
+
+    p_merge = sub.add_parser("merge", help="Merge metric partitions into one CSV")
+    p_merge.add_argument("--db", required=True)
+    p_merge.add_argument("--output", default=None)
+
+    p_status = sub.add_parser("status", help="Show shard progress")
+    p_status.add_argument("--db", required=True)
+
+    args = parser.parse_args(argv)
+    coord = ShardCoordinator(args.db)
+
+    if args.command == "init":
+        run_dir = run_dir_of(args.db)
+        os.makedirs(run_dir, exist_ok=True)
+        manifest = os.path.join(run_dir, "manifest.txt")
+        files = manifest_files(args.raw)
+        try:
+            created = coord.init(args.num_shards, {
+                "pipeline": args.pipeline, "num_shards": args.num_shards, "manifest": manifest,
+                "raw_dir": os.path.abspath(args.raw), "out_dir": os.path.abspath(args.out),
+                "post_stages": [p.strip() for p in args.post.split(",") if p.strip()],
+                "quality_gate": parse_thresholds(args.gate_thresholds) if (args.gate or args.gate_thresholds) else None,
+                "ledger": os.path.abspath(args.ledger) if args.ledger else None,
+                # Images added to --raw later must not silently join shards that are already done
+                "images": hashlib.blake2b("\n".join(files).encode("utf-8"), digest_size=16).hexdigest(),
+            }, force=args.force)
+        except ValueError as e:
+            parser.error(str(e))
+        if not created:
+            print(f"{args.db} already holds this run ({len(files)} images in {args.num_shards} shards); kept.")
+            return
+        # A replaced run's partitions must not be merged into the new one
+        for part in glob.glob(os.path.join(run_dir, "metrics", "shard-*.csv*")):
+            os.remove(part)
+        write_manifest(files, manifest)
+        print(f"{len(files)} images in {args.num_shards} shards. Manifest: {manifest}")
+
+    elif args.command == "work":
+        if args.processes > 1:
+            procs = [mp.Process(target=work, args=(args.db,)) for _ in range(args.processes)]
+            for p in procs:
+                p.start()
+            for p in procs:
+                p.join()
+        else:
+            work(args.db)
+        print(json.dumps(coord.status(), indent=2))
+
+    elif args.command == "run":
+        config = coord.config()
+        files = read_manifest(config["manifest"])
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        run_dir = run_dir_of(args.db)
+        for shard in parse_shard_range(args.shards, config["num_shards"]):
+            try:
+                ok, fail, tmp_part = run_shard(config, files, shard, run_dir, worker)
+            except BaseException:
+                discard_partition(tmp_partition_path(run_dir, shard, worker))
+                raise
+            coord.complete(shard, worker, ok, fail, lambda: publish_partition(tmp_part, run_dir, shard),
+                           leased=False)
+
+    elif args.command == "merge":
+        out_path, n_rows = merge_metrics(run_dir_of(args.db), args.output)
+        status = coord.status()
+        missing = sum(v for k, v in status["shards"].items() if k != "done")
+        print(f"Merged {n_rows} metric rows into {out_path}"
+              + (f" ({missing} shard(s) not done yet)" if missing else ""))
+
+    elif args.command == "status":
+        print(json.dumps(coord.status(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
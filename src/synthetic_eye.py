@@ -0,0 +1,163 @@
+import os
+import argparse
+
+import cv2
+import numpy as np
+
+
+def synthesize_eye(
+    height=2400,
+    width=4600,
+    seed=0,
+    iris_fraction=(0.18, 0.26),
+    noise_sigma=6.0,
+    illumination=0.35,
+    glare=True,
+    eyelids=True,
+):
+    """
+    Generates a deterministic eye-like BGR frame for benchmarks and soak tests.
+
+    The frame has skin around a sclera ellipse, a textured iris with a darker limbus
+    ring, a pupil, optional eyelid occlusion and specular glare, a smooth uneven
+    illumination field and per-pixel sensor noise. The same seed and size always
+    produce the same frame; layout and colours scale with the resolution.
+
+    Parameters:
+        height, width (int): Output size in pixels (raw captures are about 2400x4600).
+        seed (int): Random seed; everything (layout, colours, noise) derives from it.
+        iris_fraction (tuple[float, float]): Range for the iris radius as a fraction of height.
+        noise_sigma (float): Standard deviation of the Gaussian sensor noise (0 = none).
+        illumination (float): Strength of the uneven illumination field (0 = flat).
+        glare (bool): Add 1-3 specular highlights near the pupil.
+        eyelids (bool): Let the upper/lower eyelids cover part of the iris.
+
+    Returns:
+        img (np.ndarray): Synthetic BGR uint8 image of shape (height, width, 3).
+        truth (dict): Ground truth: 'center' (x, y), 'iris_radius', 'pupil_radius', 'seed'.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Skin background
+    skin = rng.uniform([80, 100, 140], [120, 140, 200])
+    img = np.empty((height, width, 3), np.uint8)
+    img[:] = skin.astype(np.uint8)
+
+    # Eye centre, jittered around the middle of the frame
+    cx = int(width * rng.uniform(0.42, 0.58))
+    cy = int(height * rng.uniform(0.42, 0.58))
+    r_iris = max(int(height * rng.uniform(*iris_fraction)), 4)
+    r_pupil = max(int(r_iris * rng.uniform(0.25, 0.45)), 2)
+
+    # Sclera
+    sclera_axes = (min(int(r_iris * rng.uniform(2.2, 2.8)), width // 2), int(r_iris * rng.uniform(1.2, 1.4)))
+    sclera = rng.uniform([200, 205, 215], [235, 240, 250])
+    cv2.ellipse(img, (cx, cy), sclera_axes, rng.uniform(-5, 5), 0, 360, sclera.tolist(), -1, cv2.LINE_AA)
+
+    # Iris: base colour with low-frequency texture, only computed inside its bounding box
+    x1, y1 = max(cx - r_iris, 0), max(cy - r_iris, 0)
+    x2, y2 = min(cx + r_iris + 1, width), min(cy + r_iris + 1, height)
+    iris_color = rng.uniform([30, 60, 70], [110, 130, 150]).astype(np.float32)
+    tex = cv2.resize(rng.standard_normal((48, 48), dtype=np.float32), (x2 - x1, y2 - y1),
+                     interpolation=cv2.INTER_CUBIC)
+    patch = np.clip(iris_color * (1.0 + 0.25 * tex[..., None]), 0, 255).astype(np.uint8)
+    mask = np.zeros((y2 - y1, x2 - x1), np.uint8)
+    cv2.circle(mask, (cx - x1, cy - y1), r_iris, 255, -1, cv2.LINE_AA)
+    roi = img[y1:y2, x1:x2]
+    np.copyto(roi, patch, where=mask[..., None] > 127)
+
+    # Limbus ring and pupil
+    limbus = (iris_color * 0.5).tolist()
+    cv2.circle(img, (cx, cy), r_iris, limbus, max(r_iris // 15, 1), cv2.LINE_AA)
+    cv2.circle(img, (cx, cy), r_pupil, rng.uniform(5, 20, 3).tolist(), -1, cv2.LINE_AA)
+
+    # Eyelids: skin-coloured ellipses reaching into the top/bottom of the iris
+    if eyelids:
+        lid_w = int(sclera_axes[0] * 1.6)
+        top_edge = cy - int(r_iris * rng.uniform(0.6, 1.0))
+        bottom_edge = cy + int(r_iris * rng.uniform(0.8, 1.1))
+        lid_h = height
+        cv2.ellipse(img, (cx, top_edge - lid_h), (lid_w, lid_h), 0, 0, 360, skin.tolist(), -1, cv2.LINE_AA)
+        cv2.ellipse(img, (cx, bottom_edge + lid_h), (lid_w, lid_h), 0, 0, 360, skin.tolist(), -1, cv2.LINE_AA)
+
+    # Specular glare spots near the pupil
+    if glare:
+        for _ in range(rng.integers(1, 4)):
+            gx = int(cx + rng.uniform(-0.6, 0.6) * r_iris)
+            gy = int(cy + rng.uniform(-0.6, 0.6) * r_iris)
+            axes = (max(int(r_pupil * rng.uniform(0.1, 0.35)), 1), max(int(r_pupil * rng.uniform(0.1, 0.35)), 1))
+            cv2.ellipse(img, (gx, gy), axes, rng.uniform(0, 180), 0, 360, (255, 255, 255), -1, cv2.LINE_AA)
+
+    # Uneven illumination (smooth gain field) + sensor noise in one float32 pass
+    out = img.astype(np.float32)
+    if illumination > 0:
+        field = cv2.resize(rng.uniform(1 - illumination, 1 + illumination * 0.5, (4, 6)).astype(np.float32),
+                           (width, height), interpolation=cv2.INTER_CUBIC)
+        out *= field[..., None]
+    if noise_sigma > 0:
+        noise = rng.standard_normal((height, width), dtype=np.float32)
+        noise *= noise_sigma
+        out += noise[..., None]
+    np.clip(out, 0, 255, out=out)
+
+    truth = {"center": (cx, cy), "iris_radius": r_iris, "pupil_radius": r_pupil, "seed": seed}
+    return out.astype(np.uint8), truth
+
+
+def synthesize_eye_jpeg(height=2400, width=4600, seed=0, quality=92, **kwargs):
+    """Same as synthesize_eye but returns (jpeg_bytes, truth), like a camera file."""
+    img, truth = synthesize_eye(height, width, seed, **kwargs)
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("cv2.imencode returned False")
+    return buf.tobytes(), truth
+
+
+def write_synthetic_dataset(out_dir, n_images=20, size=(2400, 4600), seed=0, burst=1, quality=92, **kwargs):
+    """
+    Writes n_images synthetic JPEGs named like clinic captures ('S0001_synthetic_BL (1).JPG').
+
+    Parameters:
+        out_dir (str): Folder to write to (created if missing).
+        n_images (int): Number of images.
+        size (tuple[int, int]): (height, width).
+        seed (int): Base seed; subject k uses seed + k.
+        burst (int): Frames per subject; frames in a burst share a layout and differ only in noise.
+        quality (int): JPEG quality.
+
+    Returns:
+        paths (list[str]): Written file paths.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i in range(n_images):
+        subject, frame = divmod(i, burst)
+        img, _ = synthesize_eye(size[0], size[1], seed=seed + subject, **kwargs)
+        if frame:
+            # Burst frames: same scene, fresh sensor noise
+            jitter = np.random.default_rng((seed + subject, frame)).normal(0, 3, img.shape[:2]).astype(np.float32)
+            img = np.clip(img + jitter[..., None], 0, 255).astype(np.uint8)
+        path = os.path.join(out_dir, f"S{seed + subject:04d}_synthetic_BL ({frame + 1}).JPG")
+        if not cv2.imwrite(path, img, [cv2.IMWRITE_JPEG_QUALITY, quality]):
+            raise RuntimeError(f"cv2.imwrite returned False for {path}")
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a folder of synthetic eye images.")
+    parser.add_argument("--out", default="data/synthetic_images", help="Output folder (default: %(default)s)")
+    parser.add_argument("-n", "--n-images", type=int, default=20)
+    parser.add_argument("--size", default="2400x4600", help="HEIGHTxWIDTH (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--burst", type=int, default=1, help="Near-identical frames per subject")
+    args = parser.parse_args(argv)
+
+    h, w = (int(v) for v in args.size.lower().split("x"))
+    written = write_synthetic_dataset(args.out, args.n_images, (h, w), args.seed, args.burst)
+    print(f"{len(written)} synthetic images written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,10 +3,22 @@ import cv2
 import numpy as np
 from homomorphic_filter import homomorphic_filter_color  # adjust path if needed
 from contour_crop import contour_crop_eye
+from quality_gate import check_quality
 
-def process_image_with_hf_and_contour(filename, input_folder='data/raw_images', output_folder='data/hf_contour_output'):
+def process_image_with_hf_and_contour(filename, input_folder='data/raw_images', output_folder='data/hf_contour_output',
+                                      quality_thresholds=None):
     os.makedirs(output_folder, exist_ok=True)
 
+    # Step 0: Cheap quality gate on a 1/8 thumbnail, before the expensive steps
+    try:
+        passed, reasons, _ = check_quality(os.path.join(input_folder, filename), quality_thresholds)
+    except Exception as e:
+        print(f"[FAIL] {filename}: Quality gate could not read image → {e}")
+        return
+    if not passed:
+        print(f"[FAIL] {filename}: Rejected by quality gate → {'; '.join(reasons)}")
+        return
+
     # Step 1: Apply Homomorphic Filtering
     try:
         hf_img, _ = homomorphic_filter_color(filename, fname=filename)
@@ -2,6 +2,8 @@ import os
 import cv2
 import numpy as np
 
+from frame import Frame
+
 def tophat_extract_l_channel(
     img_or_filename,
     fname=None,
@@ -60,7 +62,7 @@ def tophat_extract_l_channel(
             raise ValueError(f"Image not found or unreadable: {image_path}")
 
     # Convert to LAB and split channels
-    lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
+    lab = Frame.of(img).lab()
     l, a, b = cv2.split(lab)
 
     # Apply top-hat to L channel
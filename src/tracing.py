@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+
+from pipelines import call_stage
+
+
+def print_total_time(start_time):
+    """Prints the 'Total processing time' footer of a run started at time.time() == start_time; returns the seconds."""
+    elapsed = time.time() - start_time
+    print(f"\nTotal processing time: {elapsed:.2f} seconds")
+    return elapsed
+
+
+class Tracer:
+    """
+    Opt-in per-stage instrumentation for pipeline runs.
+
+    Every span records wall time (and, with memory=True, the bytes allocated and
+    peak traced memory while it was open). Spans nest, so a per-image span
+    contains its decode, stage and imwrite spans. Pass `tracer.stage` as the
+    stage caller to `run_pipeline` to trace every stage call.
+
+    Memory sampling uses tracemalloc, which sees NumPy buffers but not OpenCV's
+    internal allocations; it costs noticeably more than timing alone, so it is
+    off by default.
+
+    Usage:
+        tracer = Tracer()
+        with tracer.span(fname, cat="image"):
+            final_img, fname = run_pipeline("p7", img, fname, stage=tracer.stage)
+        tracer.save_chrome_trace("trace.json")   # open in chrome://tracing or ui.perfetto.dev
+        tracer.print_summary()
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.events = []
+        self._stack = []
+        self._t0 = time.perf_counter()
+        self._pid = os.getpid()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _now_us(self):
+        return (time.perf_counter() - self._t0) * 1e6
+
+    @contextmanager
+    def span(self, name, cat="stage", **args):
+        """Times the enclosed block as one event; extra kwargs are stored with it."""
+        frame = {"max_abs": 0}
+        if self.memory:
+            cur0, peak_before = tracemalloc.get_traced_memory()
+            if self._stack:
+                # Keep the enclosing span's peak before resetting it for this one
+                parent = self._stack[-1]
+                parent["max_abs"] = max(parent["max_abs"], peak_before)
+            tracemalloc.reset_peak()
+        self._stack.append(frame)
+        start = self._now_us()
+        try:
+            yield
+        finally:
+            dur = self._now_us() - start
+            self._stack.pop()
+            event = {"name": name, "cat": cat, "ph": "X", "ts": start, "dur": dur,
+                     "pid": self._pid, "tid": threading.get_ident(), "args": dict(args)}
+            if self.memory:
+                cur, peak = tracemalloc.get_traced_memory()
+                peak_abs = max(peak, frame["max_abs"])
+                if self._stack:
+                    self._stack[-1]["max_abs"] = max(self._stack[-1]["max_abs"], peak_abs)
+                event["args"]["alloc_mb"] = (cur - cur0) / 1024 ** 2
+                event["args"]["peak_mb"] = (peak_abs - cur0) / 1024 ** 2
+                self.events.append({"name": "traced_memory", "ph": "C", "ts": start + dur,
+                                    "pid": self._pid, "args": {"MB": cur / 1024 ** 2}})
+            self.events.append(event)
+
+    def stage(self, name, *args, **kwargs):
+        """Stage caller for `run_pipeline(..., stage=tracer.stage)`."""
+        with self.span(name, cat="stage"):
+            return call_stage(name, *args, **kwargs)
+
+    def save_chrome_trace(self, path):
+        """Writes the events as Chrome trace / Perfetto JSON."""
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+        return path
+
+    def summary(self):
+        """
+        Aggregates complete events by (category, name).
+
+        Returns:
+            rows (list[dict]): count, total/mean/p50/p95/max ms, share of image time and
+                               (with memory=True) the largest peak MB, slowest first.
+        """
+        groups = {}
+        for e in self.events:
+            if e["ph"] == "X":
+                groups.setdefault((e["cat"], e["name"]), []).append(e)
+
+        image_total = sum(e["dur"] for e in self.events if e["ph"] == "X" and e["cat"] == "image")
+        rows = []
+        for (cat, name), events in groups.items():
+            if cat == "image":
+                continue
+            durs = np.array([e["dur"] for e in events]) / 1000.0
+            row = {
+                "cat": cat, "name": name, "count": len(durs),
+                "total_ms": durs.sum(), "mean_ms": durs.mean(),
+                "p50_ms": np.percentile(durs, 50), "p95_ms": np.percentile(durs, 95),
+                "max_ms": durs.max(),
+                "share": durs.sum() * 1000.0 / image_total if image_total else float("nan"),
+            }
+            if self.memory:
+                row["peak_mb"] = max(e["args"].get("peak_mb", 0.0) for e in events)
+            rows.append(row)
+        return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+
+    def print_summary(self):
+        rows = self.summary()
+        header = f"{'span':<34}{'count':>6}{'total ms':>11}{'mean ms':>10}{'p95 ms':>10}{'share':>8}"
+        print("\n" + header + ("  peak MB" if self.memory else ""))
+        for r in rows:
+            line = (f"{r['cat'] + ':' + r['name']:<34}{r['count']:>6}{r['total_ms']:>11.1f}"
+                    f"{r['mean_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['share']:>8.1%}")
+            if self.memory:
+                line += f"{r['peak_mb']:>9.1f}"
+            print(line)
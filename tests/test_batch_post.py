@@ -0,0 +1,58 @@
+import cv2
+import numpy as np
+import pytest
+from scipy.stats import pearsonr
+
+from batch_post import edge_metrics, frame_metrics, frame_metrics_batch
+from frame import frame_scope
+from synthetic_eye import synthesize_eye
+
+
+def test_frame_metrics_matches_batch():
+    frames = [synthesize_eye(120, 230, seed=seed)[0] for seed in range(3)]
+    batch = frame_metrics_batch(np.stack(frames))
+    for i, img in enumerate(frames):
+        for key, value in frame_metrics(img).items():
+            assert value == pytest.approx(batch[key][i], rel=1e-9), key
+
+
+def test_frame_metrics_reuses_registered_views():
+    img = synthesize_eye(120, 230, seed=0)[0]
+    with frame_scope() as scope:
+        frame = scope.own(img)
+        gray = frame.gray()
+        frame_metrics(img)
+        assert frame.gray() is gray
+        assert {"histogram", "laplacian_var"} <= set(frame._views)
+
+
+def test_edge_metrics_match_notebook():
+    raw = cv2.cvtColor(synthesize_eye(240, 460, seed=1)[0], cv2.COLOR_BGR2GRAY)
+    processed = cv2.equalizeHist(raw)
+
+    def sobel(gray):
+        return cv2.magnitude(cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3), cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3))
+
+    # image_test.ipynb's original computation
+    m8 = cv2.normalize(sobel(processed), None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    _, edges = cv2.threshold(m8, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    r, _ = pearsonr(sobel(raw).ravel(), sobel(processed).ravel())
+
+    metrics = edge_metrics(processed, reference=raw)
+    assert metrics["edge_density"] == pytest.approx((edges > 0).mean() * 100.0, rel=1e-12)
+    assert metrics["edge_preservation"] == pytest.approx(r, rel=1e-5)
+    assert np.isnan(edge_metrics(processed)["edge_preservation"])
+    assert np.isnan(edge_metrics(processed, reference=np.zeros_like(raw))["edge_preservation"])
+
+
+def test_edge_metrics_reuse_the_sobel_view():
+    img = synthesize_eye(120, 230, seed=0)[0]
+    with frame_scope() as scope:
+        frame = scope.own(img)
+        mag = frame.sobel_magnitude()
+        edge_metrics(img)
+        assert frame.sobel_magnitude() is mag
+        assert not mag.flags.writeable
+        with frame.edit() as pixels:
+            pixels[:10] = 0
+        assert frame.sobel_magnitude() is not mag
@@ -0,0 +1,50 @@
+import csv
+import os
+
+import cv2
+import numpy as np
+
+from batch_runner import main
+from pipelines import run_pipeline
+from synthetic_eye import synthesize_eye
+
+
+def _frame_metrics(img):
+    """Per-frame reference for batch_post.frame_metrics_batch, straight from OpenCV."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    p = np.bincount(gray.ravel(), minlength=256) / gray.size
+    p = p[p > 0]
+    return {
+        "mean_brightness": gray.mean(),
+        "rms_contrast": gray.std(),
+        "laplacian_var": cv2.Laplacian(gray, cv2.CV_64F).var(),
+        "histogram_entropy": -(p * np.log2(p)).sum(),
+    }
+
+
+def test_metrics_ignore_post_stages(tmp_path):
+    raw, out = tmp_path / "raw", tmp_path / "out"
+    raw.mkdir()
+    crops, expected = {}, {}
+    for seed in range(3):
+        img, _ = synthesize_eye(240, 460, seed=seed)
+        fname = f"eye_{seed}.png"
+        cv2.imwrite(str(raw / fname), img)
+        crops[fname], _ = run_pipeline("p1", img, fname)
+        expected[fname] = _frame_metrics(crops[fname])
+
+    metrics_path = tmp_path / "metrics.csv"
+    assert main(["p1", "--raw", str(raw), "--out", str(out), "--post", "to_rgb", "--batch-size", "2",
+                 "--metrics", str(metrics_path), "--no-ledger", "--no-journal"]) == 0
+
+    with open(metrics_path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == len(expected)
+    for row in rows:
+        fname = row["image_name"].replace("_processed_pipelinetest1", "")
+        for key, value in expected[fname].items():
+            assert np.isclose(float(row[key]), value, rtol=1e-9), (fname, key)
+
+        # The saved crop still went through the post stage
+        saved = cv2.imread(os.path.join(out, row["image_name"]))
+        assert np.array_equal(saved, crops[fname][..., ::-1])
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+from matplotlib import cbook
+
+from box_summary import box_summaries
+
+
+def _sheet(groups, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for label, values in groups.items():
+        frames.append(pd.DataFrame({"pipeline": label, "metric": np.asarray(values, dtype=float)}))
+    return pd.concat(frames, ignore_index=True).sample(frac=1, random_state=rng.integers(1 << 31))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_cbook_boxplot_stats(seed):
+    rng = np.random.default_rng(seed)
+    groups = {
+        "p0": rng.normal(50, 10, 300),
+        "p1": np.concatenate([rng.normal(0, 1, 200), rng.normal(0, 1, 5) * 20]),   # outliers
+        "p2": rng.integers(0, 4, 150),                                            # heavy ties
+        "p3": np.round(rng.exponential(2, 80)),                                   # skewed ties
+        "p4": [0, 1, 1, 1],                    # lowest in-range value above q1
+        "p5": [1, 1, 1, 2],                    # highest in-range value below q3
+        "p6": [3.0],
+        "p7": [2, 2, 2, 2, 2, 9],
+    }
+    stats = box_summaries(_sheet(groups, seed), ["metric"], max_fliers=None)["metric"]
+    assert [row["label"] for row in stats] == sorted(groups)
+    for row in stats:
+        expected = cbook.boxplot_stats(np.asarray(groups[row["label"]], dtype=float))[0]
+        for key in ("med", "q1", "q3", "whislo", "whishi", "mean"):
+            assert row[key] == pytest.approx(expected[key], rel=1e-12, abs=1e-12), (row["label"], key)
+        assert np.allclose(np.sort(row["fliers"]), np.sort(expected["fliers"])), row["label"]
+        assert row["n"] == len(groups[row["label"]])
+
+
+def test_flier_sample_keeps_extremes():
+    values = np.random.default_rng(0).standard_t(1, 5000)    # heavy tails: hundreds of fliers
+    stats = box_summaries(_sheet({"p1": values}), ["metric"], max_fliers=50)["metric"][0]
+    expected = cbook.boxplot_stats(values)[0]
+    assert len(expected["fliers"]) > 52 and len(stats["fliers"]) <= 52
+    assert np.isin(stats["fliers"], expected["fliers"]).all()
+    assert stats["fliers"].min() == expected["fliers"].min()
+    assert stats["fliers"].max() == expected["fliers"].max()
@@ -0,0 +1,70 @@
+import sqlite3
+
+import cv2
+import pytest
+
+from batch_runner import run_batch
+from checkpoint import RunJournal
+from synthetic_eye import synthesize_eye
+
+
+@pytest.fixture
+def run(tmp_path):
+    raw, out = tmp_path / "raw", tmp_path / "out"
+    raw.mkdir()
+    for seed in range(3):
+        cv2.imwrite(str(raw / f"eye_{seed}.png"), synthesize_eye(120, 230, seed=seed)[0])
+    (raw / "broken.png").write_bytes(b"not an image")
+    journal = str(tmp_path / "journal.sqlite")
+
+    def batch(**kwargs):
+        return run_batch("p1", raw_dir=str(raw), out_dir=str(kwargs.pop("out", out)), journal_path=journal, **kwargs)
+
+    return raw, out, journal, batch
+
+
+def _statuses(journal):
+    with sqlite3.connect(journal) as conn:
+        return dict(conn.execute("SELECT image_name, status FROM entries"))
+
+
+def test_resume_skips_finished_images(run):
+    raw, out, journal, batch = run
+    assert batch() == (3, 1)
+    assert _statuses(journal) == {"eye_0.png": "ok", "eye_1.png": "ok", "eye_2.png": "ok", "broken.png": "fail"}
+
+    # Only the failed image is run again
+    assert batch(resume=True) == (0, 1)
+
+    # A finished image whose output is gone is run again, and so is a run into another folder
+    (out / "eye_1_processed_pipelinetest1.png").unlink()
+    assert batch(resume=True) == (1, 1)
+    assert batch(resume=True, out=out.parent / "elsewhere") == (3, 1)
+
+
+def test_retry_failed_selects_only_failures(run, capsys):
+    raw, out, journal, batch = run
+    batch()
+    capsys.readouterr()
+
+    assert batch(retry_failed=True) == (0, 1)
+    assert "skipping 3 images, 1 to process" in capsys.readouterr().out
+
+    # Once the input is fixed it has a new digest with no failure recorded; --resume picks it up
+    cv2.imwrite(str(raw / "broken.png"), synthesize_eye(120, 230, seed=9)[0])
+    assert batch(retry_failed=True) == (0, 0)
+    assert batch(resume=True) == (1, 0)
+    assert set(_statuses(journal).values()) == {"ok"}
+
+
+def test_entries_are_keyed_by_content_and_config(run):
+    raw, out, journal, batch = run
+    batch()
+    files = sorted(str(p) for p in raw.iterdir())
+    same = RunJournal(journal, "p1", {"post_stages": [], "quality_gate": None, "out_dir": str(out)})
+    assert same.select(files, str(out), resume=True) == ([str(raw / "broken.png")], 3)
+    other = RunJournal(journal, "p2", {"post_stages": [], "quality_gate": None, "out_dir": str(out)})
+    assert other.select(files, str(out), resume=True) == (files, 0)
+    # A renamed copy of a finished input is still finished
+    (raw / "eye_0.png").rename(raw / "renamed.png")
+    assert same.entry(str(raw / "renamed.png"))[0] == "ok"
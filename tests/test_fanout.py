@@ -0,0 +1,52 @@
+import csv
+import os
+
+import cv2
+import pytest
+
+from batch_post import frame_metrics
+from fanout import run_fanout, trace_plan
+from pipelines import PIPELINES, output_name, run_pipeline
+from synthetic_eye import synthesize_eye
+
+PIPELINE_KEYS = [p for p in PIPELINES if p != "p0"]
+
+
+def test_shared_calls_are_traced():
+    consumers, requested, executed = trace_plan(["p10", "p12", "p13"])
+    # homomorphic -> CLAHE -> Otsu is shared by all three
+    assert executed < requested
+    assert sum(consumers.values()) == requested and len(consumers) == executed
+
+
+def test_outputs_match_separate_runs(tmp_path):
+    raw, out = tmp_path / "raw", tmp_path / "out"
+    raw.mkdir()
+    for seed in range(2):
+        cv2.imwrite(str(raw / f"eye_{seed}.png"), synthesize_eye(480, 920, seed=seed)[0])
+    metrics_path = str(tmp_path / "metrics.csv")
+    ok, fail = run_fanout(PIPELINE_KEYS, str(raw), str(out), metrics_path)
+
+    with open(metrics_path, newline="") as f:
+        metrics = {(row["pipeline"], row["image_name"]): row for row in csv.DictReader(f)}
+
+    expected_ok = expected_fail = 0
+    for fname in sorted(os.listdir(raw)):
+        img = cv2.imread(str(raw / fname))
+        for p in PIPELINE_KEYS:
+            out_path = out / output_name(fname, p)
+            try:
+                final_img, _ = run_pipeline(p, img.copy(), fname)
+            except Exception:
+                # Fails the same way in the fan-out
+                expected_fail += 1
+                assert not out_path.exists()
+                continue
+            expected_ok += 1
+            _, buf = cv2.imencode(".png", final_img)
+            assert out_path.read_bytes() == buf.tobytes(), (fname, p)
+            row = metrics[(p, out_path.name)]
+            for key, value in frame_metrics(final_img).items():
+                assert float(row[key]) == pytest.approx(value, rel=1e-9), (fname, p, key)
+    assert (ok, fail) == (expected_ok, expected_fail)
+    assert len(metrics) == expected_ok
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from Houghcrop import REFERENCE_PIXELS, detect_eye_circle, hough_crop_eye
+from synthetic_eye import synthesize_eye
+
+
+@pytest.mark.parametrize("shape", [(600, 1150), (1200, 2300), (2400, 4600), (3000, 4000)])
+@pytest.mark.parametrize("seed", range(3))
+def test_finds_the_synthetic_iris_at_any_resolution(shape, seed):
+    img, truth = synthesize_eye(*shape, seed=seed)
+    circle = detect_eye_circle(img)
+    assert circle is not None
+    x, y, r = circle
+    (cx, cy), radius = truth["center"], truth["iris_radius"]
+    assert np.hypot(x - cx, y - cy) < 0.08 * radius
+    assert r == pytest.approx(radius, rel=0.1)
+
+
+def test_adaptive_crop_is_centred_on_the_iris():
+    img, truth = synthesize_eye(1200, 2300, seed=1)
+    crop, fname = hough_crop_eye(img, "eye.jpg", target_pixels=REFERENCE_PIXELS)
+    assert crop.shape == (600, 600, 3) and fname == "eye.jpg"
+    # The pupil (darkest disc) ends up in the middle of the crop
+    gray = crop.mean(axis=2)
+    ys, xs = np.nonzero(gray < np.percentile(gray, 2))
+    assert abs(xs.mean() - 300) < 30 and abs(ys.mean() - 300) < 30
+
+
+def test_no_circle_raises():
+    blank = np.full((480, 920, 3), 128, np.uint8)
+    assert detect_eye_circle(blank) is None
+    with pytest.raises(ValueError, match="failed to detect"):
+        hough_crop_eye(blank, "blank.jpg", target_pixels=REFERENCE_PIXELS)
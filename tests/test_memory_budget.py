@@ -0,0 +1,72 @@
+import cv2
+import pytest
+
+from memory_budget import STAGE_MEMORY, MemoryBudgetScheduler, MemoryModel, image_shape
+from synthetic_eye import synthesize_eye
+
+SHAPE = (120, 230)
+
+
+@pytest.fixture
+def images(tmp_path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    paths = []
+    for seed in range(6):
+        path = str(raw / f"eye_{seed}.png")
+        cv2.imwrite(path, synthesize_eye(*SHAPE, seed=seed)[0])
+        paths.append(path)
+    return paths
+
+
+def test_model_estimates(tmp_path):
+    model = MemoryModel()
+    h, w = SHAPE
+    declared = STAGE_MEMORY["contour_crop_eye"](h, w)
+    assert model.stage_bytes("contour_crop_eye", SHAPE) == declared
+    # p1 = decoded input + one stage output + the stage peak
+    assert model.pipeline_bytes("p1", SHAPE) == 2 * h * w * 3 + declared
+
+    # A lower observation never lowers the declared estimate, a higher one raises it
+    model.observe("contour_crop_eye", SHAPE, declared / 10)
+    assert model.stage_bytes("contour_crop_eye", SHAPE) == declared
+    model.observe("contour_crop_eye", SHAPE, 2 * declared)
+    assert model.stage_bytes("contour_crop_eye", SHAPE) == int(2 * declared * model.margin)
+
+    profile = str(tmp_path / "mem.json")
+    model.save(profile)
+    assert MemoryModel(profile).stage_bytes("contour_crop_eye", SHAPE) == int(2 * declared * model.margin)
+
+
+def test_image_shape_from_header(images, tmp_path):
+    assert image_shape(images[0]) == SHAPE
+    jpg = str(tmp_path / "eye.jpg")
+    cv2.imwrite(jpg, synthesize_eye(*SHAPE, seed=0)[0])
+    assert image_shape(jpg) == SHAPE
+
+
+def test_admission_stays_under_budget(images, tmp_path):
+    estimate = MemoryModel().pipeline_bytes("p1", SHAPE)
+    # Room for two images at a time, although there are four workers
+    scheduler = MemoryBudgetScheduler(2.5 * estimate / 1024 ** 2, workers=4, observe=False)
+    ok, fail = scheduler.run("p1", images, str(tmp_path / "out"))
+    assert (ok, fail) == (6, 0)
+    assert scheduler.peak_admitted == 2 * estimate
+
+
+def test_oversized_image_runs_alone(images, tmp_path):
+    estimate = MemoryModel().pipeline_bytes("p1", SHAPE)
+    scheduler = MemoryBudgetScheduler(0.5 * estimate / 1024 ** 2, workers=4, observe=False)
+    assert scheduler.run("p1", images[:3], str(tmp_path / "out")) == (3, 0)
+    assert scheduler.peak_admitted == estimate
+
+
+def test_unreadable_image_reaches_on_result(images, tmp_path):
+    broken = tmp_path / "raw" / "broken.png"
+    broken.write_bytes(b"not an image")
+    results = []
+    scheduler = MemoryBudgetScheduler(None, workers=2, observe=False, on_result=results.append)
+    assert scheduler.run("p1", images[:2] + [str(broken)], str(tmp_path / "out")) == (2, 1)
+    errors = {r["in_path"]: r["error"] for r in results}
+    assert len(errors) == 3
+    assert "unreadable" in errors[str(broken)]
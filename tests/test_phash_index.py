@@ -0,0 +1,73 @@
+import csv
+import os
+import shutil
+from functools import partial
+
+import numpy as np
+
+from phash_index import HashIndex, burst_key, dedupe_files, hamming, link_outputs
+from pipelines import output_name
+from synthetic_eye import write_synthetic_dataset
+
+
+def _dataset(tmp_path):
+    """Three bursts of three frames, plus an exact copy of S0000 (1) filed under another subject."""
+    raw = tmp_path / "raw"
+    paths = write_synthetic_dataset(str(raw), 9, (480, 920), burst=3)
+    stranger = str(raw / "S0099_synthetic_BL (1).JPG")
+    shutil.copyfile(paths[0], stranger)
+    return sorted(paths + [stranger])
+
+
+def test_hamming_matches_bit_count():
+    rng = np.random.default_rng(0)
+    a = rng.integers(0, 2 ** 63, 50, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 2 ** 63, 50, dtype=np.uint64)
+    assert list(hamming(a, b)) == [bin(int(x) ^ int(y)).count("1") for x, y in zip(a, b)]
+    assert list(hamming(a, a[3])) == [bin(int(x) ^ int(a[3])).count("1") for x in a]
+
+
+def test_burst_key():
+    assert burst_key("data/raw/T0018_2019-06-10_BL (3).JPG") == "T0018_2019-06-10_BL"
+    assert burst_key("T0018_BL.JPG") == "T0018_BL"
+
+
+def test_clusters_stay_within_a_burst(tmp_path):
+    files = _dataset(tmp_path)
+    index = HashIndex.build(files)
+    clusters = [sorted(burst_key(index.paths[i]) for i in c) for c in index.clusters()]
+    assert sorted(clusters) == [["S0000_synthetic_BL"] * 3, ["S0001_synthetic_BL"] * 3,
+                                ["S0002_synthetic_BL"] * 3, ["S0099_synthetic_BL"]]
+    # Sharpest frame first
+    for cluster in index.clusters():
+        assert list(index.sharpness[cluster]) == sorted(index.sharpness[cluster], reverse=True)
+
+    # Across bursts the identical copy would have been merged with S0000
+    merged = [c for c in index.clusters(same_burst_only=False) if len(c) == 4]
+    assert len(merged) == 1
+    assert {burst_key(index.paths[i]) for i in merged[0]} == {"S0000_synthetic_BL", "S0099_synthetic_BL"}
+
+
+def test_dedupe_and_link_outputs(tmp_path):
+    files = _dataset(tmp_path)
+    index_path = str(tmp_path / "index.csv")
+    representatives, linked = dedupe_files(files, index_path)
+    assert len(representatives) == 4 and len(linked) == 6
+    assert all(burst_key(member) == burst_key(rep) for member, (rep, _, _) in linked.items())
+
+    # Reloaded index gives the same hashes
+    reloaded = HashIndex.load(index_path)
+    assert reloaded.paths == HashIndex.build(files).paths
+    assert np.array_equal(reloaded.dhash, HashIndex.build(files).dhash)
+
+    out = tmp_path / "out"
+    out.mkdir()
+    name = partial(output_name, pipeline="p1")
+    for rep in representatives:
+        (out / name(rep)).write_bytes(os.path.basename(rep).encode())
+    duplicates = str(tmp_path / "duplicates.csv")
+    assert link_outputs(linked, str(out), name, duplicates) == 6
+    for member, (rep, _, _) in linked.items():
+        assert (out / name(member)).read_bytes() == os.path.basename(rep).encode()
+    with open(duplicates, newline="") as f:
+        assert sorted(r["image_name"] for r in csv.DictReader(f)) == sorted(os.path.basename(m) for m in linked)
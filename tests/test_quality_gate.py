@@ -0,0 +1,62 @@
+import csv
+
+import cv2
+import numpy as np
+import pytest
+
+from batch_runner import run_batch
+from quality_gate import check_quality, parse_thresholds
+from synthetic_eye import synthesize_eye
+
+
+@pytest.fixture(scope="module")
+def eye():
+    return synthesize_eye(480, 920, seed=0)[0]
+
+
+def test_parse_thresholds():
+    assert parse_thresholds("") == {}
+    assert parse_thresholds(" min_brightness=10 , max_glare_fraction=0.1,min_roi_fraction=None") == {
+        "min_brightness": 10.0, "max_glare_fraction": 0.1, "min_roi_fraction": None}
+
+
+def test_good_frame_passes(eye):
+    passed, reasons, stats = check_quality(eye)
+    assert passed and reasons == []
+    assert set(stats) == {"brightness", "laplacian_var", "glare_fraction", "roi_fraction"}
+
+
+@pytest.mark.parametrize("damage, reason", [
+    (lambda img: np.full_like(img, 2), "too dark"),
+    (lambda img: np.full_like(img, 250), "too bright"),
+    (lambda img: cv2.GaussianBlur(img, (0, 0), 25), "blurred"),
+    (lambda img: np.concatenate([np.full_like(img[:, :400], 255), img[:, 400:]], axis=1), "glare/saturated"),
+])
+def test_bad_frames_are_rejected(eye, damage, reason):
+    passed, reasons, _ = check_quality(damage(eye))
+    assert not passed
+    assert any(r.startswith(reason) for r in reasons), reasons
+
+
+def test_overrides_and_disabled_checks(eye):
+    blurred = cv2.GaussianBlur(eye, (0, 0), 25)
+    assert check_quality(blurred, parse_thresholds("min_laplacian_var=none"))[0]
+    assert not check_quality(eye, parse_thresholds("min_brightness=200"))[0]
+    with pytest.raises(ValueError, match="Unknown quality thresholds"):
+        check_quality(eye, {"min_sharpness": 1.0})
+
+
+def test_batch_runner_skips_rejected_images(tmp_path, eye):
+    raw, out = tmp_path / "raw", tmp_path / "out"
+    raw.mkdir()
+    cv2.imwrite(str(raw / "good.png"), eye)
+    cv2.imwrite(str(raw / "dark.png"), np.full_like(eye, 2))
+    report = tmp_path / "gate.csv"
+
+    ok, fail = run_batch("p1", raw_dir=str(raw), out_dir=str(out), quality_gate={}, gate_report_path=str(report))
+    assert (ok, fail) == (1, 1)
+    assert [p.name for p in out.iterdir()] == ["good_processed_pipelinetest1.png"]
+    with open(report, newline="") as f:
+        rows = {row["image_name"]: row for row in csv.DictReader(f)}
+    assert rows["good.png"]["passed"] == "True"
+    assert rows["dark.png"]["passed"] == "False" and "too dark" in rows["dark.png"]["reasons"]
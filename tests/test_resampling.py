@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from resampling import effect_size_table
+
+
+def _sheet(values):
+    frames = [pd.DataFrame({"image_name": [f"img{i}" for i in range(len(v))], "pipeline": p,
+                            "metric": np.asarray(v, dtype=float)}) for p, v in values.items()]
+    return pd.concat(frames, ignore_index=True)
+
+
+@pytest.mark.parametrize("statistic", ["mean", "median", "dz"])
+def test_no_values_gives_no_p_value(statistic):
+    rng = np.random.default_rng(0)
+    base = rng.normal(10, 1, 30)
+    df = _sheet({"p0": base, "p1": base + 2 + rng.normal(0, 0.1, 30), "p2": np.full(30, np.nan)})
+    table = effect_size_table(df, ["metric"], statistic=statistic, n_boot=200, n_perm=200).set_index("pipeline")
+    assert table.at["p2", "n_images"] == 0
+    assert table.loc["p2", ["effect", "ci_low", "ci_high", "p_perm"]].isna().all()
+    # The real effect is still tested
+    assert table.at["p1", "p_perm"] == pytest.approx(1 / 201)
+    assert table.at["p1", "ci_low"] > 0
+
+
+def test_dz_of_constant_differences_gives_no_p_value():
+    base = np.random.default_rng(1).normal(10, 1, 30)
+    df = _sheet({"p0": base, "p1": base.copy()})
+    row = effect_size_table(df, ["metric"], statistic="dz", n_boot=200, n_perm=200).iloc[0]
+    assert row["n_images"] == 30
+    assert np.isnan(row["effect"])
+    assert np.isnan(row["ci_low"]) and np.isnan(row["ci_high"]) and np.isnan(row["p_perm"])
@@ -0,0 +1,80 @@
+import csv
+
+import cv2
+import numpy as np
+import pytest
+
+from roi_tracker import ROITracker, burst_order, track_sequence
+from synthetic_eye import synthesize_eye
+
+H, W = 600, 1150
+STEP = (4, 2)   # eye motion per frame, x and y
+
+
+@pytest.fixture(scope="module")
+def clip():
+    """20 frames of one synthetic eye drifting by STEP per frame, with a blink (black frame) at 10."""
+    base, truth = synthesize_eye(H, W, seed=3)
+    frames = []
+    for k in range(20):
+        shift = np.float32([[1, 0, STEP[0] * k], [0, 1, STEP[1] * k]])
+        frames.append(cv2.warpAffine(base, shift, (W, H), borderMode=cv2.BORDER_REPLICATE))
+    frames[10] = np.zeros_like(base)
+    return frames, truth
+
+
+@pytest.mark.parametrize("detector", ["contour", "hough"])
+def test_follows_the_moving_eye(clip, detector):
+    frames, truth = clip
+    tracker = ROITracker(detector, keyframe_interval=0)
+    first, mode, _ = tracker.update(frames[0])
+    assert mode == "detect"
+    for k in range(1, len(frames)):
+        box, mode, confidence = tracker.update(frames[k])
+        if k == 10:
+            # Blink: nothing to match or detect, the last ROI is held
+            assert mode == "hold"
+            continue
+        assert mode == "track" and confidence > 0.9
+        moved = np.array(box[:2]) - np.array(first[:2])
+        assert np.abs(moved - np.array(STEP) * k).max() <= 3, (k, moved)
+
+    if detector == "hough":
+        # The ROI is centred on the iris synthetic_eye drew
+        x1, y1, x2, y2 = box
+        cx, cy = truth["center"]
+        k = len(frames) - 1
+        assert np.hypot((x1 + x2) / 2 - cx - STEP[0] * k, (y1 + y2) / 2 - cy - STEP[1] * k) \
+            < 0.1 * truth["iris_radius"]
+
+
+def test_keyframe_interval_redetects(clip):
+    frames, _ = clip
+    tracker = ROITracker("contour", keyframe_interval=5)
+    modes = [tracker.update(f)[1] for f in frames[:10]]
+    assert modes == ["detect", "track", "track", "track", "track", "detect", "track", "track", "track", "track"]
+
+
+def test_track_sequence_on_video(clip, tmp_path):
+    frames, _ = clip
+    video = str(tmp_path / "T0018_BL.avi")
+    writer = cv2.VideoWriter(video, cv2.VideoWriter_fourcc(*"MJPG"), 10.0, (W, H))
+    assert writer.isOpened()
+    for f in frames:
+        writer.write(f)
+    writer.release()
+
+    log_path, out = str(tmp_path / "roi.csv"), tmp_path / "crops"
+    assert track_sequence(video, str(out), "contour", log_path=log_path, keyframe_interval=0) == (20, 0)
+    with open(log_path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [r["mode"] for r in rows] == ["detect"] + ["track"] * 9 + ["hold"] + ["track"] * 9
+    assert {r["sequence"] for r in rows} == {"T0018_BL"}
+    crops = sorted(out.iterdir())
+    assert len(crops) == 20 and crops[0].name == "T0018_BL_000000_roi_tracked.jpg"
+    assert cv2.imread(str(crops[0])).shape == (600, 600, 3)
+
+
+def test_burst_order():
+    names = ["T1_BL (10).JPG", "T1_BL (2).JPG", "T0_BL.JPG", "T1_BL (1).JPG"]
+    assert sorted(names, key=burst_order) == ["T0_BL.JPG", "T1_BL (1).JPG", "T1_BL (2).JPG", "T1_BL (10).JPG"]
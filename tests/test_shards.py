@@ -0,0 +1,108 @@
+import csv
+import multiprocessing as mp
+import os
+import sqlite3
+import time
+
+import cv2
+import pytest
+
+from pipelines import output_name
+from shards import ShardCoordinator, main, merge_metrics, read_manifest, run_dir_of, shard_of, work
+from synthetic_eye import synthesize_eye
+
+
+def _init_run(tmp_path, n_images=10, num_shards=4):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    for seed in range(n_images):
+        img, _ = synthesize_eye(120, 230, seed=seed)
+        cv2.imwrite(str(raw / f"eye_{seed:02d}.png"), img)
+    db = str(tmp_path / "run" / "coord.sqlite")
+    main(["init", "--db", db, "--raw", str(raw), "--out", str(tmp_path / "out"), "--pipeline", "p1",
+          "--num-shards", str(num_shards)])
+    return db
+
+
+def test_local_workers_complete_every_shard_once(tmp_path):
+    db = _init_run(tmp_path)
+    ctx = mp.get_context("spawn")
+    procs = [ctx.Process(target=work, args=(db, f"node{i}")) for i in range(3)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(120)
+        assert p.exitcode == 0
+
+    with sqlite3.connect(db) as conn:
+        rows = conn.execute("SELECT shard, status, attempts FROM shards ORDER BY shard").fetchall()
+    assert rows == [(s, "done", 1) for s in range(4)]
+    assert ShardCoordinator(db).status()["images_ok"] == 10
+    assert not [f for f in os.listdir(os.path.join(run_dir_of(db), "metrics")) if f.endswith(".tmp")]
+
+    # Merged rows: every image once, shard by shard, manifest order within a shard
+    files = read_manifest(ShardCoordinator(db).config()["manifest"])
+    expected = [output_name(f, "p1") for s in range(4) for f in files if shard_of(f, 4) == s]
+    out_path, n_rows = merge_metrics(run_dir_of(db))
+    with open(out_path, newline="") as f:
+        merged = [row["image_name"] for row in csv.DictReader(f)]
+    assert n_rows == 10
+    assert merged == expected
+
+
+def test_expired_lease_is_reclaimed_and_stale_worker_refused(tmp_path):
+    db = str(tmp_path / "coord.sqlite")
+    coord = ShardCoordinator(db, lease_seconds=60)
+    coord.init(2, {"num_shards": 2})
+
+    assert coord.claim("a") == 0
+    assert coord.claim("b") == 1
+    assert coord.claim("c") is None
+
+    # Worker a stops heartbeating: its lease runs out and shard 0 goes to c
+    with sqlite3.connect(db) as conn:
+        conn.execute("UPDATE shards SET heartbeat = ? WHERE shard = 0", (time.time() - 120,))
+    assert coord.claim("c") == 0
+
+    published = []
+    assert not coord.complete(0, "a", 5, 0, lambda: published.append("a"))
+    assert coord.complete(0, "c", 4, 1, lambda: published.append("c"))
+    assert published == ["c"]
+    # A refused worker can't complete a shard that is already done either
+    assert not coord.complete(0, "a", 5, 0)
+
+    with sqlite3.connect(db) as conn:
+        row = conn.execute("SELECT status, worker, attempts, ok, fail FROM shards WHERE shard = 0").fetchone()
+    assert row == ("done", "c", 2, 4, 1)
+
+
+def test_merge_metrics_in_shard_order(tmp_path):
+    os.makedirs(tmp_path / "metrics")
+    for shard in (10, 2, 7):
+        with open(tmp_path / "metrics" / f"shard-{shard:05d}.csv", "w", newline="") as f:
+            f.write("image_name,pipeline\n")
+            f.writelines(f"img{shard}_{i}.png,p1\n" for i in range(2))
+    # Unpublished partitions are not merged
+    (tmp_path / "metrics" / "shard-00003.csv.node-1.tmp").write_text("image_name,pipeline\nstale.png,p1\n")
+
+    out_path, n_rows = merge_metrics(str(tmp_path))
+    with open(out_path, newline="") as f:
+        merged = [row["image_name"] for row in csv.DictReader(f)]
+    assert n_rows == 6
+    assert merged == ["img2_0.png", "img2_1.png", "img7_0.png", "img7_1.png", "img10_0.png", "img10_1.png"]
+
+
+def test_reinit_with_other_config_is_refused(tmp_path, capsys):
+    db = _init_run(tmp_path, n_images=3, num_shards=4)
+    raw, out = str(tmp_path / "raw"), str(tmp_path / "out")
+
+    main(["init", "--db", db, "--raw", raw, "--out", out, "--pipeline", "p1", "--num-shards", "4"])
+    assert "kept" in capsys.readouterr().out
+
+    with pytest.raises(SystemExit):
+        main(["init", "--db", db, "--raw", raw, "--out", out, "--pipeline", "p1", "--num-shards", "8"])
+    assert ShardCoordinator(db).config()["num_shards"] == 4
+
+    main(["init", "--db", db, "--raw", raw, "--out", out, "--pipeline", "p1", "--num-shards", "8", "--force"])
+    assert ShardCoordinator(db).config()["num_shards"] == 8
+    assert sum(ShardCoordinator(db).status()["shards"].values()) == 8
@@ -0,0 +1,54 @@
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import friedmanchisquare, wilcoxon
+from statsmodels.stats.multitest import multipletests
+
+from stats_engine import friedman_all_metrics
+
+
+def _sheet(n_images, seed=0):
+    rng = np.random.default_rng(seed)
+    pipelines = ["p0", "p1", "p2", "p3"]
+    base = rng.normal(0, 1, n_images)
+    rows = []
+    for k, p in enumerate(pipelines):
+        rows.append(pd.DataFrame({
+            "image_name": [f"img{i:03d}" for i in range(n_images)],
+            "pipeline": p,
+            "smooth": base + 0.3 * k + rng.normal(0, 1, n_images),
+            # Heavy ties, and zero differences between pipelines
+            "tied": np.round(base + 0.2 * k + rng.normal(0, 1, n_images)),
+        }))
+    df = pd.concat(rows, ignore_index=True)
+    # Missing values drop an image from that metric only
+    df.loc[rng.choice(len(df), n_images // 5, replace=False), "smooth"] = np.nan
+    df.loc[rng.choice(len(df), n_images // 10, replace=False), "tied"] = np.nan
+    return df
+
+
+@pytest.mark.parametrize("n_images", [30, 120])   # scipy's exact path and the normal approximation
+def test_matches_scipy_and_statsmodels(n_images):
+    df = _sheet(n_images)
+    metrics = ["smooth", "tied"]
+    summary, posthoc = friedman_all_metrics(df, metrics)
+
+    for metric in metrics:
+        wide = df.pivot(index="image_name", columns="pipeline", values=metric).dropna()
+        row = summary.set_index("metric").loc[metric]
+        stat, p = friedmanchisquare(*[wide[c] for c in wide.columns])
+        assert row["friedman_chi2"] == pytest.approx(stat, rel=1e-10)
+        assert row["p_value"] == pytest.approx(p, rel=1e-8)
+        assert row["n_images"] == len(wide)
+
+        labels, raw = [], []
+        for a, b in combinations(wide.columns, 2):
+            labels.append(f"{a} vs {b}")
+            raw.append(wilcoxon(wide[a], wide[b]).pvalue)
+        reject, p_holm, _, _ = multipletests(raw, method="holm")
+        got = posthoc[metric].set_index("comparison").loc[labels]
+        assert np.allclose(got["p_raw"], raw, rtol=1e-8)
+        assert np.allclose(got["p_holm"], p_holm, rtol=1e-8)
+        assert list(got["significant"]) == list(reject)